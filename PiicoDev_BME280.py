@@ -7,6 +7,8 @@ import struct
 from uctypes import INT8
 from PiicoDev_Unified import *
 from micropython import const
+import ticks
+import bme280comp
 
 try:
     import typing  # pylint: disable=unused-import
@@ -65,7 +67,12 @@ class PiicoDev_BME280:
     def __init__(self, bus=None, freq=None, sda=None, scl=None, \
         temp_oversamp=_OVERSAMPLING_x1, pres_oversamp=_OVERSAMPLING_x1, \
             hum_oversamp=_OVERSAMPLING_x1, iir=_IIR_FILTER_OFF, \
-                address=_DEFAULT_I2C_ADDR):
+                address=_DEFAULT_I2C_ADDR, normal=False, standby=_STANDBY_125, i2c=None):
+        '''With normal=True the BME280 measures continuously, with standby
+           (a _STANDBY_* code) between measurements, and a read just fetches
+           the latest one. Otherwise each read starts a forced measurement.
+           i2c is a bus from create_unified_i2c() to share with other devices;
+           if None one is made from bus, freq, sda and scl.'''
         try:
             if compat_ind >= 1:
                 pass
@@ -75,7 +82,16 @@ class PiicoDev_BME280:
             print(compat_str)
 
         self.addr = address
-        self.i2c = create_unified_i2c(bus=bus, freq=freq, sda=sda, scl=scl)
+        # Preallocated I2C buffers, so that reading a sample allocates nothing
+        self._data = bytearray(8)
+        self._rbuf = bytearray(1)
+        self._wbuf = bytearray(1)
+        # Called with a message when a read fails. The owner can replace it to
+        # send the message somewhere other than the console.
+        self.on_error = print
+        if i2c is None:
+            i2c = create_unified_i2c(bus=bus, freq=freq, sda=sda, scl=scl)
+        self.i2c = i2c
 
         # Read the ID of the BME280. It should return 0x60
         try:
@@ -98,15 +114,21 @@ class PiicoDev_BME280:
         if self.iir_filter > _IIR_FILTER_16:
             self.iir_filter = _IIR_FILTER_16
 
-        self.sampling_mode = _DEV_FORCED
-        self.standby_time = _STANDBY_125 << 5 # A value between 0 and 7 which are the top 3 bits of config. 7 = 20ms
-        self._t_fine = 0
+        self.sampling_mode = _DEV_NORMAL if normal else _DEV_FORCED
+        self.standby_time = standby & 0x07 # A value between 0 and 7 which are the top 3 bits of config. 7 = 20ms
+        self._ready_at = None   # ticks_ms when a triggered conversion will be done
+        self._trigger_failed = False
 
-        # Configure the device.
+        # Configure the device. The config register must be written while it
+        # is asleep, before ctrl_meas starts normal mode.
         self._reset()
         self._read_coefficients()
-        self._set_data_acqn_options()
         self._set_dev_config()
+        self._set_data_acqn_options()
+        if self.sampling_mode == _DEV_NORMAL:
+            # The data registers hold reset values until the first
+            # measurement is done.
+            sleep_ms(int(self._calc_measurement_time_ms()) + 1)
         
     def _reset(self) -> None:
         """Soft reset the sensor"""
@@ -130,6 +152,9 @@ class PiicoDev_BME280:
         self._humidity_calib[3] = (coeff[2] << 4) | (coeff[3] & 0xF)
         self._humidity_calib[4] = (coeff[4] << 4) | (coeff[3] >> 4)
         self._humidity_calib[5] = coeff[5]
+        # Everything in the compensation that does not depend on the sample
+        self._calib = bme280comp.precompute(self._temp_calib, self._pressure_calib, \
+            self._humidity_calib)
         
     def _set_data_acqn_options(self) -> None:
         self._write8(_REG_CTRL_HUM, self.oversampling[_HUM])
@@ -150,19 +175,29 @@ class PiicoDev_BME280:
                             + 2.3 * (1 << self.oversampling[_HUM]) + 0.575
         return meas_time_ms
 
+    def conversion_ms(self) -> int:
+        '''Longest time a forced conversion can take, in whole ms. 0 in normal
+           mode, where there is always a measurement ready to read.'''
+        if self.sampling_mode == _DEV_NORMAL:
+            return 0
+        return int(self._calc_measurement_time_ms()) + 1
+
     def _is_dev_ready(self) -> bool:
         return bool((self._read8(_REG_STATUS) & 0x08))
 
     def _read8(self, reg) -> int:
-        t = self.i2c.readfrom_mem(self.addr, reg, 1)
-        return t[0]
+        b = self._rbuf
+        self.i2c.readfrom_mem_into(self.addr, reg, b)
+        return b[0]
 
     # def _read16(self, reg) -> int:
     #     t = self.i2c.readfrom_mem(self.addr, reg, 2)
     #     return t[0]+t[1]*256
 
     def _write8(self, reg: int, dat: int) -> None:
-        self.i2c.write8(self.addr, bytes([reg]), bytes([dat]))
+        b = self._wbuf
+        b[0] = dat
+        self.i2c.writeto_mem(self.addr, reg, b)
 
     # def _short(self, dat) -> int:
     #     if dat > 32767:
@@ -170,71 +205,81 @@ class PiicoDev_BME280:
     #     else:
     #         return dat
 
-    def read_raw_data(self):
-        '''Set data acquisition options and read the raw ADC values'''
-        self._set_data_acqn_options()
-        max_wait = self._calc_measurement_time_ms()
-        spins = 0
-        while not self._is_dev_ready():
-            spins += 1
-            sleep_ms(2)
-
-        data = self.i2c.readfrom_mem(self.addr, _REG_DATA_START, 8)
-        data = list(struct.unpack("<8B", bytes(data)))
-          
-        raw_p = ((data[0]<<16)|(data[1]<<8)|data[2])>>4
-        raw_t = ((data[3]<<16)|(data[4]<<8)|data[5])>>4
-        raw_h = (data[6] << 8)| data[7]
+    def trigger(self):
+        '''Start a forced conversion and return at once. Returns the ticks_ms
+           by which it will be done; then call collect(). Does nothing in
+           normal mode. If the sensor can't be reached the error goes to
+           on_error and the next collect() returns NaNs.'''
+        self._ready_at = ticks.ticks_add(ticks.ticks_ms(), self.conversion_ms())
+        try:
+            self._start()
+            self._trigger_failed = False
+        except:
+            self._trigger_failed = True
+            self.on_error(i2c_err_str.format(self.addr))
+        return self._ready_at
+
+    def collect(self):
+        '''Compensated data from the conversion started by trigger(), as
+           read_compensated_data(). If it is not done yet, sleeps until it is.'''
+        if self._ready_at is None:
+            self.trigger()
+        ready = self._ready_at
+        self._ready_at = None
+        if self._trigger_failed:
+            # Already reported by trigger()
+            self._trigger_failed = False
+            return (float('NaN'), float('NaN'), float('NaN'))
+        wait = ticks.ticks_diff(ready, ticks.ticks_ms())
+        if wait > 0:
+            sleep_ms(wait)
+        try:
+            self._fetch()
+        except:
+            return self._read_failed()
+        return self._compensate_data()
 
+    def read_raw_data(self):
+        '''Set data acquisition options and read the raw ADC values. In normal
+           mode this is a single read of the latest measurement.'''
+        self._measure()
+        d = self._data
+        raw_p = ((d[0]<<16)|(d[1]<<8)|d[2])>>4
+        raw_t = ((d[3]<<16)|(d[4]<<8)|d[5])>>4
+        raw_h = (d[6] << 8)| d[7]
         return (raw_t, raw_p, raw_h)
 
     def read_compensated_data(self):
         '''Read the raw data and apply the compensation factors'''
         try:
-            raw_t, raw_p, raw_h = self.read_raw_data()
+            self._measure()
         except:
-            print(i2c_err_str.format(self.addr))
-            return (float('NaN'), float('NaN'), float('NaN'))
-
-        # Temperature calculation
-        var1 = ((raw_t>>3)-(self._temp_calib[0]<<1))*(self._temp_calib[1]>>11)
-        var2 = (raw_t >> 4)-self._temp_calib[0]
-        var2 = var2*((raw_t>>4)-self._temp_calib[0])
-        var2 = ((var2>>12)*self._temp_calib[2])>>14
-        self._t_fine = var1+var2
-        temp = (self._t_fine*5+128)>>8
-
-        # Pressure calculation
-        var1 = self._t_fine-128000
-        var2 = var1*var1*self._pressure_calib[5]
-        var2 = var2 + ((var1*self._pressure_calib[4])<<17)
-        var2 = var2 + (self._pressure_calib[3]<<35)
-        var1 = (((var1*var1*self._pressure_calib[2])>>8) 
-                + ((var1*self._pressure_calib[1])<<12))
-        var1 = (((1<<47) + var1)*self._pressure_calib[0])>>33
-        if var1 == 0:
-            pres = 0
-        else:
-            p = ((((1048576-raw_p)<<31)-var2)*3125)//var1
-            var1 = (self._pressure_calib[8]*(p>>13)*(p>>13))>>25
-            var2 = (self._pressure_calib[7]*p)>>19
-            pres = ((p + var1 + var2)>>8) + (self._pressure_calib[6]<<4)
-
-        # Humidity calculation
-        h = self._t_fine-76800
-        h1 = ((((raw_h<<14) - (self._humidity_calib[3]<<20)
-                - (self._humidity_calib[4]*h)) + 16384)>>15)
-              
-        h2 = (((((((h*self._humidity_calib[5])>>10)
-                * (((h*self._humidity_calib[2])>>11) + 32768))>>10)
-                    + 2097152)*self._humidity_calib[1] + 8192)>>14)
-        h = (h1 * h2)
-        h = h - (((((h>>15)*(h>>15))>>7)*self._humidity_calib[0])>>4)
-        h = 0 if h < 0 else h
-        h = 419430400 if h>419430400 else h
-        humi = h>>12
-
-        return (temp, pres, humi)
+            return self._read_failed()
+        return self._compensate_data()
+
+    def _read_failed(self):
+        self.on_error(i2c_err_str.format(self.addr))
+        return (float('NaN'), float('NaN'), float('NaN'))
+
+    def _start(self):
+        # Start a forced conversion; raises if the sensor can't be reached.
+        if self.sampling_mode != _DEV_NORMAL:
+            self._set_data_acqn_options()
+
+    def _measure(self):
+        if self.sampling_mode != _DEV_NORMAL:
+            self._start()
+            sleep_ms(self.conversion_ms())
+        self._fetch()
+
+    def _fetch(self):
+        # One burst read of the data registers, into the preallocated buffer
+        self.i2c.readfrom_mem_into(self.addr, _REG_DATA_START, self._data)
+
+    def _compensate_data(self):
+        d = self._data
+        return bme280comp.compensate(self._calib, ((d[3]<<16)|(d[4]<<8)|d[5])>>4, \
+            ((d[0]<<16)|(d[1]<<8)|d[2])>>4, (d[6]<<8)|d[7])
 
     def values(self):
         '''Read the values from the BME280 and return the values in deg C, bars and %RH'''
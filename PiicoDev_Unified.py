@@ -29,6 +29,12 @@ class I2CBase:
     def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
         raise NotImplementedError("readfrom_mem")
 
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        # Copying fallback for builds without a native readfrom_mem_into
+        data = self.readfrom_mem(addr, memaddr, len(buf), addrsize=addrsize)
+        for i in range(len(buf)):
+            buf[i] = data[i]
+
     def write8(self, addr, buf, stop=True):
         raise NotImplementedError("write")
 
@@ -50,6 +56,7 @@ class I2CUnifiedMachine(I2CBase):
 
         self.writeto_mem = self.i2c.writeto_mem
         self.readfrom_mem = self.i2c.readfrom_mem
+        self.readfrom_mem_into = self.i2c.readfrom_mem_into
 
     def write8(self, addr, reg, data):
         if reg is None:
@@ -0,0 +1,78 @@
+# Adaptive sampling with per-channel deadbands.
+#
+# A record is only worth writing if one of its channels has moved by more
+# than that channel's deadband since the last record that was written, or if
+# heartbeat seconds have passed since then, so that a quiet log still shows
+# the logger was running.
+#
+# The sampling period follows the data: it is halved (down to min_period)
+# each time a sample is outside the deadband, and doubled (up to
+# max_period, the floor rate) each time one is inside it. So a steady day
+# is sampled and logged rarely, and a change is quickly picked up and
+# followed closely.
+#
+# Values are ints in whatever units the caller uses (for DataLogger the
+# read_compensated_data() units and mm); NO_VALUE stands for a missing one.
+
+from array import array
+
+NO_VALUE = -0x80000000
+
+
+class AdaptiveSampler():
+    def __init__(self, deadbands, min_period, max_period, heartbeat=600):
+        '''deadbands has one entry per channel. Periods are in ms, heartbeat
+           in seconds (0 for none). Sampling starts at min_period.'''
+        if not 0 < min_period <= max_period:
+            raise ValueError("need 0 < min_period <= max_period")
+        self.deadbands = array('l', deadbands)
+        self.min_period = min_period
+        self.max_period = max_period
+        self.heartbeat = heartbeat
+        self.period = min_period
+        self._last = array('l', [NO_VALUE] * len(deadbands))
+        self._t_last = None     # Time of the last record written
+
+        self.written = 0
+        self.skipped = 0
+
+    def changed(self, values):
+        '''True if any channel is outside its deadband around the last value
+           written. A value appearing or going missing counts as a change.'''
+        last = self._last
+        for i in range(len(last)):
+            v = values[i]
+            l = last[i]
+            if v == l:
+                continue
+            if v == NO_VALUE or l == NO_VALUE:
+                return True
+            if v - l > self.deadbands[i] or l - v > self.deadbands[i]:
+                return True
+        return False
+
+    def update(self, t, values):
+        '''Take a sample at time t (seconds). Returns True if it should be
+           written, and sets self.period for the next sample.'''
+        if self.changed(values):
+            write = True
+            if self.period > self.min_period:
+                self.period = max(self.period // 2, self.min_period)
+        else:
+            write = self._t_last is None or \
+                (self.heartbeat and t - self._t_last >= self.heartbeat)
+            if self.period < self.max_period:
+                self.period = min(self.period * 2, self.max_period)
+        if write:
+            last = self._last
+            for i in range(len(last)):
+                last[i] = values[i]
+            self._t_last = t
+            self.written += 1
+        else:
+            self.skipped += 1
+        return write
+
+    def stats_str(self):
+        return "{0} records written, {1} skipped, period now {2} ms".format( \
+            self.written, self.skipped, self.period)
@@ -0,0 +1,84 @@
+# Benchmark of BME280 compensation: the old per-call calculation from the
+# calibration lists against bme280comp.compensate() with precomputed
+# constants, and compensate_batch() (NumPy on a host that has it).
+# Runs on the Pico or on a host: import bench_bme280 (or python bench_bme280.py)
+
+import ticks
+import bme280comp
+
+_N = 2000
+
+_TEMP = [28485, 26735, 50]
+_PRES = [37614, -10529, 3024, 7049, -84, -7, 9900, -10230, 4285]
+_HUM = [75, 365, 0, 314, 50, 30]
+
+
+class _OldDriver():
+    '''read_compensated_data()'s maths as it was, on the driver's lists.'''
+    def __init__(self):
+        self._temp_calib = _TEMP
+        self._pressure_calib = _PRES
+        self._humidity_calib = _HUM
+
+    def compensate(self, raw_t, raw_p, raw_h):
+        var1 = ((raw_t>>3)-(self._temp_calib[0]<<1))*(self._temp_calib[1]>>11)
+        var2 = (raw_t >> 4)-self._temp_calib[0]
+        var2 = var2*((raw_t>>4)-self._temp_calib[0])
+        var2 = ((var2>>12)*self._temp_calib[2])>>14
+        self._t_fine = var1+var2
+        temp = (self._t_fine*5+128)>>8
+
+        var1 = self._t_fine-128000
+        var2 = var1*var1*self._pressure_calib[5]
+        var2 = var2 + ((var1*self._pressure_calib[4])<<17)
+        var2 = var2 + (self._pressure_calib[3]<<35)
+        var1 = (((var1*var1*self._pressure_calib[2])>>8)
+                + ((var1*self._pressure_calib[1])<<12))
+        var1 = (((1<<47) + var1)*self._pressure_calib[0])>>33
+        if var1 == 0:
+            pres = 0
+        else:
+            p = ((((1048576-raw_p)<<31)-var2)*3125)//var1
+            var1 = (self._pressure_calib[8]*(p>>13)*(p>>13))>>25
+            var2 = (self._pressure_calib[7]*p)>>19
+            pres = ((p + var1 + var2)>>8) + (self._pressure_calib[6]<<4)
+
+        h = self._t_fine-76800
+        h1 = ((((raw_h<<14) - (self._humidity_calib[3]<<20)
+                - (self._humidity_calib[4]*h)) + 16384)>>15)
+        h2 = (((((((h*self._humidity_calib[5])>>10)
+                * (((h*self._humidity_calib[2])>>11) + 32768))>>10)
+                    + 2097152)*self._humidity_calib[1] + 8192)>>14)
+        h = (h1 * h2)
+        h = h - (((((h>>15)*(h>>15))>>7)*self._humidity_calib[0])>>4)
+        h = 0 if h < 0 else h
+        h = 419430400 if h>419430400 else h
+        return (temp, pres, h>>12)
+
+
+def main():
+    raw_t = [500000 + 37 * i for i in range(_N)]
+    raw_p = [350000 + 11 * i for i in range(_N)]
+    raw_h = [30000 + 3 * i for i in range(_N)]
+    old = _OldDriver()
+    k = bme280comp.precompute(_TEMP, _PRES, _HUM)
+
+    t0 = ticks.ticks_us()
+    for i in range(_N):
+        old.compensate(raw_t[i], raw_p[i], raw_h[i])
+    t_old = ticks.ticks_diff(ticks.ticks_us(), t0)
+
+    t0 = ticks.ticks_us()
+    for i in range(_N):
+        bme280comp.compensate(k, raw_t[i], raw_p[i], raw_h[i])
+    t_new = ticks.ticks_diff(ticks.ticks_us(), t0)
+
+    t0 = ticks.ticks_us()
+    bme280comp.compensate_batch(k, raw_t, raw_p, raw_h)
+    t_batch = ticks.ticks_diff(ticks.ticks_us(), t0)
+
+    print("us/sample  old {0:.2f}  precomputed {1:.2f}  batch {2:.2f}".format( \
+        t_old / _N, t_new / _N, t_batch / _N))
+
+
+main()
@@ -0,0 +1,56 @@
+# Benchmark of the range filter update cost for various window sizes.
+# Runs on the Pico or on a host: import bench_filters (or python bench_filters.py)
+
+import ticks
+import filters
+
+_N = 2000
+
+
+def _samples(n):
+    # A slowly moving distance with the odd spike, generated without random
+    # so the same sequence is used on every platform.
+    out = []
+    x = 12345
+    for i in range(n):
+        x = (x * 1103515245 + 12345) & 0x7FFFFFFF
+        v = 1000 + (i % 200) + (x >> 24)
+        if i % 37 == 0:
+            v += 2000
+        out.append(v)
+    return out
+
+
+def _time_us(filt, samples):
+    t0 = ticks.ticks_us()
+    for x in samples:
+        filt.update(x)
+    return ticks.ticks_diff(ticks.ticks_us(), t0)
+
+
+class _SortFilter():
+    '''The obvious approach, for comparison: sort a copy of the window every time.'''
+    def __init__(self, window):
+        self.window = window
+        self.buf = []
+
+    def update(self, x):
+        self.buf.append(x)
+        if len(self.buf) > self.window:
+            self.buf.pop(0)
+        s = sorted(self.buf)
+        return s[len(s) // 2]
+
+
+def main():
+    samples = _samples(_N)
+    print("window  median us/update  outlier us/update  sort us/update")
+    for window in (3, 5, 9, 15, 31, 63):
+        t_med = _time_us(filters.MedianFilter(window), samples)
+        t_out = _time_us(filters.OutlierFilter(window), samples)
+        t_sort = _time_us(_SortFilter(window), samples)
+        print("{0:6d}  {1:17.2f}  {2:17.2f}  {3:14.2f}".format( \
+            window, t_med / _N, t_out / _N, t_sort / _N))
+
+
+main()
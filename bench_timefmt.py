@@ -0,0 +1,38 @@
+# Benchmark of log line timestamp formatting: mpy_utils.format_time() against
+# the cached recfmt.TimeStamp.
+# Runs on the Pico or on a host: import bench_timefmt (or python bench_timefmt.py)
+
+import time
+import ticks
+import recfmt
+
+try:
+    from mpy_utils import format_time
+except ImportError:
+    # mpy_utils needs rp2; this is the same function.
+    def format_time(t_tuple):
+        return "{0:4d}-{1:02d}-{2:02d} {3:02d}:{4:02d}:{5:02d}".format(*t_tuple)
+
+_N = 2000
+
+
+def _time_us(fn, times):
+    t0 = ticks.ticks_us()
+    for t in times:
+        fn(t)
+    return ticks.ticks_diff(ticks.ticks_us(), t0)
+
+
+def main():
+    t_start = int(time.time())
+    stamp = recfmt.TimeStamp()
+    print("calls/s  format_time us/call  TimeStamp us/call")
+    for rate in (1, 4, 20):
+        # rate calls per second of clock time
+        times = [t_start + i // rate for i in range(_N)]
+        t_fmt = _time_us(lambda t: format_time(time.localtime(t)), times)
+        t_stamp = _time_us(stamp.update, times)
+        print("{0:7d}  {1:19.2f}  {2:17.2f}".format(rate, t_fmt / _N, t_stamp / _N))
+
+
+main()
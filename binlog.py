@@ -0,0 +1,284 @@
+# Compact binary format for the data log.
+#
+# A binary data file starts with a header:
+#     magic 'PLOG', schema version, record size, epoch year of the timestamps
+# followed by fixed-size little-endian records:
+#     timestamp   uint32  seconds since the epoch
+#     ms          uint16  milliseconds of the timestamp, 0-999
+#     temp        int16   deg C * 100
+#     pres        uint32  Pa in Q24.8 fixed point (i.e. Pa * 256)
+#     hum         uint32  %RH in Q22.10 fixed point (i.e. %RH * 1024)
+#     dist        uint16  mean distance in mm, NO_DIST if there was none
+#     status      uint8   STATUS_* flags, and in the top 4 bits the number
+#                         of the sensor in a group (from 1), 0 for a lone one
+# Version 2 records add the spread of the distance samples in the interval:
+#     dist_n      uint16  number of valid distance samples
+#     dist_min    uint16  mm
+#     dist_max    uint16  mm
+#     dist_sd     uint16  standard deviation in 0.1 mm
+# Versions 3 and 4 are versions 1 and 2 with a frame on the end of each
+# record so that a record torn by a power cut can be detected:
+#     seq         uint16  record sequence number, wrapping
+#     crc         uint32  CRC32 of the rest of the record
+# The values are the integers returned by PiicoDev_BME280.read_compensated_data()
+# so the Pico does no float maths or formatting at all.
+#
+# The RecordPacker half runs on the Pico. The rest of the module is a
+# decoder for the host (CPython):
+#     python binlog.py data_2023-01-01.bin            -> text, as the text log
+#     python binlog.py --csv data_2023-01-01.bin      -> CSV
+
+import binascii
+import struct
+
+MAGIC = b'PLOG'
+VERSION = 1
+VERSION_STATS = 2
+VERSION_JOURNAL = 3
+VERSION_STATS_JOURNAL = 4
+
+HEADER_FMT = '<4sBBH'
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+RECORD_FMT = '<IHhIIHB'
+RECORD_SIZE = struct.calcsize(RECORD_FMT)
+STATS_RECORD_FMT = RECORD_FMT + 'HHHH'
+STATS_RECORD_SIZE = struct.calcsize(STATS_RECORD_FMT)
+FRAME_FMT = '<HI'
+FRAME_SIZE = struct.calcsize(FRAME_FMT)
+
+_RECORD_FMTS = {
+    VERSION: RECORD_FMT,
+    VERSION_STATS: STATS_RECORD_FMT,
+    VERSION_JOURNAL: RECORD_FMT + 'HI',
+    VERSION_STATS_JOURNAL: STATS_RECORD_FMT + 'HI',
+}
+
+NO_DIST = 0xFFFF
+
+# Status flags
+STATUS_ATMOS_FAIL = 0x01   # BME280 could not be read, atmos values are 0
+STATUS_NO_DIST = 0x02      # No valid distance samples in the interval
+STATUS_SENSOR_SHIFT = 4    # status >> this is the sensor number
+
+
+def header(epoch_year, stats=False, journal=False):
+    version = VERSION_STATS if stats else VERSION
+    if journal:
+        version += VERSION_JOURNAL - VERSION
+    fmt = _RECORD_FMTS[version]
+    return struct.pack(HEADER_FMT, MAGIC, version, struct.calcsize(fmt), epoch_year)
+
+
+def is_journal(version):
+    return version >= VERSION_JOURNAL
+
+
+def has_stats(version):
+    return (version - VERSION) % 2 == 1
+
+
+def check_record(version, data):
+    '''False if a journal record's CRC is wrong.'''
+    if not is_journal(version):
+        return True
+    n = len(data) - 4
+    return binascii.crc32(memoryview(data)[:n]) == struct.unpack_from('<I', data, n)[0]
+
+
+def record_seq(version, data):
+    '''Sequence number of a journal record.'''
+    return struct.unpack_from('<H', data, len(data) - FRAME_SIZE)[0]
+
+
+class RecordPacker():
+    '''Packs records into a single preallocated buffer. With stats=True the
+       records are version 2 and pack() needs the distance stats.IntStats. With
+       journal=True each record is framed with self.seq, which then counts up,
+       and a CRC.'''
+    def __init__(self, stats=False, journal=False):
+        self._stats = stats
+        self._journal = journal
+        self.size = STATS_RECORD_SIZE if stats else RECORD_SIZE
+        if journal:
+            self.size += FRAME_SIZE
+        self._buf = bytearray(self.size)
+        self.seq = 0
+
+    def pack(self, timestamp, temp, pres, hum, dist=None, status=0, dist_stats=None, ms=0):
+        '''Pack a record into the packer's own buffer and return the buffer.'''
+        self.pack_into(self._buf, 0, timestamp, temp, pres, hum, dist, status, dist_stats, ms)
+        return self._buf
+
+    def pack_into(self, buf, pos, timestamp, temp, pres, hum, dist=None, status=0, dist_stats=None, \
+            ms=0):
+        '''Pack a record into buf at pos (e.g. straight into a write-behind
+           buffer). ms is the sub-second part of timestamp. Returns the
+           position after it.'''
+        if dist is None:
+            dist = NO_DIST
+            status |= STATUS_NO_DIST
+        if self._stats:
+            if dist_stats is not None and dist_stats.count:
+                n = dist_stats.count
+                d_min = dist_stats.min
+                d_max = dist_stats.max
+                d_sd = dist_stats.std_scaled(10)
+            else:
+                n = d_min = d_max = d_sd = 0
+            struct.pack_into(STATS_RECORD_FMT, buf, pos, timestamp, ms, temp, pres, hum, \
+                dist, status, n, d_min, d_max, d_sd)
+        else:
+            struct.pack_into(RECORD_FMT, buf, pos, timestamp, ms, temp, pres, hum, dist, status)
+        end = pos + self.size
+        if self._journal:
+            struct.pack_into('<H', buf, end - FRAME_SIZE, self.seq)
+            self.seq = (self.seq + 1) & 0xFFFF
+            struct.pack_into('<I', buf, end - 4, binascii.crc32(memoryview(buf)[pos:end - 4]))
+        return end
+
+
+# ---- Host side decoder ----
+
+def read_header(f):
+    data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise ValueError("File too short for a data log header")
+    magic, version, rec_size, epoch_year = struct.unpack(HEADER_FMT, data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary data log")
+    fmt = _RECORD_FMTS.get(version)
+    if fmt is None or rec_size != struct.calcsize(fmt):
+        raise ValueError("Unsupported data log version {0} (record size {1})".format(version, rec_size))
+    return version, epoch_year
+
+
+def record_size(version):
+    return struct.calcsize(_RECORD_FMTS[version])
+
+
+def unpack_record(version, data):
+    '''Returns (timestamp, temp, pres, hum, dist_mm, status, dist_stats) for
+       a record, with the values as stored: the read_compensated_data()
+       integers, which are 0 if status has STATUS_ATMOS_FAIL. timestamp is in
+       seconds, a float with the ms. dist_mm is None when there was no valid
+       distance. dist_stats is (count, min, max, sd in 0.1 mm) for files with
+       stats, else None. to_units() converts one to floats.'''
+    fields = struct.unpack(_RECORD_FMTS[version], data)
+    t = fields[0] + fields[1] / 1000
+    temp, pres, hum, dist, status = fields[2:7]
+    dist_stats = fields[7:11] if has_stats(version) else None
+    if dist == NO_DIST:
+        dist = None
+    return t, temp, pres, hum, dist, status, dist_stats
+
+
+def to_units(rec):
+    '''An unpack_record() tuple in units: (timestamp, temp_C, pres_hPa,
+       hum_RH, dist_mm, status, dist_stats) with the sd in dist_stats in mm,
+       and NaNs for the atmos values if they could not be read.'''
+    t, temp, pres, hum, dist, status, dist_stats = rec
+    if status & STATUS_ATMOS_FAIL:
+        temp_C = pres_hPa = hum_RH = float('nan')
+    else:
+        temp_C = temp / 100
+        pres_hPa = pres / 25600
+        hum_RH = hum / 1024
+    if dist_stats is not None:
+        dist_stats = dist_stats[:3] + (dist_stats[3] / 10,)
+    return t, temp_C, pres_hPa, hum_RH, dist, status, dist_stats
+
+
+def read_records(f):
+    '''Yields unpack_record() for each record in the file, skipping journal
+       records that fail their CRC.'''
+    version, epoch_year = read_header(f)
+    rec_size = record_size(version)
+    while True:
+        data = f.read(rec_size)
+        if len(data) < rec_size:
+            break
+        if check_record(version, data):
+            yield unpack_record(version, data)
+
+
+def epoch_offset(epoch_year):
+    '''Seconds to add to a device timestamp to get a Unix timestamp.
+       The Pico has no time zone, so the result is in the RTC's local time and
+       is converted back with time.gmtime().'''
+    import calendar
+    return calendar.timegm((epoch_year, 1, 1, 0, 0, 0))
+
+
+def format_time(t, offset=0):
+    ''''YYYY-MM-DD HH:MM:SS' for a record timestamp, with '.mmm' on the end if
+       it has ms (is a float), as in the text data log.'''
+    import time
+    s = int(t)
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(s + offset))
+    if isinstance(t, float):
+        stamp += ".{0:03d}".format(int(round((t - s) * 1000)))
+    return stamp
+
+
+def format_text(rec, offset=0):
+    '''Formats an unpack_record() tuple the same way as the text data log,
+       rounding the integer values in the same way.'''
+    import recfmt
+    t, temp, pres, hum, dist, status, dist_stats = rec
+    buf = bytearray(recfmt.MAX_LINE)
+    pos = recfmt.put_values(buf, 0, temp, pres, hum, not status & STATUS_ATMOS_FAIL, dist)
+    if dist_stats is not None:
+        pos = recfmt.put_dist_stats(buf, pos, *dist_stats)
+    sensor = status >> STATUS_SENSOR_SHIFT
+    if sensor:
+        pos = recfmt.put_sensor(buf, pos, sensor)
+    return format_time(t, offset) + "| " + bytes(buf[:pos]).decode()
+
+
+def format_csv(rec, offset=0):
+    t, temp_C, pres_hPa, hum_RH, dist, status, dist_stats = to_units(rec)
+    if dist_stats is None:
+        stats_str = ",,,"
+    else:
+        stats_str = "{0},{1},{2},{3:.1f}".format(*dist_stats)
+    sensor = status >> STATUS_SENSOR_SHIFT
+    status &= (1 << STATUS_SENSOR_SHIFT) - 1
+    return "{0},{1:.2f},{2:.2f},{3:.3f},{4},{5},{6},{7}".format( \
+        format_time(t, offset), temp_C, pres_hPa, hum_RH, "" if dist is None else dist, status, stats_str, \
+        sensor if sensor else "")
+
+CSV_HEADER = "time,temp_C,pres_hPa,hum_RH,dist_mm,status,dist_n,dist_min_mm,dist_max_mm,dist_sd_mm,sensor"
+
+
+def decode(in_f, out_f, csv=False):
+    version, epoch_year = read_header(in_f)
+    in_f.seek(0)
+    offset = epoch_offset(epoch_year)
+    if csv:
+        out_f.write(CSV_HEADER + '\n')
+        fmt = format_csv
+    else:
+        fmt = format_text
+    for rec in read_records(in_f):
+        out_f.write(fmt(rec, offset) + '\n')
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Decode a binary data log to text or CSV")
+    parser.add_argument('file', help="binary data log file")
+    parser.add_argument('--csv', action='store_true', help="write CSV instead of the text log layout")
+    parser.add_argument('-o', '--output', help="output file (default stdout)")
+    args = parser.parse_args(argv)
+
+    with open(args.file, 'rb') as in_f:
+        if args.output:
+            with open(args.output, 'w') as out_f:
+                decode(in_f, out_f, args.csv)
+        else:
+            decode(in_f, sys.stdout, args.csv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# BME280 compensation from precomputed calibration constants.
+#
+# precompute() works out every term of the compensation formulas that does
+# not depend on the sample once, when the calibration is read, and
+# compensate() then only does the per-sample maths with the constants in
+# locals. The results are bit for bit those of the formulas that were in
+# PiicoDev_BME280.read_compensated_data() (including its temperature term,
+# which multiplies by dig_T2 >> 11 where the datasheet shifts the product).
+#
+# compensate_batch() does the same for whole arrays of raw samples, on the
+# host with NumPy (int64, vectorised) if it is installed, else one by one.
+#
+# The calibration lists are as read by PiicoDev_BME280._read_coefficients():
+#     temp_calib  [T1, T2, T3]
+#     pres_calib  [P1, ... P9]
+#     hum_calib   [H1, ... H6]
+
+from array import array
+
+
+def precompute(temp_calib, pres_calib, hum_calib):
+    '''The constants for compensate(), as a tuple.'''
+    t1, t2, t3 = temp_calib
+    p1, p2, p3, p4, p5, p6, p7, p8, p9 = pres_calib
+    h1, h2, h3, h4, h5, h6 = hum_calib
+    return (t1 << 1, t2 >> 11, t1, t3,
+        p6, p5 << 17, p4 << 35, p3, p2 << 12, p1, p9, p8, p7 << 4,
+        h4 << 20, h5, h6, h3, h2, h1)
+
+
+def compensate(k, raw_t, raw_p, raw_h):
+    '''(temp C*100, pres Pa*256, hum %RH*1024) from raw ADC values, as
+       read_compensated_data() returns them.'''
+    t1x2, t2s, t1, t3, \
+        p6, p5s, p4s, p3, p2s, p1, p9, p8, p7s, \
+        h4s, h5, h6, h3, h2, h1 = k
+
+    # Temperature
+    var1 = ((raw_t >> 3) - t1x2) * t2s
+    var2 = (raw_t >> 4) - t1
+    var2 = (((var2 * var2) >> 12) * t3) >> 14
+    t_fine = var1 + var2
+    temp = (t_fine * 5 + 128) >> 8
+
+    # Pressure
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * p6 + var1 * p5s + p4s
+    var1 = ((var1 * var1 * p3) >> 8) + var1 * p2s
+    var1 = (((1 << 47) + var1) * p1) >> 33
+    if var1 == 0:
+        pres = 0
+    else:
+        p = ((((1048576 - raw_p) << 31) - var2) * 3125) // var1
+        var1 = (p9 * (p >> 13) * (p >> 13)) >> 25
+        var2 = (p8 * p) >> 19
+        pres = ((p + var1 + var2) >> 8) + p7s
+
+    # Humidity
+    h = t_fine - 76800
+    h1_ = ((raw_h << 14) - h4s - h5 * h + 16384) >> 15
+    h2_ = ((((((h * h6) >> 10) * (((h * h3) >> 11) + 32768)) >> 10) + 2097152) * h2 + 8192) >> 14
+    h = h1_ * h2_
+    h = h - (((((h >> 15) * (h >> 15)) >> 7) * h1) >> 4)
+    if h < 0:
+        h = 0
+    elif h > 419430400:
+        h = 419430400
+    return (temp, pres, h >> 12)
+
+
+def compensate_batch(k, raw_t, raw_p, raw_h):
+    '''compensate() over sequences of raw values. Returns (temp, pres, hum)
+       as NumPy int64 arrays if NumPy is installed, else as array('l').'''
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        return _compensate_numpy(numpy, k, raw_t, raw_p, raw_h)
+    n = len(raw_t)
+    temp = array('l')
+    pres = array('l')
+    hum = array('l')
+    for i in range(n):
+        t, p, h = compensate(k, raw_t[i], raw_p[i], raw_h[i])
+        temp.append(t)
+        pres.append(p)
+        hum.append(h)
+    return temp, pres, hum
+
+
+def _compensate_numpy(np, k, raw_t, raw_p, raw_h):
+    # Every intermediate fits in int64, as in Bosch's 64 bit reference code.
+    t1x2, t2s, t1, t3, \
+        p6, p5s, p4s, p3, p2s, p1, p9, p8, p7s, \
+        h4s, h5, h6, h3, h2, h1 = [np.int64(c) for c in k]
+    raw_t = np.asarray(raw_t, dtype=np.int64)
+    raw_p = np.asarray(raw_p, dtype=np.int64)
+    raw_h = np.asarray(raw_h, dtype=np.int64)
+
+    var1 = ((raw_t >> 3) - t1x2) * t2s
+    var2 = (raw_t >> 4) - t1
+    var2 = (((var2 * var2) >> 12) * t3) >> 14
+    t_fine = var1 + var2
+    temp = (t_fine * 5 + 128) >> 8
+
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * p6 + var1 * p5s + p4s
+    var1 = ((var1 * var1 * p3) >> 8) + var1 * p2s
+    var1 = (((1 << 47) + var1) * p1) >> 33
+    zero = var1 == 0
+    p = ((((1048576 - raw_p) << 31) - var2) * 3125) // np.where(zero, 1, var1)
+    var1 = (p9 * (p >> 13) * (p >> 13)) >> 25
+    var2 = (p8 * p) >> 19
+    pres = np.where(zero, 0, ((p + var1 + var2) >> 8) + p7s)
+
+    h = t_fine - 76800
+    h1_ = ((raw_h << 14) - h4s - h5 * h + 16384) >> 15
+    h2_ = ((((((h * h6) >> 10) * (((h * h3) >> 11) + 32768)) >> 10) + 2097152) * h2 + 8192) >> 14
+    h = h1_ * h2_
+    h = h - (((((h >> 15) * (h >> 15)) >> 7) * h1) >> 4)
+    h = np.clip(h, 0, 419430400)
+    return temp, pres, h >> 12
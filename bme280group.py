@@ -0,0 +1,100 @@
+# Several BME280s read together.
+#
+# Each PiicoDev_BME280 read starts a forced conversion and then sleeps until
+# it is done, so reading N sensors one after another costs N conversion
+# times. A BME280Group starts a conversion on every sensor first, waits once
+# for the slowest of them, and then burst-reads each one in turn, so the
+# whole group costs about one conversion time.
+#
+# The group has trigger() / collect() / conversion_ms() methods like a single
+# sensor, but collect() returns a list of one (temp, pres, hum) tuple per
+# sensor, in the order the sensors were given, in read_compensated_data()
+# units. Given atmos_addresses, DataLogger uses a group as its atmos_sensor
+# and logs a record for each sensor, tagged with its number in the group from
+# 1. A sensor that could not be read gives NaNs and is reported, by the
+# sensor itself or, if its trigger() or collect() raises, through the group's
+# on_error, by the same number.
+#
+# BME280Group.create() makes the sensors on one shared I2C bus, e.g. for the
+# two addresses a BME280 can have:
+#     group = BME280Group.create((0x76, 0x77), iir=2)
+
+import ticks
+
+_NANS = (float('NaN'), float('NaN'), float('NaN'))
+err_str = "BME280 {} in group: {}"
+
+
+class BME280Group():
+    def __init__(self, sensors, clock=ticks):
+        self.sensors = list(sensors)
+        self._clock = clock
+        self._ready_at = None   # ticks_ms when every triggered conversion will be done
+        self._values = [None] * len(self.sensors)
+        self._failed = bytearray(len(self.sensors))    # trigger() raised for that sensor
+        self.on_error = print
+
+    @classmethod
+    def create(cls, addresses, bus=None, freq=None, sda=None, scl=None, **options):
+        '''A group of PiicoDev_BME280s at addresses, sharing one I2C bus.
+           options are passed on to each PiicoDev_BME280.'''
+        from PiicoDev_BME280 import PiicoDev_BME280
+        from PiicoDev_Unified import create_unified_i2c
+        i2c = create_unified_i2c(bus=bus, freq=freq, sda=sda, scl=scl)
+        return cls([PiicoDev_BME280(address=a, i2c=i2c, **options) for a in addresses])
+
+    def conversion_ms(self):
+        '''Longest conversion time of any sensor in the group, in ms.'''
+        ms = 0
+        for s in self.sensors:
+            c = s.conversion_ms()
+            if c > ms:
+                ms = c
+        return ms
+
+    def trigger(self):
+        '''Start a conversion on every sensor. Returns the ticks_ms by which
+           they will all be done; then call collect().'''
+        ready = None
+        for i in range(len(self.sensors)):
+            try:
+                r = self.sensors[i].trigger()
+            except Exception as e:
+                self._failed[i] = 1
+                self.on_error(err_str.format(i + 1, e))
+                continue
+            self._failed[i] = 0
+            if ready is None or self._clock.ticks_diff(r, ready) > 0:
+                ready = r
+        if ready is None:
+            ready = self._clock.ticks_ms()      # No sensor to wait for
+        self._ready_at = ready
+        return ready
+
+    def collect(self):
+        '''Compensated data from every sensor, as a list of (temp, pres, hum).
+           Sleeps once, if the conversions are not all done yet. The list is
+           reused by the next call.'''
+        if self._ready_at is None:
+            self.trigger()
+        wait = self._clock.ticks_diff(self._ready_at, self._clock.ticks_ms())
+        if wait > 0:
+            self._clock.sleep_ms(wait)
+        self._ready_at = None
+        values = self._values
+        for i in range(len(self.sensors)):
+            if self._failed[i]:
+                self._failed[i] = 0
+                values[i] = _NANS
+                continue
+            try:
+                values[i] = self.sensors[i].collect()
+            except Exception as e:
+                self.on_error(err_str.format(i + 1, e))
+                values[i] = _NANS
+        return values
+
+    def read_compensated_data(self):
+        '''Trigger and collect in one call.'''
+        self.trigger()
+        return self.collect()
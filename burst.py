@@ -0,0 +1,162 @@
+# Pre/post trigger burst capture of distance samples.
+#
+# BurstCapture keeps the last pre + 1 + post samples (ticks_ms and mm) in a
+# preallocated ring. When a sample fires the trigger (a step of at least
+# max_step mm from the last valid sample, or a crossing of threshold mm) it
+# carries on for post more samples, so that the ring then holds pre samples
+# before the trigger, the trigger sample and post samples after it. The burst
+# is then rendered into a preallocated buffer for the caller to write to the
+# burst file in one go, and capture starts again.
+#
+# A burst file is a sequence of bursts, each:
+#     header  magic 'BRST', epoch year, trigger time (uint32, seconds since
+#             the epoch), its ms (uint16), sample count (uint16), index of
+#             the trigger sample (uint16)
+#     samples ms relative to the trigger sample (int32), distance mm
+#             (uint16, NO_DIST if the sample was not valid)
+#
+# On the host:
+#     python burst.py burst_2023-01-01.bin     -> CSV of burst,time,ms,dist_mm
+
+from array import array
+import struct
+import time
+import ticks
+
+MAGIC = b'BRST'
+HEADER_FMT = '<4sHIHHH'
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+SAMPLE_FMT = '<iH'
+SAMPLE_SIZE = struct.calcsize(SAMPLE_FMT)
+NO_DIST = 0xFFFF
+
+
+class BurstCapture():
+    def __init__(self, pre=100, post=100, max_step=0, threshold=None):
+        '''A limit of 0 (or None for threshold) disables that trigger.'''
+        self.pre = pre
+        self.post = post
+        self.max_step = max_step
+        self.threshold = threshold
+        n = pre + 1 + post
+        self.size = n
+        self._t = array('l', [0] * n)
+        self._d = array('H', [0] * n)
+        self._pos = 0           # Next slot to fill
+        self._count = 0         # Samples in the ring, up to size
+        self._last = None       # Last valid distance
+        self._after = -1        # Samples still wanted after the trigger, -1 when armed
+        self._t_trig = 0        # ticks_ms of the trigger sample
+        self.time = 0           # Time of the trigger, seconds since the epoch...
+        self.ms = 0             # ... and its ms
+
+        self.buf = bytearray(HEADER_SIZE + n * SAMPLE_SIZE)
+        self._epoch_year = time.gmtime(0)[0]
+        self.bursts = 0
+
+    def _fires(self, d):
+        last = self._last
+        if last is None:
+            return False
+        if self.max_step and (d - last >= self.max_step or last - d >= self.max_step):
+            return True
+        th = self.threshold
+        return th is not None and ((last < th) != (d < th))
+
+    def add(self, t_ms, dist, t=0, ms=0):
+        '''Add a sample taken at ticks_ms t_ms; dist is in mm, or None if the
+           reading was not valid. t (seconds since the epoch) and ms are the
+           time to record for the burst if this sample triggers one. Returns
+           True when a burst is complete and render() should be called.'''
+        pos = self._pos
+        self._t[pos] = t_ms
+        self._d[pos] = NO_DIST if dist is None else dist
+        pos += 1
+        if pos == self.size:
+            pos = 0
+        self._pos = pos
+        if self._count < self.size:
+            self._count += 1
+
+        if dist is not None:
+            if self._after < 0 and self._fires(dist):
+                self._after = self.post
+                self._t_trig = t_ms
+                self.time = t
+                self.ms = ms
+            self._last = dist
+        if self._after < 0:
+            return False
+        if self._after > 0:
+            self._after -= 1
+            return False
+        return True
+
+    def render(self):
+        '''Render the completed burst into self.buf and re-arm. Returns the
+           number of bytes to write.'''
+        n = self._count
+        start = self._pos - n
+        if start < 0:
+            start += self.size
+        buf = self.buf
+        struct.pack_into(HEADER_FMT, buf, 0, MAGIC, self._epoch_year, self.time, self.ms, \
+            n, n - 1 - self.post)
+        off = HEADER_SIZE
+        i = start
+        for k in range(n):
+            struct.pack_into(SAMPLE_FMT, buf, off, \
+                ticks.ticks_diff(self._t[i], self._t_trig), self._d[i])
+            off += SAMPLE_SIZE
+            i += 1
+            if i == self.size:
+                i = 0
+        self._after = -1
+        self.bursts += 1
+        return off
+
+
+# ---- Host side decoder ----
+
+def read_bursts(f):
+    '''Yields (time, trigger index, [(ms, dist_mm or None), ...]) for each
+       burst, with time as a Unix timestamp in the logger's local time, a
+       float with the ms.'''
+    import binlog
+    while True:
+        data = f.read(HEADER_SIZE)
+        if len(data) < HEADER_SIZE:
+            break
+        magic, epoch_year, t, ms, n, trig = struct.unpack(HEADER_FMT, data)
+        if magic != MAGIC:
+            raise ValueError("Not a burst file")
+        t += ms / 1000
+        data = f.read(n * SAMPLE_SIZE)
+        if len(data) < n * SAMPLE_SIZE:
+            break
+        samples = []
+        for i in range(n):
+            ms, d = struct.unpack_from(SAMPLE_FMT, data, i * SAMPLE_SIZE)
+            samples.append((ms, None if d == NO_DIST else d))
+        yield t + binlog.epoch_offset(epoch_year), trig, samples
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    import binlog
+    parser = argparse.ArgumentParser(description="Decode a burst file to CSV")
+    parser.add_argument('file', help="burst file")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout
+    out.write("burst,time,ms,dist_mm\n")
+    with open(args.file, 'rb') as f:
+        for i, (t, trig, samples) in enumerate(read_bursts(f)):
+            stamp = binlog.format_time(t)
+            for ms, d in samples:
+                out.write("{0},{1},{2},{3}\n".format(i, stamp, ms, "" if d is None else d))
+
+
+if __name__ == '__main__':
+    main()
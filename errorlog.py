@@ -0,0 +1,130 @@
+# Deduplicating, rate limited error log.
+#
+# A sensor that keeps failing would otherwise put the same line in the error
+# log on every read, each with its own SD write and flush. ErrorLog:
+#   - counts a message that is the same as the last one instead of writing
+#     it, and writes "last message repeated N times" when a different message
+#     comes along or summary_ms after the first repeat;
+#   - writes to the card at most burst times in a row, then at most once per
+#     min_interval_ms (a token bucket). Lines waiting for their turn are kept
+#     in a RAM buffer and written together by poll(). If that fills up, lines
+#     are dropped and the number dropped is logged later.
+#
+# next_due() says when poll() next has something to do, so that it only
+# needs to be run then rather than on a fixed period.
+#
+# format_line(s) turns a message into the bytes of a line (e.g. adding a
+# timestamp); it is called when the message is logged, so lines keep their
+# own times even if they are written later.
+
+import logbuf
+import ticks
+
+
+class ErrorLog():
+    def __init__(self, f, format_line, buf_size=1024, burst=5, min_interval_ms=2000, \
+            summary_ms=60000, clock=ticks):
+        self._log = logbuf.WriteBehindLog(f, buf_size=buf_size, max_age_ms=0, clock=clock)
+        self._log.auto_flush = False
+        self._format = format_line
+        self._clock = clock
+        self.burst = burst
+        self.min_interval_ms = min_interval_ms
+        self.summary_ms = summary_ms
+
+        self._tokens = burst
+        self._t_token = clock.ticks_ms()    # When the last token was added
+        self._last = None       # Last message logged
+        self._repeats = 0       # Times it has been repeated since it was last written
+        self._t_repeat = 0      # ticks_ms of the first of those repeats
+
+        self.lines = 0
+        self.suppressed = 0
+        self.dropped = 0
+        self._dropped = 0       # Dropped since last reported
+
+    def log(self, s):
+        '''Log a message. Returns True if it was written to the file straight away.'''
+        if s == self._last:
+            if self._repeats == 0:
+                self._t_repeat = self._clock.ticks_ms()
+            self._repeats += 1
+            self.suppressed += 1
+            self.poll()
+            return False
+        self._summarise()
+        self._last = s
+        self._add(s)
+        return self._write()
+
+    def poll(self):
+        '''Write out anything waiting if the rate limit allows, and a summary
+           of repeats if they have been going on for summary_ms.'''
+        if self._repeats and self._clock.ticks_diff(self._clock.ticks_ms(), self._t_repeat) >= self.summary_ms:
+            self._summarise()
+        if self._log.pending():
+            self._write()
+
+    def next_due(self):
+        '''ms until poll() next has something to do (0 or less if it has
+           now), or None if nothing is waiting.'''
+        clock = self._clock
+        now = clock.ticks_ms()
+        due = None
+        if self._repeats:
+            due = self.summary_ms - clock.ticks_diff(now, self._t_repeat)
+        if self._log.pending():
+            if self._tokens:
+                wait = 0
+            else:
+                wait = self.min_interval_ms - clock.ticks_diff(now, self._t_token)
+            if due is None or wait < due:
+                due = wait
+        return due
+
+    def flush(self):
+        '''Write everything out now, ignoring the rate limit.'''
+        self._summarise()
+        self._log.flush()
+
+    def close(self):
+        self.flush()
+        self._log.close()
+
+    def _summarise(self):
+        if self._repeats:
+            self._add(" - (last message repeated {0} times)".format(self._repeats))
+            self._repeats = 0
+        if self._dropped:
+            n = self._dropped
+            if self._add("?? {0} error log line(s) dropped".format(n), False):
+                self._dropped -= n
+
+    def _add(self, s, count=True):
+        line = self._format(s)
+        n = len(line)
+        log = self._log
+        if log.pending() + n > log.capacity and not (self._write() and n <= log.capacity):
+            if count:
+                self.dropped += 1
+                self._dropped += 1
+            return False
+        log.write(line)
+        self.lines += 1
+        return True
+
+    def _write(self):
+        clock = self._clock
+        now = clock.ticks_ms()
+        if self._tokens < self.burst:
+            earned = clock.ticks_diff(now, self._t_token) // self.min_interval_ms
+            if earned:
+                self._tokens = min(self._tokens + earned, self.burst)
+                self._t_token = clock.ticks_add(self._t_token, earned * self.min_interval_ms)
+        else:
+            self._t_token = now
+        if self._tokens == 0:
+            return False
+        self._tokens -= 1
+        self._log.flush()
+        return True
@@ -0,0 +1,126 @@
+# Filters for the VL53L1X range readings.
+#
+# MedianFilter keeps a sliding window of the last N samples in two
+# preallocated arrays: a ring in arrival order and a copy kept in sorted
+# order. An update finds the outgoing sample with a binary search and slides
+# only the entries between it and the new sample's place. That is O(log n)
+# compares, but the slide is O(n) in the worst case (a sample replacing one
+# at the other end of the sorted order), so an update is O(window), not
+# O(log n). For the windows used here (tens of samples) a tree or skip list
+# with O(log n) updates would cost more, and would allocate on every update.
+#
+# OutlierFilter uses the running median to drop spikes: a sample further than
+# max_dev (or rel_dev * median) from the median of the window is rejected.
+#
+# Both have update(x), which returns the value to use or None, so either can
+# be given to DataLogger as its range_filter.
+
+from array import array
+
+
+class MedianFilter():
+    def __init__(self, window):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = window
+        self._ring = array('l', [0] * window)
+        self._sorted = array('l', [0] * window)
+        self._n = 0         # Samples in the window
+        self._pos = 0       # Next ring slot to overwrite
+
+    def reset(self):
+        self._n = 0
+        self._pos = 0
+
+    def _find(self, x, hi):
+        '''Index of the first sorted entry >= x, searching [0, hi).'''
+        s = self._sorted
+        lo = 0
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if s[mid] < x:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def add(self, x):
+        '''Add x to the window, dropping the oldest sample once it is full.
+           O(window) in the worst case, see above.'''
+        s = self._sorted
+        n = self._n
+        if n < self.window:
+            # Still filling - insert x in order.
+            i = self._find(x, n)
+            j = n
+            while j > i:
+                s[j] = s[j - 1]
+                j -= 1
+            s[i] = x
+            self._n = n + 1
+        else:
+            # Replace the oldest sample with x, sliding the entries between.
+            i = self._find(self._ring[self._pos], n)
+            if x > s[i]:
+                while i + 1 < n and s[i + 1] < x:
+                    s[i] = s[i + 1]
+                    i += 1
+            else:
+                while i > 0 and s[i - 1] > x:
+                    s[i] = s[i - 1]
+                    i -= 1
+            s[i] = x
+        self._ring[self._pos] = x
+        self._pos += 1
+        if self._pos == self.window:
+            self._pos = 0
+
+    def count(self):
+        return self._n
+
+    def median(self):
+        '''Median of the window (the mean of the middle two for an even count).
+           None if the window is empty.'''
+        n = self._n
+        if n == 0:
+            return None
+        if n & 1:
+            return self._sorted[n >> 1]
+        return (self._sorted[(n >> 1) - 1] + self._sorted[n >> 1]) // 2
+
+    def update(self, x):
+        self.add(x)
+        return self.median()
+
+
+class OutlierFilter():
+    def __init__(self, window=9, max_dev=100, rel_dev=0, min_samples=None):
+        '''max_dev is in the sample units (mm), rel_dev is a fraction of the
+           median. A sample is rejected when it is further from the median than
+           the larger of the two. Nothing is rejected until min_samples
+           (default half the window) have been seen.'''
+        self._median = MedianFilter(window)
+        self.max_dev = max_dev
+        self.rel_dev = rel_dev
+        self.min_samples = (window + 1) // 2 if min_samples is None else min_samples
+        self.accepted = 0
+        self.rejected = 0
+
+    def reset(self):
+        self._median.reset()
+
+    def update(self, x):
+        '''Returns x, or None if it is an outlier. Every sample goes into the
+           window, so a real step change is accepted once it fills half of it.'''
+        med = self._median.update(x)
+        if self._median.count() >= self.min_samples:
+            limit = self.max_dev
+            if self.rel_dev:
+                rel = int(self.rel_dev * med)
+                if rel > limit:
+                    limit = rel
+            if x - med > limit or med - x > limit:
+                self.rejected += 1
+                return None
+        self.accepted += 1
+        return x
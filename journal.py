@@ -0,0 +1,78 @@
+# Recovery of a data file after a power cut.
+#
+# A power cut in the middle of a write can leave a partial record at the end
+# of the data file. With journal=True every record carries a sequence number
+# and a CRC32 (binlog versions 3 and 4, or the ' #SSSSS CCCCCCCC' suffix on
+# text lines, see recfmt) so that it can be checked.
+#
+# recover() is run on the newest data file before it is appended to. It only
+# reads the last scan bytes of the file, so it takes the same time however
+# big the file is. Going back from the end it finds the last record with a
+# good CRC, and marks a torn tail so that it can't run into the records
+# written after it: a journal binary file is padded with 0xFF to the next
+# record boundary (that record then fails its CRC, and the ones after it stay
+# aligned) and a text file gets a newline. MicroPython's FAT driver can't
+# truncate a file, so nothing is removed.
+#
+# A binary file without the journal has no way to mark a padded record as
+# bad, so it is left as it is: the decoder stops at the partial record, and
+# the logger starts a new file rather than append to it.
+#
+# A binary file is only ever appended to with records of the size in its
+# header (the logger moves on to a new file otherwise), so that size is used
+# for the padding.
+
+import os
+import binlog
+import recfmt
+
+_SCAN = 4096    # bytes
+
+
+def recover(path, scan=_SCAN):
+    '''Check the end of a data file and mark a torn last record. Returns
+       (seq, torn): the sequence number of the last good journal record (None
+       if there isn't one in the last scan bytes) and the number of bytes of
+       the torn record, 0 if the file ended cleanly.'''
+    size = os.stat(path)[6]
+    if size == 0:
+        return None, 0
+    seq = None
+    with open(path, 'rb') as f:
+        if path.endswith('.bin'):
+            if size < binlog.HEADER_SIZE:
+                return None, 0
+            try:
+                version = binlog.read_header(f)[0]
+            except ValueError:
+                return None, 0      # Not a data log we can check
+            rec_size = binlog.record_size(version)
+            torn = (size - binlog.HEADER_SIZE) % rec_size
+            end = size - torn
+            if not binlog.is_journal(version):
+                return None, torn
+            n = min((end - binlog.HEADER_SIZE) // rec_size, scan // rec_size)
+            for i in range(1, n + 1):
+                f.seek(end - i * rec_size)
+                data = f.read(rec_size)
+                if binlog.check_record(version, data):
+                    seq = binlog.record_seq(version, data)
+                    break
+            mark = b'\xff' * (rec_size - torn)
+        else:
+            start = size - scan if size > scan else 0
+            f.seek(start)
+            data = f.read()
+            torn = len(data) - data.rfind(b'\n') - 1
+            lines = data.split(b'\n')
+            if start:
+                lines = lines[1:]       # Probably the end of a line
+            for line in reversed(lines):
+                seq = recfmt.check_line(line)
+                if seq is not None:
+                    break
+            mark = b'\n'
+    if torn:
+        with open(path, 'ab') as f:
+            f.write(mark)
+    return seq, torn
@@ -0,0 +1,121 @@
+# Write-behind buffering for the data log.
+#
+# Records are copied into a preallocated RAM buffer and only written to the
+# underlying file (and flushed) when one of the flush conditions is met:
+#   - the buffered bytes reach max_bytes (or the next record would not fit),
+#   - the oldest buffered record is older than max_age_ms,
+#   - max_records records are waiting.
+# A limit of 0 disables that condition. max_records=1 gives the old
+# write-and-flush-every-line behaviour.
+
+import ticks
+
+
+class WriteBehindLog():
+    def __init__(self, f, buf_size=2048, max_bytes=0, max_age_ms=60000, max_records=0, clock=ticks):
+        self._f = f
+        self.buf = bytearray(buf_size)
+        self._mv = memoryview(self.buf)
+        self._size = buf_size
+        self._max_bytes = max_bytes if 0 < max_bytes <= buf_size else buf_size
+        self._max_age_ms = max_age_ms
+        self._max_records = max_records
+        self._clock = clock
+        # If False, write() never flushes unless the buffer is full, and the
+        # owner is expected to call poll() or flush() when due() is True.
+        self.auto_flush = True
+
+        self._n = 0             # bytes waiting in the buffer
+        self._pending = 0       # records waiting in the buffer
+        self._t_first = 0       # ticks_ms of the oldest waiting record
+
+        # Counters for working out the number of SD transactions
+        self.records = 0
+        self.flushes = 0
+        self.bytes_written = 0
+
+    def write(self, data):
+        '''Add a record (str or bytes) to the buffer, flushing if the policy says so.'''
+        if isinstance(data, str):
+            data = data.encode()
+        n = len(data)
+        if n > self._size:
+            # Too big to ever buffer - write it straight through.
+            self.flush()
+            self.records += 1
+            self._write_out(data)
+            return n
+        pos = self.reserve(n)
+        self._mv[pos:pos + n] = data
+        self.commit(pos + n)
+        return n
+
+    def reserve(self, n):
+        '''Make room for a record of up to n bytes. Returns the offset in
+           self.buf at which to put it; then call commit() with its end.
+           This lets a record be rendered straight into the buffer.'''
+        if n > self._size:
+            raise ValueError("record larger than buffer")
+        if self._n + n > self._size:
+            self.flush()
+        return self._n
+
+    def commit(self, end):
+        '''Add the record that has been put in self.buf up to end.'''
+        if self._n == 0:
+            self._t_first = self._clock.ticks_ms()
+        self._n = end
+        self._pending += 1
+        self.records += 1
+        if self.auto_flush and self.due():
+            self.flush()
+
+    def due(self):
+        '''True if the flush policy says the buffer should be written out now.'''
+        if self._n == 0:
+            return False
+        return self._n >= self._max_bytes or \
+            (self._max_records and self._pending >= self._max_records) or \
+            (self._max_age_ms and \
+                self._clock.ticks_diff(self._clock.ticks_ms(), self._t_first) >= self._max_age_ms)
+
+    def poll(self):
+        '''Flush the buffer if the policy says so (e.g. the oldest record is too old).'''
+        if self.due():
+            self.flush()
+
+    def flush(self):
+        '''Write out anything in the buffer and flush the file.'''
+        if self._n:
+            self._write_out(self._mv[:self._n])
+            self._n = 0
+            self._pending = 0
+
+    def set_file(self, f):
+        '''Flush what is waiting to the current file, then send everything
+           from now on to f. Returns the old file, which is left open.'''
+        self.flush()
+        old = self._f
+        self._f = f
+        return old
+
+    def close(self):
+        self.flush()
+        self._f.close()
+
+    def pending(self):
+        return self._n
+
+    @property
+    def capacity(self):
+        '''Size of the buffer: the most that can wait to be written.'''
+        return self._size
+
+    def _write_out(self, data):
+        self._f.write(data)
+        try:
+            self._f.flush()
+        except AttributeError:
+            pass
+        self.flushes += 1
+        self.bytes_written += len(data)
@@ -3,10 +3,28 @@
 from PiicoDev_BME280 import PiicoDev_BME280
 from PiicoDev_VL53L1X import PiicoDev_VL53L1X
 from PiicoDev_Unified import sleep_ms
+from array import array
 import time
 import mpy_utils
 import sys
 import os_path
+import logbuf
+import binlog
+import scheduler
+import stats
+import ringbuf
+import profiling
+import recfmt
+import rotate
+import timeindex
+import journal
+import adaptive
+import burst
+import rollup
+import errorlog
+import timebase
+import ticks
+import bme280group
 
 class Display(object):
 
@@ -22,18 +40,27 @@ class Display(object):
         from PiicoDev_SSD1306 import create_PiicoDev_SSD1306
         self.disp = create_PiicoDev_SSD1306() # initialise the display
         self.disp.setContrast(0x80)
+        self._buf = bytearray(20)
 
-    def update(self, tempC=0.0, pres_hPa=0.0, humRH=0.0, dist_mm=0):
+    def update(self, temp=0, pres=0, hum=0, dist_mm=0):
+        '''temp, pres and hum are read_compensated_data() integers.'''
         self.disp.fill(self.BLACK)
-        self.disp.text("Temp: {0:04.1f} C".format(tempC), 1, self.TEMP_LINE, self.WHITE)
-        self.disp.text("Pres: {0:4.0f} hPa".format(pres_hPa), 1, self.PRES_LINE, self.WHITE)
-        self.disp.text("Hum:  {0:04.1f} %RH".format(humRH), 1, self.RH_LINE, self.WHITE)
+        self._text(b'Temp: ', temp, 100, 1, 4, b' C', self.TEMP_LINE)
+        self._text(b'Pres: ', pres, 25600, 0, 4, b' hPa', self.PRES_LINE)
+        self._text(b'Hum:  ', hum, 1024, 1, 4, b' %RH', self.RH_LINE)
         if dist_mm is None:
           self.disp.text("Dist: *****", 1, self.DIST_LINE, self.WHITE)
         else:
           self.disp.text("Dist: {0:5d} mm".format(dist_mm), 1, self.DIST_LINE, self.WHITE)
         self.disp.show()
 
+    def _text(self, label, num, den, decimals, width, unit, line):
+        buf = self._buf
+        pos = recfmt.put_bytes(buf, 0, label)
+        pos = recfmt.put_fixed(buf, pos, num, den, decimals, width, 0x30 if decimals else 0x20)
+        pos = recfmt.put_bytes(buf, pos, unit)
+        self.disp.text(buf[:pos].decode(), 1, line, self.WHITE)
+
     def off(self):
         self.disp.poweroff()
 
@@ -47,17 +74,159 @@ class Display(object):
 class DataLogger():
     _ATMOS_MEAS_INT = 20000 # ms
     _DIST_MEAS_INT = 2000 # ms
-
-    def __init__(self, use_sd=False):
+    _DISPLAY_INT = 2000 # ms
+    _ROTATE_CHECK_INT = 10000 # ms
+    _CORE1_IDLE = 50 # ms
+    _PROFILE_DUMP_INT = 600000 # ms
+    _BURST_INT = 20 # ms - the VL53L1X timing budget should be no longer
+    _ERRLOG_IDLE = 86400000 # ms - the errlog task is brought forward when lines are waiting
+
+    # Dual core ring buffer: slots of one record each.
+    _RING_SLOTS = 64
+
+    # Write-behind defaults. A 2 kB buffer holds ~40 text records, i.e. about
+    # 13 minutes of data at the normal rate, so the age limit usually triggers.
+    _WB_BUF_SIZE = 2048 # bytes
+    _WB_MAX_AGE = 60000 # ms
+
+    _LOG_LINE = 160     # bytes - longer log() lines are built in a temporary
+
+    def __init__(self, use_sd=False, write_behind=False, buf_size=_WB_BUF_SIZE, \
+            flush_bytes=0, flush_age_ms=_WB_MAX_AGE, flush_records=0, data_format='text', \
+            log_stats=False, range_filter=None, profile=False, profile_alloc=False, \
+            max_file_bytes=0, keep_files=0, min_free_kb=0, index_interval=60, journal=False, \
+            adaptive_sampler=None, burst_capture=None, rollups=False, atmos_options=None, \
+            atmos_addresses=None):
         self.sd = None
         self.led = None
+        self.atmos_sensor = None
+        self.dist_sensor = None
+        self.display = None
+        self.tasks = scheduler.TaskTable()
+        self._sd_lock = None    # Guards the SD card in dual core mode
+        self._start_time = time.time()
+        # Samples are stamped from a monotonic us clock mapped onto the RTC,
+        # rather than read from the RTC, which may be set while running.
+        self.timebase = timebase.Timebase()
+
+        # Per-phase timing histograms, plus heap allocation per phase with
+        # profile_alloc. When off, each timing point costs one test of self.prof.
+        if profile or profile_alloc:
+            self.prof = profiling.PhaseTimer(alloc=profile_alloc)
+        else:
+            self.prof = None
+
+        # Per-interval statistics of the distance samples. With log_stats they
+        # are added to each record, otherwise only the mean is logged.
+        self.log_stats = log_stats
+        self.range_stats = stats.IntStats()
+        # Optional stage between the VL53L1X and the stats, e.g. a
+        # filters.OutlierFilter. Its update() returns the value to use or None.
+        self.range_filter = range_filter
+        self._range_mm = None
+        # Optional adaptive.AdaptiveSampler over (temp, pres, hum, dist) in
+        # read_compensated_data() units and mm, e.g. with deadbands
+        # (10, 2560, 512, 5) for 0.1 C, 0.1 hPa, 0.5 %RH and 5 mm. It sets the
+        # atmos sampling period and which records are written.
+        self.adaptive = adaptive_sampler
+        self._adapt_values = array('l', [0] * 4)
+        # Optional burst.BurstCapture. The VL53L1X is then read every
+        # _BURST_INT ms into its ring, and the dist task uses the latest of
+        # those readings. Bursts go to burst_YYYY-MM-DD.bin on the SD card,
+        # for the day of each burst, and are deleted with that day's data.
+        self.burst = burst_capture
+        self._burst_mm = None
+        self.burst_file = None
+        self._burst_date = None
+        # With rollups, hourly and daily min/mean/max of each channel are
+        # appended to these files in the data directory as each period ends.
+        if rollups:
+            self.rollups = ((rollup.Rollup(rollup.HOUR), 'rollup_hourly.csv'), \
+                (rollup.Rollup(rollup.DAY), 'rollup_daily.csv'))
+        else:
+            self.rollups = ()
+        self._atmos_values = array('l', [0] * 3)   # read_compensated_data() units
+        # Keyword arguments for PiicoDev_BME280, e.g. {'normal': True,
+        # 'standby': 0, 'iir': 2} to have it measure continuously (with 0.5 ms
+        # standby and IIR filter coefficient 4) so each read is one I2C transfer.
+        self.atmos_options = atmos_options if atmos_options is not None else {}
+        # I2C addresses of several BME280s to read as a bme280group.BME280Group,
+        # e.g. (0x76, 0x77). Each interval then has a record per sensor, tagged
+        # with its number from 1; the first sensor's values are the ones used
+        # for the rollups, adaptive sampling and the display.
+        self.atmos_addresses = atmos_addresses
+        # With a sensor that has trigger()/collect() the conversion is started
+        # by the 'trigger' task and collected by 'atmos' once it is done.
+        self._atmos_pending = False
+        self._atmos_t = 0       # Time the pending conversion was started, ms since the epoch
+        if data_format not in ('text', 'binary'):
+            raise ValueError("data_format must be 'text' or 'binary'")
+        self.binary = data_format == 'binary'
+        # With journal each record is framed with a sequence number and CRC.
+        self.journal = journal
+        if self.binary:
+            self._packer = binlog.RecordPacker(stats=log_stats, journal=journal)
+            self._header = binlog.header(time.gmtime(0)[0], log_stats, journal)
+            self._rec_max = self._packer.size
+        else:
+            self._textrec = recfmt.TextRecord(journal=journal)
+            self._rec_max = recfmt.MAX_LINE
+        # Records are rendered straight into the write-behind buffer; this one
+        # is only used when they go to the dual core ring buffer instead.
+        self._rec_buf = bytearray(self._rec_max)
+        self._rec_mv = memoryview(self._rec_buf)
+        # log() lines are built here behind a timestamp that is only fully
+        # rendered again when the minute changes.
+        self._stamp = recfmt.TimeStamp()
+        self._line = bytearray(self._LOG_LINE)
+        self._line_mv = memoryview(self._line)
+
+        # Data files on the SD card are switched at midnight and, with
+        # max_file_bytes, when they get too big. Old ones are deleted to keep
+        # keep_files and min_free_kb free.
+        self.files = None
+        self._file_base = 0     # datalog.bytes_written when the file was opened
+        # Each data file gets a timeindex sidecar with the offset of the first
+        # record in every index_interval seconds (0 for none).
+        self.index_interval = index_interval
+        self.index = None
+
         if use_sd:
             self.config_sd()
+            self.files = rotate.DataFiles(self.data_dir, '.bin' if self.binary else '.txt', \
+                max_bytes=max_file_bytes, keep=keep_files, min_free=min_free_kb * 1024, \
+                companions=(('burst_', '.bin'),))
             self.errlog = self.create_errlog()
-            self.datalog = self.create_datalog()
         else:
-            self.errlog = sys.stderr
-            self.datalog = sys.stdout
+            self.errlog = getattr(sys.stderr, 'buffer', sys.stderr)
+        # Messages to the error log are deduplicated and rate limited, so that
+        # a failing sensor cannot keep the SD card busy.
+        self.errors = errorlog.ErrorLog(self.errlog, self.format_line)
+
+        if use_sd:
+            self.recover_datalog()
+            data_file = self.create_datalog()
+            self.files.prune()
+        else:
+            data_file = getattr(sys.stdout, 'buffer', sys.stdout)
+            if self.binary:
+                data_file.write(self._header)
+
+        # The data log always goes through a WriteBehindLog so that the number
+        # of SD writes can be reported. Without write-behind every record is
+        # flushed as soon as it is written, as before.
+        if not write_behind:
+            flush_records = 1
+        # Only the age limit needs a timer: the others are checked as each
+        # record is added. Without write-behind nothing is ever left waiting.
+        self._flush_check = flush_age_ms if write_behind else 0
+        self.datalog = logbuf.WriteBehindLog(data_file, buf_size=buf_size, \
+            max_bytes=flush_bytes, max_age_ms=flush_age_ms, max_records=flush_records)
+
+        # Where the sampling tasks send data records: the data log itself, or
+        # the ring buffer drained by core 1 in run_dual_core().
+        self.data_out = self.datalog
+        self.ring = None
 
     def config_sd(self):
         import os
@@ -77,19 +246,177 @@ class DataLogger():
     def create_errlog(self):
         log_file = self.log_dir + \
             '/dl_log_{0:4d}-{1:02d}-{2:02d}-{3:02d}{4:02d}{5:02d}.txt'.format(*time.localtime())
-        return open(log_file, 'w')
+        return open(log_file, 'wb')
+
+    def recover_datalog(self):
+        '''Check the end of the newest data file, which may have been cut off
+           by a power failure, before appending to it. Carries on the record
+           sequence numbers from it.'''
+        paths = self.files.files()
+        if not paths:
+            return
+        path = paths[-1]
+        seq, torn = journal.recover(path)
+        if torn:
+            self.log(self.errlog, "?? Data log {0} ended in a partial record ({1} bytes)".format( \
+                path, torn))
+        if seq is not None:
+            rec = self._packer if self.binary else self._textrec
+            rec.seq = (seq + 1) & 0xFFFF
 
     def create_datalog(self):
-        log_file = self.data_dir + \
-            '/data_{0:4d}-{1:02d}-{2:02d}.txt'.format(*time.localtime())
-        return open(log_file, 'a')
+        log_file, size = self.files.next_file(int(time.time()), self._can_append)
+        f = open(log_file, 'ab')
+        if self.binary and size == 0:
+            self.files.size += f.write(self._header)
+        if self.index_interval:
+            if self.index is not None:
+                self.index.close()
+            idx_file = timeindex.index_path(log_file)
+            new_idx = not os_path.exists(idx_file)
+            self.index = timeindex.IndexWriter(open(idx_file, 'ab'), new_idx, \
+                time.gmtime(0)[0], self.index_interval)
+        return f
+
+    def _can_append(self, path, size):
+        '''A binary data file can only be appended to if its header is the one
+           for the records we write. After a restart with a different log_stats
+           or journal setting they would be a different size, and the file
+           could not be decoded, so a new -N file is started instead. The same
+           goes for a file that ends in a partial record, which recovery only
+           pads out to a whole (bad) record with the journal on.'''
+        if not self.binary:
+            return True
+        try:
+            with open(path, 'rb') as f:
+                same = f.read(binlog.HEADER_SIZE) == self._header
+        except OSError:
+            return False
+        if not same:
+            msg = "?? Data log {0} has a different format - starting a new file"
+        elif (size - binlog.HEADER_SIZE) % self._rec_max:
+            msg = "?? Data log {0} ends in a partial record - starting a new file"
+        else:
+            return True
+        # Straight to the ErrorLog: rotate_datalog() already holds the SD lock.
+        self.errors.log(msg.format(path))
+        self._wake_errlog()
+        return False
+
+    def _file_written(self):
+        '''Bytes added to the current data file since it was opened, including
+           any still in the buffer.'''
+        dl = self.datalog
+        return dl.bytes_written - self._file_base + dl.pending()
+
+    def _index_record(self, t):
+        '''Called just before a record is written at time t.'''
+        idx = self.index
+        if idx is not None and t >= idx.next_t:
+            idx.add(t, self.files.size + self._file_written())
+
+    def rotate_datalog(self):
+        '''Switch to a new data file if the day has changed or the current
+           one is full, then delete old files if need be.'''
+        files = self.files
+        dl = self.datalog
+        if not files.due(int(time.time()), self._file_written()):
+            return
+        old_path = files.path
+        lock = self._sd_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            dl.flush()
+            f = self.create_datalog()
+            dl.set_file(f).close()
+            self._file_base = dl.bytes_written
+            deleted = files.prune()
+        finally:
+            if lock is not None:
+                lock.release()
+        self.log(self.errlog, " - Data log {0} closed, now {1}".format(old_path, files.path))
+        if deleted:
+            self.log(self.errlog, " - Deleted {0} old data file(s)".format(deleted))
+
+    def format_line(self, s):
+        '''Timestamp and terminate a message. Returns a memoryview into a
+           buffer that is reused by the next call.'''
+        buf = self._line
+        pos = self._stamp.put(buf, 0, int(time.time()))
+        buf[pos] = 0x7C     # '|'
+        buf[pos + 1] = 0x20
+        pos += 2
+        if isinstance(s, str):
+            s = s.encode()
+        n = len(s)
+        if pos + n >= len(buf):
+            return bytes(self._line_mv[:pos]) + s + b'\n'
+        self._line_mv[pos:pos + n] = s
+        buf[pos + n] = 0x0A
+        return self._line_mv[:pos + n + 1]
 
     def log(self, logger, s):
-        logger.write(mpy_utils.format_time(time.localtime()) + '| ' + s + '\n')
+        if logger is not self.errlog:
+            # Data records - the WriteBehindLog flushes by its own policy.
+            logger.write(self.format_line(s))
+            return
+
+        lock = self._sd_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            self.errors.log(s)
+        finally:
+            if lock is not None:
+                lock.release()
+        self._wake_errlog()
+
+    def poll_errlog(self):
+        '''Write out error log lines held back by the rate limit.'''
+        lock = self._sd_lock
+        if lock is not None:
+            lock.acquire()
         try:
-            logger.flush()
-        except AttributeError:
-            pass
+            self.errors.poll()
+        finally:
+            if lock is not None:
+                lock.release()
+        self._wake_errlog()
+
+    def _wake_errlog(self):
+        '''Bring the errlog task forward to when the ErrorLog next has
+           something to write. Otherwise it sleeps for _ERRLOG_IDLE.'''
+        task = self.tasks.get('errlog')
+        if task is None:
+            return
+        due = self.errors.next_due()
+        if due is not None and due < task.remaining():
+            task.run_in(due if due > 0 else 0)
+
+    def sensor_error(self, msg):
+        '''Called by a sensor driver when a read fails.'''
+        self.log(self.errlog, "?? " + msg)
+
+    def log_datalog_stats(self):
+        '''Log the number of data records and the number of writes it took to store them.'''
+        dl = self.datalog
+        hours = (time.time() - self._start_time) / 3600
+        if hours > 0:
+            rates = " ({0:.0f} records/h, {1:.0f} writes/h)".format(dl.records / hours, dl.flushes / hours)
+        else:
+            rates = ""
+        self.log(self.errlog, " - Data log: {0} records, {1} writes, {2} bytes{3}".format( \
+            dl.records, dl.flushes, dl.bytes_written, rates))
+
+    def dump_profile(self, reset=True):
+        '''Write the phase timing summary to the error log.'''
+        if self.prof is None:
+            return
+        for line in self.prof.summary():
+            self.log(self.errlog, " - Timing " + line)
+        if reset:
+            self.prof.reset()
 
     def config_hw(self):
         ready = False
@@ -99,7 +426,14 @@ class DataLogger():
                 self.log(self.errlog, " - Initialising hardware")
                 self.led = mpy_utils.Led()
                 self.led.on()
-                self.atmos_sensor = PiicoDev_BME280()
+                if self.atmos_addresses:
+                    self.atmos_sensor = bme280group.BME280Group.create(self.atmos_addresses, \
+                        **self.atmos_options)
+                    for s in self.atmos_sensor.sensors:
+                        s.on_error = self.sensor_error
+                else:
+                    self.atmos_sensor = PiicoDev_BME280(**self.atmos_options)
+                self.atmos_sensor.on_error = self.sensor_error
                 # self.dist_sensor = PiicoDev_VL53L1X()
                 # self.dist_sensor.distance_mode = 2
                 # self.dist_sensor.timing_budget = 200
@@ -113,7 +447,7 @@ class DataLogger():
                 self.led.on()
 
             except Exception as e:
-                self.log(self.errlog, "  Error: ",e)
+                self.log(self.errlog, "  Error: " + str(e))
                 self.sd = None
                 cnt += 1
                 if cnt < 5:
@@ -130,53 +464,427 @@ class DataLogger():
         if reason is not None:
             msg = msg + ": " + reason
         self.log(self.errlog, msg)
+        if self.ring is not None:
+            self._stop_core1()
+            self.log(self.errlog, " - Ring buffer: " + self.ring.stats_str())
+        if self.sd is not None:
+            self.datalog.close()
+            if self.index is not None:
+                self.index.close()
+            if self.burst_file is not None:
+                self.burst_file.close()
+        else:
+            self.datalog.flush()
+        self.log_datalog_stats()
+        if self.adaptive is not None:
+            self.log(self.errlog, " - Adaptive sampling: " + self.adaptive.stats_str())
+        if self.burst is not None:
+            self.log(self.errlog, " - Bursts captured: {0}".format(self.burst.bursts))
+        self.log(self.errlog, " - Timebase: " + self.timebase.stats_str())
+        for r, name in self.rollups:
+            # The period so far; a restart in the same period adds another line.
+            if r.start is not None:
+                self.write_rollup(name, r.close())
+        self.dump_profile()
+        for line in self.tasks.stats():
+            self.log(self.errlog, " - Task " + line + " ms")
+        errors = self.errors
+        self.log(self.errlog, " - Error log: {0} lines, {1} repeats suppressed, {2} dropped".format( \
+            errors.lines, errors.suppressed, errors.dropped))
+        errors.flush()
         if self.sd is not None:
             self.sd.umount()
         if self.led is not None:
             self.led.off()
 
+    def add_default_tasks(self):
+        '''Register the standard acquisition tasks. Another sensor, or a different
+           rate for one of these, can be added to self.tasks before run(); a
+           default task is not added if a task of that name already exists.'''
+        atmos_period = self._ATMOS_MEAS_INT if self.adaptive is None else self.adaptive.period
+        # Nothing to wait for in normal mode, so no trigger task then.
+        split = hasattr(self.atmos_sensor, 'trigger') and self.atmos_sensor.conversion_ms() > 0
+        defaults = (
+            ('burst', self._BURST_INT, self.sample_burst, \
+                self.burst is not None and self.dist_sensor is not None),
+            ('dist', self._DIST_MEAS_INT, self.sample_distance, self.dist_sensor is not None),
+            ('trigger', atmos_period, self.trigger_atmos, split),
+            ('atmos', atmos_period, self.sample_atmos, True),
+            ('display', self._DISPLAY_INT, self.update_display, self.display is not None),
+            ('flush', self._flush_check, self.poll_datalog, self._flush_check > 0),
+            ('timebase', self.timebase.period, self.sync_timebase, True),
+            ('rotate', self._ROTATE_CHECK_INT, self.rotate_datalog, self.files is not None),
+            ('errlog', self._ERRLOG_IDLE, self.poll_errlog, True),
+            ('profile', self._PROFILE_DUMP_INT, self.dump_profile, self.prof is not None),
+        )
+        for name, period, callback, wanted in defaults:
+            if wanted and self.tasks.get(name) is None:
+                # Housekeeping tasks first run one period in, not at start up.
+                phase = period if name in ('flush', 'rotate', 'errlog', 'profile') else 0
+                if name == 'atmos' and split:
+                    phase = self.atmos_sensor.conversion_ms()
+                self.tasks.add(name, period, callback, phase=phase)
+        self._wake_errlog()
+
+    def read_distance(self):
+        '''Read the VL53L1X. Returns the distance in mm, or None if the
+           reading was not valid.'''
+        prof = self.prof
+        if prof:
+            t0 = prof.start()
+        range_mm, status = self.dist_sensor.distance
+        if prof:
+            prof.lap(profiling.DIST, t0)
+        return range_mm if status["ok"] else None
+
+    def sample_distance(self):
+        if self.burst is not None:
+            range_mm = self._burst_mm   # Already read by sample_burst()
+        else:
+            range_mm = self.read_distance()
+        if range_mm is not None and self.range_filter is not None:
+            range_mm = self.range_filter.update(range_mm)
+        if range_mm is not None:
+            self.range_stats.add(range_mm)
+        self._range_mm = range_mm
+
+    def sample_burst(self):
+        range_mm = self.read_distance()
+        self._burst_mm = range_mm
+        tm = self.timebase.now_ms()
+        t = tm // 1000
+        if self.burst.add(ticks.ticks_ms(), range_mm, t, tm - t * 1000):
+            self.write_burst()
+
+    def write_burst(self):
+        '''Write the burst that has just completed to the burst file in one write.'''
+        b = self.burst
+        n = b.render()
+        if self.sd is None:
+            self.log(self.errlog, "?? Burst of {0} bytes not saved - no SD card".format(n))
+            return
+        lock = self._sd_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            date = time.localtime(b.time)[:3]
+            if date != self._burst_date:
+                if self.burst_file is not None:
+                    self.burst_file.close()
+                self.burst_file = open(self.data_dir + \
+                    '/burst_{0:4d}-{1:02d}-{2:02d}.bin'.format(*date), 'ab')
+                self._burst_date = date
+                # Make room for the new day's bursts too.
+                self.files.prune()
+            self.burst_file.write(memoryview(b.buf)[:n])
+            self.burst_file.flush()
+        finally:
+            if lock is not None:
+                lock.release()
+        self.log(self.errlog, " - Burst captured, {0} samples".format( \
+            (n - burst.HEADER_SIZE) // burst.SAMPLE_SIZE))
+
+    def write_rollup(self, name, line):
+        '''Append a line to a rollup file, starting it with a header if it is new.'''
+        if self.sd is None:
+            self.log(self.errlog, " - Rollup " + name + ": " + line)
+            return
+        path = self.data_dir + '/' + name
+        lock = self._sd_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            new_file = not os_path.exists(path)
+            with open(path, 'ab') as f:
+                if new_file:
+                    f.write(rollup.HEADER.encode() + b'\n')
+                f.write(line.encode() + b'\n')
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def trigger_atmos(self):
+        '''Start a BME280 conversion. Other tasks can run while it is going on,
+           and sample_atmos() collects it once it is done.'''
+        self._atmos_t = self.timebase.now_ms()
+        self.atmos_sensor.trigger()
+        self._atmos_pending = True
+
+    def sample_atmos(self):
+        '''Read the atmospheric sensor and log a record for the interval, or
+           one per sensor for a BME280Group. The record is rendered from the
+           integer compensated values straight into the write-behind buffer,
+           so nothing is allocated for it.'''
+        self.led.on()
+        prof = self.prof
+        t0 = prof.start() if prof else 0
+        if self._atmos_pending:
+            self._atmos_pending = False
+            tm = self._atmos_t
+            values = self.atmos_sensor.collect()
+        else:
+            tm = self.timebase.now_ms()
+            values = self.atmos_sensor.read_compensated_data()
+        # A group gives a list with a (temp, pres, hum) for each sensor.
+        group = isinstance(values, list)
+        temp, pres, hum = values[0] if group else values
+        # Records keep the ms of the sample time; the rest of the logger
+        # (rollups, index, adaptive sampling) works in whole seconds.
+        t = tm // 1000
+        ms = tm - t * 1000
+        if prof:
+            t0 = prof.lap(profiling.ATMOS, t0)
+
+        ok = temp == temp   # False for NaN - the sensor could not be read
+        if not ok:
+            temp, pres, hum = 0, 0, 0
+        rs = self.range_stats
+        if rs.count > 0:
+            avg_range = rs.mean_round()
+        else:
+            avg_range = None
+
+        for r, name in self.rollups:
+            line = r.add(t, temp if ok else None, pres, hum, rs)
+            if line is not None:
+                self.write_rollup(name, line)
+        if self.adaptive is not None and not self._adapt(t, temp, pres, hum, avg_range):
+            # Inside the deadband - nothing to write.
+            self._atmos_done(temp, pres, hum)
+            return
+
+        if group:
+            for i in range(len(values)):
+                t0 = self._write_record(t, ms, values[i], avg_range, i + 1, t0)
+        else:
+            self._write_record(t, ms, values, avg_range, 0, t0)
+        self._atmos_done(temp, pres, hum)
+
+    def _write_record(self, t, ms, values, avg_range, sensor, t0):
+        '''Write the record of one sensor's (temp, pres, hum) for the
+           interval. sensor is its number in a group, or 0. Returns the
+           profiling time of the end of the write.'''
+        prof = self.prof
+        temp, pres, hum = values
+        ok = temp == temp
+        if not ok:
+            temp, pres, hum = 0, 0, 0
+        rs = self.range_stats
+        out = self.data_out
+        direct = out is self.datalog
+        if direct:
+            self._index_record(t)
+            buf = out.buf
+            pos = out.reserve(self._rec_max)
+        else:
+            buf = self._rec_buf
+            pos = 0
+        if self.binary:
+            status = 0 if ok else binlog.STATUS_ATMOS_FAIL
+            end = self._packer.pack_into(buf, pos, t, temp, pres, hum, avg_range, \
+                status | sensor << binlog.STATUS_SENSOR_SHIFT, rs, ms)
+        else:
+            end = self._textrec.render(buf, pos, t, temp, pres, hum, ok, avg_range, \
+                rs if self.log_stats else None, ms, sensor)
+        if prof:
+            t0 = prof.lap(profiling.FORMAT, t0)
+
+        if direct:
+            out.commit(end)
+        else:
+            # Core 1 indexes the record with its own time when it writes it.
+            out.put(self._rec_mv[:end], t)
+        if prof:
+            t0 = prof.lap(profiling.WRITE, t0)
+        return t0
+
+    def _atmos_done(self, temp, pres, hum):
+        if self.display is not None:
+            v = self._atmos_values
+            v[0] = temp
+            v[1] = pres
+            v[2] = hum
+        self.range_stats.reset()
+        self.led.off()
+
+    def _adapt(self, t, temp, pres, hum, avg_range):
+        '''Run the adaptive sampler and set the atmos period from it. Returns
+           True if the record should be written.'''
+        ad = self.adaptive
+        v = self._adapt_values
+        v[0] = temp
+        v[1] = pres
+        v[2] = hum
+        v[3] = adaptive.NO_VALUE if avg_range is None else avg_range
+        write = ad.update(t, v)
+        for name in ('trigger', 'atmos'):
+            task = self.tasks.get(name)
+            if task is not None and task.period != ad.period:
+                task.set_period(ad.period)
+        return write
+
+    def sync_timebase(self):
+        tb = self.timebase
+        step = tb.poll()
+        if step:
+            self.log(self.errlog, "?? RTC was set by {0} s - timebase restarted".format(step))
+        task = self.tasks.get('timebase')
+        if task is not None and task.period != tb.period:
+            task.set_period(tb.period)
+
+    def poll_datalog(self):
+        prof = self.prof
+        if prof:
+            t0 = prof.start()
+        self.datalog.poll()
+        if prof:
+            prof.lap(profiling.WRITE, t0)
+
+    def update_display(self):
+        prof = self.prof
+        if prof:
+            t0 = prof.start()
+        temp, pres, hum = self._atmos_values
+        self.display.update(temp, pres, hum, self._range_mm)
+        if prof:
+            prof.lap(profiling.DISPLAY, t0)
+
     def run(self):
         # import gc
         # gc.disable()
 
         self.log(self.errlog, " - Starting data acquisition.")
-        tempC , pres_hPa, humRH, range_mm = (0.0, 0.0, 0.0, 0)
-
-        sleep_time = self._DIST_MEAS_INT
-        time_to_next_atmos_measurement = 0
-        range_sum = 0
-        num_range_samples = 0
-
-        while (True):           
-
-            # range_mm, status = self.dist_sensor.distance
-            # if status["ok"]:
-            #     range_sum += range_mm
-            #     num_range_samples += 1
-            # else:
-            #     range_mm = None
-
-            if time_to_next_atmos_measurement <= 0:
-                self.led.on()
+        self.add_default_tasks()
+        self._run_tasks()
 
-                tempC, presPa, humRH = self.atmos_sensor.values() # read all data from the sensor
-                pres_hPa = presPa / 100 
-
-                if num_range_samples > 0:
-                    avg_range_str = " {0:5.0f} mm".format(range_sum / num_range_samples)
-                else:
-                    avg_range_str = " ***** mm"
-
-                self.log(self.datalog, "{0:4.1f} C {1:6.1f} hPa, {2:4.1f} %, {3}".format( \
-                        tempC, pres_hPa, humRH, avg_range_str))
-
-                range_sum = 0
-                num_range_samples = 0
-                time_to_next_atmos_measurement = self._ATMOS_MEAS_INT
+    def _run_tasks(self):
+        while (True):
+            # gc.collect()
+            missed = self.tasks.run_once()
+            if missed:
+                self.log(self.errlog, "?? Acquisition overran - missed {0} slot(s)".format(missed))
+
+    def run_dual_core(self, slots=_RING_SLOTS):
+        '''Sample on core 0 and write to the SD card on core 1. The sampling
+           tasks put each record into a ring buffer which a thread on core 1
+           drains into the data log, so a slow SD write never holds up a sample.
+           The error log is shared, so it and the data log flushes are guarded
+           by a lock.'''
+        import _thread
+
+        self.ring = ringbuf.RingBuffer(slots, self._rec_max)
+        self._sd_lock = _thread.allocate_lock()
+        self._core1_run = True
+        self._core1_done = False
+
+        self.log(self.errlog, " - Starting data acquisition (dual core).")
+        _thread.start_new_thread(self._core1_writer, ())
+        self.data_out = self.ring
+        self.add_default_tasks()
+        self.tasks.remove('flush')      # Core 1 looks after flushing
+        self._run_tasks()
+
+    def _core1_writer(self):
+        ring = self.ring
+        dl = self.datalog
+        lock = self._sd_lock
+        running = True
+        while running:
+            running = self._core1_run   # Drain once more after being stopped
+            if ring.count() or dl.due():
+                lock.acquire()
+                try:
+                    rec = ring.peek()
+                    while rec is not None:
+                        self._index_record(ring.peek_tag())
+                        dl.write(rec)
+                        ring.release()
+                        rec = ring.peek()
+                    dl.poll()
+                finally:
+                    lock.release()
+            if running:
+                sleep_ms(self._CORE1_IDLE)
+        self._core1_done = True
+
+    def _stop_core1(self, timeout_ms=2000):
+        self._core1_run = False
+        while not self._core1_done and timeout_ms > 0:
+            sleep_ms(10)
+            timeout_ms -= 10
+        self.data_out = self.datalog
+
+    def run_async(self):
+        '''Run the same tasks as run(), but each one as its own asyncio coroutine,
+           with the SD card writes done by a separate flushing coroutine. The
+           sensor tasks only add records to the write-behind buffer, so a slow
+           SD write or display redraw is never in the middle of a sample.'''
+        try:
+            import uasyncio as asyncio
+        except ImportError:
+            import asyncio
 
-                # self.display.update(tempC, pres_hPa, humRH, range_mm)
-                self.led.off()
+        if hasattr(asyncio, 'sleep_ms'):
+            self._sleep_ms = asyncio.sleep_ms
+            self._wait_for_ms = asyncio.wait_for_ms
+        else:
+            self._sleep_ms = lambda t: asyncio.sleep(t / 1000)
+            self._wait_for_ms = lambda aw, t: asyncio.wait_for(aw, t / 1000)
 
-            # gc.collect()
-            sleep_ms(sleep_time)
-            time_to_next_atmos_measurement -= sleep_time
+        self.log(self.errlog, " - Starting data acquisition (asyncio).")
+        self.add_default_tasks()
+        self.datalog.auto_flush = False
+        try:
+            asyncio.run(self._async_main(asyncio))
+        finally:
+            self.datalog.auto_flush = True
+
+    async def _async_main(self, asyncio):
+        flush_event = asyncio.Event()
+        self._flush_wake = None     # ticks_ms when _async_flush() will next wake by itself
+        coros = [self._async_task(task, flush_event) \
+            for task in self.tasks.tasks if task.name not in ('flush', 'errlog')]
+        coros.append(self._async_flush(asyncio, flush_event))
+        await asyncio.gather(*coros)
+
+    async def _async_task(self, task, flush_event):
+        while True:
+            wait = task.remaining()
+            if wait > 0:
+                await self._sleep_ms(wait)
+            missed = task.run()
+            if missed:
+                self.log(self.errlog, "?? Task {0} overran - missed {1} slot(s)".format(task.name, missed))
+            if self.datalog.due() or self._errlog_sooner():
+                flush_event.set()
+
+    def _errlog_sooner(self):
+        '''True if the ErrorLog has lines to write before _async_flush() would
+           next wake by itself.'''
+        due = self.errors.next_due()
+        if due is None:
+            return False
+        wake = self._flush_wake
+        return wake is None or due < ticks.ticks_diff(wake, ticks.ticks_ms())
+
+    async def _async_flush(self, asyncio, flush_event):
+        # Also writes out the error log. Wakes when a task has left the buffer
+        # due for flushing, or the error log has lines waiting, or after the
+        # age limit so that it is still honoured.
+        while True:
+            wait = self._flush_check
+            due = self.errors.next_due()
+            if due is not None and (not wait or due < wait):
+                wait = due if due > 0 else 0
+            if wait or due is not None:
+                self._flush_wake = ticks.ticks_add(ticks.ticks_ms(), wait)
+                try:
+                    await self._wait_for_ms(flush_event.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                self._flush_wake = None
+                await flush_event.wait()
+            flush_event.clear()
+            self.datalog.poll()
+            self.poll_errlog()
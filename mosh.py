@@ -5,6 +5,7 @@ from machine import SPI, Pin
 import os
 import os_path
 import mpy_utils
+import time
 
 _FILE = const(0x8000)
 _DIR = const(0x4000)
@@ -29,6 +30,46 @@ class Mosh():
                     for line in f:
                         print(line, end='')
 
+    def range(self, args):
+        '''range <data file> <from HH:MM[:SS]> <to HH:MM[:SS]> - print the
+           records in a time range, using the file's index to find them.'''
+        if len(args) != 3:
+            print("?? Usage: range <data file> <from HH:MM> <to HH:MM>")
+            return
+        import timeindex
+        path = os_path.abspath(args[0])
+        idx = timeindex.index_path(path)
+        if not os_path.exists(path) or not os_path.exists(idx):
+            print("?? No data file or index for ", path)
+            return
+        name = os_path.basename(path)
+        date = [int(x) for x in name[5:15].split('-')]
+        times = []
+        for arg in args[1:]:
+            hms = [int(x) for x in arg.split(':')] + [0]
+            times.append(time.mktime((date[0], date[1], date[2], hms[0], hms[1], hms[2], 0, 0)))
+        with open(idx, 'rb') as idx_f:
+            timeindex.read_header(idx_f)
+            start, end = timeindex.span(idx_f, times[0], times[1], os.stat(idx)[6])
+        with open(path, 'rb') as f:
+            if path.endswith('.bin'):
+                import binlog
+                import recfmt
+                version = binlog.read_header(f)[0]
+                rec = recfmt.TextRecord()
+                buf = bytearray(recfmt.MAX_LINE)
+                for data in timeindex.bin_records(f, start, end, times[0], times[1]):
+                    t, temp, pres, hum, dist, status, dist_stats = binlog.unpack_record(version, data)
+                    s = int(t)
+                    n = rec.render(buf, 0, s, temp, pres, hum, not status & binlog.STATUS_ATMOS_FAIL, \
+                        dist, None, int(round((t - s) * 1000)))
+                    print(bytes(buf[:n - 1]).decode())
+            else:
+                first = mpy_utils.format_time(time.localtime(times[0])).encode()
+                last = mpy_utils.format_time(time.localtime(times[1])).encode()
+                for line in timeindex.text_lines(f, start, end, first, last):
+                    print(line.decode(), end='')
+
     def cd(self, args):
         if len(args) > 0:
             path = os_path.abspath(args[0])
@@ -169,6 +210,7 @@ class Mosh():
     def _go(self):
         command_table = {
             'cat': self.cat,
+            'range': self.range,
             'ls': self.ls,
             'cd': self.cd,
             'pwd': self.pwd,
@@ -0,0 +1,130 @@
+# Timing instrumentation for the logger loop.
+#
+# PhaseTimer keeps a histogram of the time taken by each phase of the loop
+# (sensor reads, formatting, SD writes, display) in preallocated arrays, so
+# recording a time allocates nothing. Bucket b counts times in
+# [2**(b-1), 2**b) us, with bucket 0 for 0 us and the last bucket catching
+# everything longer.
+#
+# With alloc=True it also records the heap bytes allocated in each phase,
+# from gc.mem_alloc(). If the figure goes down during a phase a garbage
+# collection must have run, which is counted instead. On CPython
+# tracemalloc, if it is running, stands in for gc.mem_alloc().
+#
+# Usage:
+#     t0 = prof.start()
+#     ...
+#     t0 = prof.lap(profiling.ATMOS, t0)    # records and restarts the timer
+
+from array import array
+import gc
+import ticks
+
+try:
+    mem_alloc = gc.mem_alloc
+except AttributeError:
+    def mem_alloc():
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[0]
+
+PHASES = ('atmos', 'dist', 'format', 'write', 'display')
+ATMOS = 0
+DIST = 1
+FORMAT = 2
+WRITE = 3
+DISPLAY = 4
+
+_BUCKETS = 24       # Last bucket is >= 2**22 us, i.e. about 4 s
+
+
+class PhaseTimer():
+    def __init__(self, phases=PHASES, buckets=_BUCKETS, alloc=False, clock=ticks):
+        self.phases = phases
+        self.buckets = buckets
+        self._clock = clock
+        n = len(phases)
+        self.hist = array('L', [0] * (n * buckets))
+        self.count = array('L', [0] * n)
+        self.total = array('L', [0] * n)    # us, wraps after ~71 minutes of busy time
+        self.max = array('L', [0] * n)
+
+        self.alloc = alloc
+        self.alloc_total = array('L', [0] * n)  # bytes
+        self.alloc_max = array('L', [0] * n)
+        self.collections = array('L', [0] * n)
+        self._m0 = 0
+
+    def reset(self):
+        for a in (self.hist, self.count, self.total, self.max, \
+                self.alloc_total, self.alloc_max, self.collections):
+            for i in range(len(a)):
+                a[i] = 0
+
+    def start(self):
+        if self.alloc:
+            self._m0 = mem_alloc()
+        return self._clock.ticks_us()
+
+    def lap(self, phase, t0):
+        '''Record the time since t0 against phase. Returns the current time
+           so that the next phase can be timed from it.'''
+        now = self._clock.ticks_us()
+        self.record(phase, self._clock.ticks_diff(now, t0))
+        if self.alloc:
+            m = mem_alloc()
+            self.record_alloc(phase, m - self._m0)
+            self._m0 = m
+        return now
+
+    def record_alloc(self, phase, d):
+        if d < 0:
+            self.collections[phase] += 1
+        else:
+            self.alloc_total[phase] = (self.alloc_total[phase] + d) & 0xFFFFFFFF
+            if d > self.alloc_max[phase]:
+                self.alloc_max[phase] = d
+
+    def record(self, phase, dt):
+        if dt < 0:
+            dt = 0
+        b = 0
+        v = dt
+        while v and b < self.buckets - 1:
+            v >>= 1
+            b += 1
+        self.hist[phase * self.buckets + b] += 1
+        self.count[phase] += 1
+        self.total[phase] = (self.total[phase] + dt) & 0xFFFFFFFF
+        if dt > self.max[phase]:
+            self.max[phase] = dt
+
+    def percentile(self, phase, pct):
+        '''Upper bound (us) of the bucket holding the pct-th percentile,
+           or the maximum if that is lower.'''
+        n = self.count[phase]
+        if n == 0:
+            return 0
+        target = (n * pct + 99) // 100
+        seen = 0
+        base = phase * self.buckets
+        for b in range(self.buckets):
+            seen += self.hist[base + b]
+            if seen >= target and b < self.buckets - 1:
+                return min((1 << b) - 1, self.max[phase])
+        return self.max[phase]
+
+    def summary(self):
+        '''Yields a line per phase that has been timed.'''
+        for i, name in enumerate(self.phases):
+            n = self.count[i]
+            if n == 0:
+                continue
+            line = "{0}: n={1} mean={2}us p50<={3}us p99<={4}us max={5}us".format( \
+                name, n, self.total[i] // n, self.percentile(i, 50), \
+                self.percentile(i, 99), self.max[i])
+            if self.alloc:
+                # Phases that saw a collection don't count towards the mean.
+                m = n - self.collections[i]
+                line += " alloc mean={0}B max={1}B gc={2}".format( \
+                    self.alloc_total[i] // m if m else 0, self.alloc_max[i], self.collections[i])
+            yield line
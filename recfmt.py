@@ -0,0 +1,322 @@
+# Allocation-free rendering of text data records.
+#
+# The text data log used to be built with str.format() on floats plus string
+# concatenation, which allocates several objects per record on MicroPython.
+# Here the integer compensated values from the BME280 are rendered digit by
+# digit straight into a caller supplied bytearray (normally the write-behind
+# buffer itself), giving the same layout as before:
+#     2023-01-01 12:00:00| 21.5 C 1013.2 hPa, 45.0 %,   1234 mm
+# Values are rounded half up to one decimal place. If the ms of the sample
+# time are given they follow the seconds: '2023-01-01 12:00:00.250| ...'.
+# A record for one sensor of a group ends in ', sensor=N', N from 1.
+#
+# Only small ints are used, so in steady state nothing is allocated.
+# binlog's decoder renders with the same functions, so that a decoded binary
+# log has the same digits as the text log.
+#
+# With journal=True each line ends in ' #SSSSS CCCCCCCC': a sequence number
+# and the CRC32 (in hex) of the line up to and including it, so that a line
+# torn by a power cut can be detected. check_line() verifies one.
+#
+# TimeStamp keeps a 'YYYY-MM-DD HH:MM:SS' timestamp in a bytearray. Within a
+# minute only the seconds digits are rendered again; time.localtime() is only
+# called when the minute changes.
+
+import binascii
+import time
+
+MAX_LINE = 144      # Longest line render() can produce, with stats, sensor and journal
+
+_NAN = b'nan'
+_SEP = b'| '
+_C = b' C '
+_HPA = b' hPa, '
+_PCT = b' %, '
+_MM = b' mm'
+_NO_DIST = b' ***** mm'
+_N = b', n='
+_MIN = b' min='
+_MAX = b' max='
+_SD = b' sd='
+_SENSOR = b', sensor='
+_SEQ = b' #'
+
+JOURNAL_SIZE = 16   # ' #SSSSS CCCCCCCC'
+
+
+def put_bytes(buf, pos, s):
+    for i in range(len(s)):
+        buf[pos + i] = s[i]
+    return pos + len(s)
+
+
+def put_uint(buf, pos, value, width=0, fill=0x20):
+    '''Render a non-negative int right aligned in at least width characters,
+       padded with fill (a byte value). Returns the position after it.'''
+    n = 1
+    v = value
+    while v >= 10:
+        v //= 10
+        n += 1
+    end = pos + (width if width > n else n)
+    i = end
+    v = value
+    while True:
+        i -= 1
+        buf[i] = 0x30 + v % 10
+        v //= 10
+        if v == 0:
+            break
+    while i > pos:
+        i -= 1
+        buf[i] = fill
+    return end
+
+
+def put_tenths(buf, pos, tenths, width=0):
+    '''Render an int number of tenths as [-]d.d right aligned in at least width
+       characters, as '{:width.1f}' would. Returns the position after it.'''
+    neg = tenths < 0
+    if neg:
+        tenths = -tenths
+    ip = tenths // 10
+    n = 3       # d.d
+    v = ip
+    while v >= 10:
+        v //= 10
+        n += 1
+    if neg:
+        n += 1
+    while n < width:
+        buf[pos] = 0x20
+        pos += 1
+        width -= 1
+    if neg:
+        buf[pos] = 0x2D     # '-'
+        pos += 1
+    pos = put_uint(buf, pos, ip)
+    buf[pos] = 0x2E         # '.'
+    buf[pos + 1] = 0x30 + tenths % 10
+    return pos + 2
+
+
+_POW10 = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def put_fixed(buf, pos, num, den, decimals=0, width=0, fill=0x20):
+    '''Render num / den (den > 0) rounded half away from zero to decimals
+       places, right aligned in at least width characters, as
+       '{:width.decimalsf}' would. With fill 0x30 the padding is zeros after
+       the sign, as '{:0width.decimalsf}'. Returns the position after it.'''
+    neg = num < 0
+    if neg:
+        num = -num
+    p = _POW10[decimals]
+    v = (2 * num * p + den) // (2 * den)
+    if v == 0:
+        neg = False
+    ip = v // p
+    n = 1
+    x = ip
+    while x >= 10:
+        x //= 10
+        n += 1
+    if decimals:
+        n += decimals + 1
+    if neg:
+        n += 1
+    if neg and fill != 0x20:
+        buf[pos] = 0x2D     # '-'
+        pos += 1
+    while n < width:
+        buf[pos] = fill
+        pos += 1
+        width -= 1
+    if neg and fill == 0x20:
+        buf[pos] = 0x2D
+        pos += 1
+    pos = put_uint(buf, pos, ip)
+    if decimals:
+        buf[pos] = 0x2E     # '.'
+        pos = put_uint(buf, pos + 1, v % p, decimals, 0x30)
+    return pos
+
+
+def put_hex(buf, pos, value, width):
+    '''Render value as width lower case hex digits.'''
+    i = pos + width
+    while i > pos:
+        i -= 1
+        d = value & 0xF
+        buf[i] = (0x30 + d) if d < 10 else (0x57 + d)
+        value >>= 4
+    return pos + width
+
+
+def put_nan(buf, pos, width):
+    while width > 3:
+        buf[pos] = 0x20
+        pos += 1
+        width -= 1
+    return put_bytes(buf, pos, _NAN)
+
+
+def div_round(a, b):
+    '''a / b rounded half up, for b > 0, in integer maths.'''
+    return (2 * a + b) // (2 * b)
+
+
+def put_values(buf, pos, temp, pres, hum, ok=True, dist=None):
+    '''Render the part of a data line after the timestamp and '| ', up to
+       the distance stats. The arguments are as for TextRecord.render().
+       Returns the position after it.'''
+    if ok:
+        pos = put_tenths(buf, pos, div_round(temp, 10), 4)
+        pos = put_bytes(buf, pos, _C)
+        pos = put_tenths(buf, pos, div_round(pres, 2560), 6)
+        pos = put_bytes(buf, pos, _HPA)
+        pos = put_tenths(buf, pos, div_round(hum * 10, 1024), 4)
+    else:
+        pos = put_nan(buf, pos, 4)
+        pos = put_bytes(buf, pos, _C)
+        pos = put_nan(buf, pos, 6)
+        pos = put_bytes(buf, pos, _HPA)
+        pos = put_nan(buf, pos, 4)
+    pos = put_bytes(buf, pos, _PCT)
+    if dist is None:
+        return put_bytes(buf, pos, _NO_DIST)
+    buf[pos] = 0x20
+    pos = put_uint(buf, pos + 1, dist, 5)
+    return put_bytes(buf, pos, _MM)
+
+
+def put_dist_stats(buf, pos, n, d_min=0, d_max=0, sd_tenths=0):
+    '''Render the distance stats of a data line: n samples, their min and
+       max in mm and their standard deviation in 0.1 mm. Returns the
+       position after it.'''
+    pos = put_bytes(buf, pos, _N)
+    pos = put_uint(buf, pos, n)
+    if n:
+        pos = put_bytes(buf, pos, _MIN)
+        pos = put_uint(buf, pos, d_min)
+        pos = put_bytes(buf, pos, _MAX)
+        pos = put_uint(buf, pos, d_max)
+        pos = put_bytes(buf, pos, _SD)
+        pos = put_tenths(buf, pos, sd_tenths)
+    return pos
+
+
+def put_sensor(buf, pos, sensor):
+    '''Render the ', sensor=N' of a group sensor's data line. Returns the
+       position after it.'''
+    pos = put_bytes(buf, pos, _SENSOR)
+    return put_uint(buf, pos, sensor)
+
+
+class TimeStamp():
+    '''Timestamp as 'YYYY-MM-DD HH:MM:SS' in self.buf, for t in seconds since
+       the epoch (RTC local time on the Pico).'''
+    SIZE = 19
+
+    def __init__(self):
+        self.buf = bytearray(self.SIZE)
+        self._t = None
+        self._t_min = None      # t at the start of the minute in buf
+
+    def update(self, t):
+        '''Bring buf up to date for t and return it.'''
+        if t == self._t:
+            return self.buf
+        b = self.buf
+        s = t - self._t_min if self._t_min is not None else -1
+        if 0 <= s < 60:
+            b[17] = 0x30 + s // 10
+            b[18] = 0x30 + s % 10
+        else:
+            lt = time.localtime(t)
+            put_uint(b, 0, lt[0], 4, 0x30)
+            b[4] = 0x2D     # '-'
+            put_uint(b, 5, lt[1], 2, 0x30)
+            b[7] = 0x2D
+            put_uint(b, 8, lt[2], 2, 0x30)
+            b[10] = 0x20
+            put_uint(b, 11, lt[3], 2, 0x30)
+            b[13] = 0x3A    # ':'
+            put_uint(b, 14, lt[4], 2, 0x30)
+            b[16] = 0x3A
+            put_uint(b, 17, lt[5], 2, 0x30)
+            self._t_min = t - lt[5]
+        self._t = t
+        return b
+
+    def put(self, buf, pos, t):
+        '''Render the timestamp for t at buf[pos:]. Returns the position after it.'''
+        return put_bytes(buf, pos, self.update(t))
+
+
+def check_line(line):
+    '''The sequence number of a journal line (bytes, with or without its
+       newline), or None if it has no journal suffix or its CRC is wrong.'''
+    n = len(line)
+    if n and line[n - 1] == 0x0A:
+        n -= 1
+    if n < JOURNAL_SIZE or line[n - JOURNAL_SIZE:n - JOURNAL_SIZE + 2] != _SEQ:
+        return None
+    try:
+        seq = int(line[n - 14:n - 9])
+        crc = int(line[n - 8:n], 16)
+    except ValueError:
+        return None
+    if binascii.crc32(line[:n - 9]) != crc:
+        return None
+    return seq
+
+
+class TextRecord():
+    '''Renders the text data record for one log interval. With journal=True
+       each line is framed with self.seq, which then counts up, and a CRC.'''
+    def __init__(self, journal=False):
+        self._stamp = TimeStamp()
+        self._journal = journal
+        self.seq = 0
+
+    def put_timestamp(self, buf, pos, t):
+        return self._stamp.put(buf, pos, t)
+
+    def render(self, buf, pos, t, temp, pres, hum, ok=True, dist=None, dist_stats=None, ms=None, \
+            sensor=0):
+        '''Render a full data line ending in a newline at buf[pos:] and return
+           the position after it. ms, if given, is the sub-second part of t.
+           temp, pres and hum are the integers from
+           read_compensated_data() (C*100, Pa*256, %RH*1024); ok=False prints
+           them as nan. dist is the mean distance in mm or None. dist_stats,
+           if given, is the stats.IntStats of the distance samples; it is
+           read in place so that no tuple is built for it. sensor is the
+           number of the sensor in a group, from 1, or 0 for a lone sensor.'''
+        start = pos
+        pos = self.put_timestamp(buf, pos, t)
+        if ms is not None:
+            buf[pos] = 0x2E     # '.'
+            pos = put_uint(buf, pos + 1, ms, 3, 0x30)
+        pos = put_bytes(buf, pos, _SEP)
+        pos = put_values(buf, pos, temp, pres, hum, ok, dist)
+        if dist_stats is not None:
+            n = dist_stats.count
+            if n:
+                pos = put_dist_stats(buf, pos, n, dist_stats.min, dist_stats.max, \
+                    dist_stats.std_scaled(10))
+            else:
+                pos = put_dist_stats(buf, pos, 0)
+        if sensor:
+            pos = put_sensor(buf, pos, sensor)
+
+        if self._journal:
+            pos = put_bytes(buf, pos, _SEQ)
+            pos = put_uint(buf, pos, self.seq, 5, 0x30)
+            self.seq = (self.seq + 1) & 0xFFFF
+            crc = binascii.crc32(memoryview(buf)[start:pos])
+            buf[pos] = 0x20
+            pos = put_hex(buf, pos + 1, crc, 8)
+
+        buf[pos] = 0x0A
+        return pos + 1
@@ -0,0 +1,119 @@
+# Single-producer / single-consumer ring buffer of fixed-size record slots.
+#
+# All storage is preallocated. The producer only ever moves head and the
+# consumer only ever moves tail, and one slot is always left empty so that
+# head == tail means empty, so no lock is needed when there is exactly one
+# producer and one consumer (e.g. core 0 sampling and core 1 writing to the
+# SD card). A lock (anything with acquire/release, e.g. from
+# _thread.allocate_lock()) can be given if there might be more.
+#
+# put() never blocks: if the buffer is full the record is dropped and counted.
+#
+# Each record can carry an int tag (e.g. its timestamp) alongside it, which
+# the consumer reads with peek_tag().
+
+from array import array
+
+
+class RingBuffer():
+    def __init__(self, slots, slot_size, lock=None):
+        if slots < 2:
+            raise ValueError("need at least 2 slots")
+        self.slots = slots
+        self.slot_size = slot_size
+        self._buf = bytearray(slots * slot_size)
+        self._mv = memoryview(self._buf)
+        self._len = array('H', [0] * slots)
+        self._tag = array('L', [0] * slots)
+        self._lock = lock
+        self._head = 0      # Next slot to fill - producer only
+        self._tail = 0      # Next slot to read - consumer only
+
+        self.puts = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def count(self):
+        '''Number of records waiting.'''
+        n = self._head - self._tail
+        if n < 0:
+            n += self.slots
+        return n
+
+    def capacity(self):
+        return self.slots - 1
+
+    def put(self, data, tag=0):
+        '''Copy a record, and a non-negative int tag for it, into the next
+           free slot. Returns False (and counts a dropped record) if the
+           buffer is full.'''
+        n = len(data)
+        if n > self.slot_size:
+            raise ValueError("record larger than slot")
+        lock = self._lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            head = self._head
+            nxt = head + 1
+            if nxt == self.slots:
+                nxt = 0
+            if nxt == self._tail:
+                self.dropped += 1
+                return False
+            off = head * self.slot_size
+            self._mv[off:off + n] = data
+            self._len[head] = n
+            self._tag[head] = tag
+            self._head = nxt        # Publish the record
+            self.puts += 1
+            used = self.count()
+            if used > self.high_water:
+                self.high_water = used
+            return True
+        finally:
+            if lock is not None:
+                lock.release()
+
+    # Lets the ring stand in for a log file on the producer side.
+    write = put
+
+    def peek(self):
+        '''A memoryview of the oldest record, or None if empty. It stays valid
+           until release() is called.'''
+        tail = self._tail
+        if tail == self._head:
+            return None
+        off = tail * self.slot_size
+        return self._mv[off:off + self._len[tail]]
+
+    def peek_tag(self):
+        '''The tag of the record returned by peek().'''
+        return self._tag[self._tail]
+
+    def release(self):
+        '''Free the slot returned by peek().'''
+        lock = self._lock
+        if lock is not None:
+            lock.acquire()
+        tail = self._tail + 1
+        if tail == self.slots:
+            tail = 0
+        self._tail = tail
+        if lock is not None:
+            lock.release()
+
+    def get_into(self, buf):
+        '''Copy the oldest record into buf and free its slot. Returns its length,
+           or 0 if the buffer is empty.'''
+        rec = self.peek()
+        if rec is None:
+            return 0
+        n = len(rec)
+        buf[:n] = rec
+        self.release()
+        return n
+
+    def stats_str(self):
+        return "{0} records, high water {1}/{2}, {3} dropped".format( \
+            self.puts, self.high_water, self.capacity(), self.dropped)
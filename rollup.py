@@ -0,0 +1,89 @@
+# Hourly and daily summaries of the data, built up as it is logged.
+#
+# A Rollup keeps an IntStats per channel for the current period (an hour,
+# a day, or any number of seconds) and hands back a CSV line for it as soon
+# as a sample arrives in the next period. Nothing is kept but the stats, and
+# the raw data files are never read back. The line is rendered from the
+# integer sums, so no floats are involved; means are rounded half up.
+#
+# Each line holds the period's start and, for each channel, the number of
+# samples and their min, mean and max:
+#     2023-01-01 14:00:00,180,21.10,21.52,21.90,180,1012.9,1013.1,1013.4,...
+# If the logger is restarted part way through a period that period gets two
+# lines, which can be combined using the counts.
+
+import time
+import recfmt
+import stats
+
+HOUR = 3600
+DAY = 86400
+
+HEADER = "start,temp_n,temp_min_C,temp_mean_C,temp_max_C," \
+    "pres_n,pres_min_hPa,pres_mean_hPa,pres_max_hPa," \
+    "hum_n,hum_min_RH,hum_mean_RH,hum_max_RH," \
+    "dist_n,dist_min_mm,dist_mean_mm,dist_max_mm"
+
+# read_compensated_data() units -> C, hPa, %RH; mm
+_SCALES = (100, 25600, 1024, 1)
+# Decimal places for min and max, and for the mean
+_PLACES = ((2, 2), (2, 2), (1, 1), (0, 1))
+_MAX_LINE = 160
+_STAMP_SEPS = b'-- ::'
+
+
+class Rollup():
+    def __init__(self, period=HOUR):
+        self.period = period
+        self.start = None       # Start of the current period
+        self.temp = stats.IntStats()
+        self.pres = stats.IntStats()
+        self.hum = stats.IntStats()
+        self.dist = stats.IntStats()
+        self._buf = bytearray(_MAX_LINE)
+
+    def add(self, t, temp, pres, hum, dist_stats=None):
+        '''Add a sample at time t (seconds since the epoch). temp, pres and hum
+           are read_compensated_data() integers, or None if there was no
+           reading; dist_stats is an IntStats of the distance samples since
+           the last call, which is merged in. Returns the line for the previous
+           period if t is in a new one, else None.'''
+        line = None
+        if self.start is None or t >= self.start + self.period or t < self.start:
+            if self.start is not None:
+                line = self.close()
+            self.start = t - t % self.period
+        if temp is not None:
+            self.temp.add(temp)
+            self.pres.add(pres)
+            self.hum.add(hum)
+        if dist_stats is not None:
+            self.dist.merge(dist_stats)
+        return line
+
+    def close(self):
+        '''The line for the current period so far. The stats are then reset.'''
+        buf = self._buf
+        pos = 0
+        for i, v in enumerate(time.gmtime(self.start)[:6]):
+            if i:
+                buf[pos] = _STAMP_SEPS[i - 1]
+                pos += 1
+            pos = recfmt.put_uint(buf, pos, v, 4 if i == 0 else 2, 0x30)
+        for i, rs in enumerate((self.temp, self.pres, self.hum, self.dist)):
+            n = rs.count
+            buf[pos] = 0x2C     # ','
+            pos = recfmt.put_uint(buf, pos + 1, n)
+            if n:
+                scale = _SCALES[i]
+                places, mean_places = _PLACES[i]
+                buf[pos] = 0x2C
+                pos = recfmt.put_fixed(buf, pos + 1, rs.min, scale, places)
+                buf[pos] = 0x2C
+                pos = recfmt.put_fixed(buf, pos + 1, rs.total(), n * scale, mean_places)
+                buf[pos] = 0x2C
+                pos = recfmt.put_fixed(buf, pos + 1, rs.max, scale, places)
+            else:
+                pos = recfmt.put_bytes(buf, pos, b',,,')
+            rs.reset()
+        return buf[:pos].decode()
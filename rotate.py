@@ -0,0 +1,154 @@
+# Data file rotation.
+#
+# DataFiles names the data files data_YYYY-MM-DD.txt, then
+# data_YYYY-MM-DD-1.txt, data_YYYY-MM-DD-2.txt ... if a day's file reaches
+# max_bytes, and says when the current file should be closed and the next
+# one opened: at midnight, or once it has grown to max_bytes. The check is
+# a couple of int compares, so it can be made often.
+#
+# When a new file is opened the oldest data files are deleted so that at most
+# keep are left, and while the free space on the card is below min_free
+# bytes. The current file is never deleted. A limit of 0 disables it. A
+# file's timeindex sidecar (.idx) goes with it. companions are the prefix and
+# extension of other files named by day, e.g. ('burst_', '.bin') for
+# burst_YYYY-MM-DD.bin; they are deleted along with the last data file of
+# their day, so they are kept within the same limits.
+#
+# next_file() can be given an accept(path, size) function that says whether
+# an existing file can be appended to, e.g. whether its header matches the
+# records that are going to be written. If not, the next -N file is used.
+
+import os
+import time
+import timeindex
+
+
+class DataFiles():
+    def __init__(self, data_dir, ext='.txt', max_bytes=0, keep=0, min_free=0, companions=(), fs=os):
+        self.data_dir = data_dir
+        self.ext = ext
+        self.companions = companions
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.min_free = min_free
+        self._fs = fs
+
+        self.path = None        # Current file
+        self.size = 0           # Its size when it was opened
+        self._date = None       # (year, month, day) of the current file
+        self._seq = 0
+        self._day_end = 0       # Time at which the current file's day ends
+        self.rotations = 0
+        self.deleted = 0
+
+    def _name(self, date, seq):
+        name = '/data_{0:4d}-{1:02d}-{2:02d}'.format(*date)
+        if seq:
+            name += '-{0}'.format(seq)
+        return self.data_dir + name + self.ext
+
+    def _size(self, path):
+        try:
+            return self._fs.stat(path)[6]
+        except OSError:
+            return -1
+
+    def next_file(self, t, accept=None):
+        '''Choose the file to use from time t (seconds since the epoch) on.
+           Returns (path, size) where size is 0 for a new file. A file for
+           today that is not yet full, and that accept (if given) allows, is
+           appended to.'''
+        lt = time.localtime(t)
+        date = lt[:3]
+        seq = self._seq + 1 if date == self._date else 0
+        while True:
+            path = self._name(date, seq)
+            size = self._size(path)
+            if size < 0:
+                size = 0
+                break
+            if (not self.max_bytes or size < self.max_bytes) and \
+                    (size == 0 or accept is None or accept(path, size)):
+                break
+            seq += 1
+        if self.path is not None:
+            self.rotations += 1
+        self.path = path
+        self.size = size
+        self._date = date
+        self._seq = seq
+        self._day_end = t - (lt[3] * 3600 + lt[4] * 60 + lt[5]) + 86400
+        return path, size
+
+    def due(self, t, written=0):
+        '''True if the current file should be replaced, at time t and with
+           written bytes added to it since it was opened.'''
+        return t >= self._day_end or \
+            (self.max_bytes and self.size + written >= self.max_bytes)
+
+    def free(self):
+        '''Free space on the card in bytes.'''
+        st = self._fs.statvfs(self.data_dir)
+        return st[1] * st[4]    # f_frsize * f_bavail
+
+    def _key(self, name):
+        # data_YYYY-MM-DD[-N].ext -> ('YYYY-MM-DD', N), or None if not ours.
+        if not name.startswith('data_') or not name.endswith(self.ext):
+            return None
+        stem = name[5:len(name) - len(self.ext)]
+        date = stem[:10]
+        seq = stem[11:]
+        if len(date) != 10 or (seq and not seq.isdigit()) or (len(stem) > 10 and stem[10] != '-'):
+            return None
+        return (date, int(seq) if seq else 0)
+
+    def files(self):
+        '''Paths of the data files in the directory, oldest first.'''
+        keyed = []
+        for name in self._fs.listdir(self.data_dir):
+            key = self._key(name)
+            if key is not None:
+                keyed.append((key, name))
+        keyed.sort()
+        return [self.data_dir + '/' + name for key, name in keyed]
+
+    def prune(self):
+        '''Delete the oldest files over the keep and free space limits.
+           Returns the number deleted.'''
+        if not self.keep and not self.min_free:
+            return 0
+        old = [p for p in self.files() if p != self.path]
+        left = len(old) + (1 if self.path is not None else 0)
+        today = self._day(self.path) if self.path is not None else None
+        n = 0
+        for i in range(len(old)):
+            if self.keep and left > self.keep:
+                pass
+            elif self.min_free and self.free() < self.min_free:
+                pass
+            else:
+                break
+            path = old[i]
+            self._fs.remove(path)
+            try:
+                self._fs.remove(timeindex.index_path(path))
+            except OSError:
+                pass
+            day = self._day(path)
+            if day != today and (i + 1 == len(old) or self._day(old[i + 1]) != day):
+                self._remove_companions(day)
+            left -= 1
+            n += 1
+        self.deleted += n
+        return n
+
+    def _day(self, path):
+        # 'YYYY-MM-DD' of a data file
+        return path[len(self.data_dir) + 6:len(self.data_dir) + 16]
+
+    def _remove_companions(self, day):
+        for prefix, ext in self.companions:
+            try:
+                self._fs.remove(self.data_dir + '/' + prefix + day + ext)
+            except OSError:
+                pass
@@ -0,0 +1,164 @@
+# Drift-free timing for the acquisition loop.
+#
+# A Periodic keeps an absolute deadline on the ticks clock and moves it on by
+# exactly one period each time, so time spent reading sensors or writing to
+# the SD card is absorbed by sleeping for less rather than pushing every later
+# sample back. If the work overruns a whole period the missed slots are
+# skipped (and counted) instead of being run back-to-back to catch up.
+#
+# The clock is anything with ticks_ms/ticks_us, ticks_add, ticks_diff and
+# sleep_ms/sleep_us - the ticks module by default, or a fake one in tests.
+
+import ticks
+
+
+class Periodic():
+    def __init__(self, period, phase=0, us=False, clock=ticks):
+        '''period and phase are in ms, or in us if us is True. The first
+           deadline is phase after now.'''
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.period = period
+        self._clock = clock
+        if us:
+            self._now = clock.ticks_us
+            self._sleep = clock.sleep_us
+        else:
+            self._now = clock.ticks_ms
+            self._sleep = clock.sleep_ms
+        self.deadline = clock.ticks_add(self._now(), phase)
+
+        self.overruns = 0   # Number of times wait() found the deadline had passed
+        self.missed = 0     # Number of whole slots skipped
+        self.max_late = 0   # Worst lateness seen
+
+    def remaining(self):
+        '''Time until the current deadline. Negative if it has passed.'''
+        return self._clock.ticks_diff(self.deadline, self._now())
+
+    def due(self):
+        return self.remaining() <= 0
+
+    def wait(self):
+        '''Sleep until the current deadline then move on to the next slot.
+           Returns the number of slots that were missed because the deadline
+           had already passed by a period or more (normally 0).'''
+        remaining = self.remaining()
+        if remaining >= 0:
+            self._sleep(remaining)
+            late = 0
+        else:
+            late = -remaining
+            if late > self.max_late:
+                self.max_late = late
+            self.overruns += 1
+        skip = late // self.period
+        self.missed += skip
+        self.deadline = self._clock.ticks_add(self.deadline, (skip + 1) * self.period)
+        return skip
+
+    def set_period(self, period):
+        '''Change the period, starting with the current slot: the deadline
+           becomes period after the start of the slot rather than the old one.'''
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.deadline = self._clock.ticks_add(self.deadline, period - self.period)
+        self.period = period
+
+    def run_in(self, delay):
+        '''Move the current deadline to delay after now. Later slots follow
+           on from it by period.'''
+        self.deadline = self._clock.ticks_add(self._now(), delay)
+
+    def stats_str(self):
+        return "{0} overruns, {1} missed slots, max late {2}".format( \
+            self.overruns, self.missed, self.max_late)
+
+
+class Task(Periodic):
+    def __init__(self, name, period, callback, phase=0, clock=ticks):
+        super().__init__(period, phase=phase, clock=clock)
+        self.name = name
+        self.callback = callback
+        self.runs = 0
+
+    def advance(self, now):
+        '''Move the deadline on to the next slot after now. Returns the number of
+           slots that were missed because the task was late by a period or more.'''
+        late = self._clock.ticks_diff(now, self.deadline)
+        if late > self.max_late:
+            self.max_late = late
+        skip = late // self.period
+        if skip:
+            self.overruns += 1
+            self.missed += skip
+        self.deadline = self._clock.ticks_add(self.deadline, (skip + 1) * self.period)
+        return skip
+
+    def run(self, now=None):
+        '''Advance to the next slot and call the callback. Returns the number of missed slots.'''
+        if now is None:
+            now = self._now()
+        # Advance first so that a callback can change its own period.
+        missed = self.advance(now)
+        self.runs += 1
+        self.callback()
+        return missed
+
+
+class TaskTable():
+    '''Runs a set of periodic tasks, each with its own period, phase offset
+       and callback. Sleeps until the next task is due, so there are no idle
+       wake-ups between tasks.'''
+    def __init__(self, clock=ticks):
+        self._clock = clock
+        self.tasks = []
+
+    def add(self, name, period, callback, phase=0):
+        '''Add a task. It first runs phase ms from now and then every period ms.
+           Tasks that fall due together run in the order they were added.'''
+        task = Task(name, period, callback, phase=phase, clock=self._clock)
+        self.tasks.append(task)
+        return task
+
+    def remove(self, name):
+        self.tasks = [task for task in self.tasks if task.name != name]
+
+    def get(self, name):
+        for task in self.tasks:
+            if task.name == name:
+                return task
+        return None
+
+    def next_due(self):
+        '''Time in ms until the next task is due. Negative if one is overdue.'''
+        clock = self._clock
+        now = clock.ticks_ms()
+        wait = None
+        for task in self.tasks:
+            remaining = clock.ticks_diff(task.deadline, now)
+            if wait is None or remaining < wait:
+                wait = remaining
+        return wait
+
+    def run_once(self):
+        '''Sleep until the next task is due, then run every task that is due.
+           Returns the total number of slots missed by the tasks that ran.'''
+        clock = self._clock
+        wait = self.next_due()
+        if wait is None:
+            raise RuntimeError("No tasks to run")
+        if wait > 0:
+            clock.sleep_ms(wait)
+
+        now = clock.ticks_ms()
+        missed = 0
+        for task in self.tasks:
+            if clock.ticks_diff(now, task.deadline) >= 0:
+                missed += task.run(now)
+        return missed
+
+    def stats(self):
+        '''Yields a line of timing stats for each task.'''
+        for task in self.tasks:
+            yield "{0}: {1} runs, {2}".format(task.name, task.runs, task.stats_str())
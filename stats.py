@@ -0,0 +1,83 @@
+# Streaming statistics.
+#
+# IntStats keeps the count, mean, min, max and variance of a channel of int
+# samples (the BME280 compensated values, mm) in a few numbers, so the spread
+# of the samples in a log interval is known without keeping the samples
+# themselves. It uses integer maths only, for use on the Pico where each float
+# is a heap object. It keeps sums of the differences from the first sample,
+# so for samples that stay close together the sums stay small ints.
+
+
+def isqrt(n):
+    '''The integer square root of n >= 0, rounded down.'''
+    if n < 2:
+        return n
+    x = n
+    y = (x + 1) // 2
+    while y < x:
+        x = y
+        y = (x + n // x) // 2
+    return x
+
+
+class IntStats():
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._ref = 0       # First sample; the sums are of differences from it
+        self._s = 0
+        self._ss = 0
+
+    def add(self, x):
+        if self.count == 0:
+            self._ref = x
+        d = x - self._ref
+        self._s += d
+        self._ss += d * d
+        self.count += 1
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        '''Add the samples summarised by another IntStats.'''
+        nb = other.count
+        if nb == 0:
+            return
+        if self.count == 0:
+            self._ref = other._ref
+        k = other._ref - self._ref
+        self._s += other._s + nb * k
+        self._ss += other._ss + 2 * k * other._s + nb * k * k
+        self.count += nb
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+
+    def total(self):
+        '''The sum of the samples, so the exact mean is total() / count.'''
+        return self._ref * self.count + self._s
+
+    def mean_round(self):
+        '''The mean rounded half up to an int. 0 when there are no samples.'''
+        if self.count == 0:
+            return 0
+        return self._ref + (2 * self._s + self.count) // (2 * self.count)
+
+    def std_scaled(self, scale=1):
+        '''Sample standard deviation * scale, rounded to an int. 0 when
+           there are fewer than 2 samples.'''
+        n = self.count
+        if n < 2:
+            return 0
+        v = (n * self._ss - self._s * self._s) * scale * scale // (n * (n - 1))
+        r = isqrt(v)
+        if v - r * r > r:
+            r += 1
+        return r
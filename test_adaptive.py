@@ -0,0 +1,32 @@
+import adaptive
+
+_NONE = adaptive.NO_VALUE
+
+
+def test_deadband_skips_small_changes_and_heartbeats():
+    s = adaptive.AdaptiveSampler((10, 5), 1000, 8000, heartbeat=100)
+    assert s.update(0, (2000, 100))         # First sample is always written
+    assert not s.update(10, (2009, 96))
+    assert not s.update(20, (1991, 105))
+    assert s.update(30, (2011, 100))        # Outside temp deadband of 2000
+    assert not s.update(40, (2020, 100))    # Compared with the last written
+    assert s.update(130, (2020, 100))       # Heartbeat
+    assert (s.written, s.skipped) == (3, 3)
+
+
+def test_missing_value_is_a_change():
+    s = adaptive.AdaptiveSampler((10,), 1000, 8000, heartbeat=0)
+    assert s.update(0, (_NONE,))
+    assert not s.update(1, (_NONE,))
+    assert s.update(2, (50,))
+    assert s.update(3, (_NONE,))
+    assert not s.update(10 ** 6, (_NONE,))
+
+
+def test_period_follows_the_data():
+    s = adaptive.AdaptiveSampler((10,), 1000, 8000)
+    periods = []
+    for v in (0, 0, 0, 0, 0, 100, 200, 300, 300):
+        s.update(0, (v,))
+        periods.append(s.period)
+    assert periods == [1000, 2000, 4000, 8000, 8000, 4000, 2000, 1000, 2000]
@@ -0,0 +1,123 @@
+# The data record path (render into the write-behind buffer, flush) must not
+# allocate anything in steady state.
+
+import gc
+import sys
+import tracemalloc
+import binlog
+import logbuf
+import profiling
+import recfmt
+import stats
+
+
+class NullFile():
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def _allocations(step, warmup=100, count=500):
+    # The type names of the objects that step(i) allocates, other than ints,
+    # one per object, as seen in the locals, arguments and return values of
+    # the Python code it runs. An object was allocated in the step if tracemalloc, which is
+    # only started after the warm up, knows where it came from. CPython boxes
+    # every int over 256 where MicroPython doesn't (up to 2**30), so ints
+    # would only be noise. Measuring bytes, even the peak, can't tell a
+    # record allocation from that noise.
+    for i in range(warmup):
+        step(i)
+    found = []
+    seen = {}
+
+    def check(v):
+        if v is not None and not isinstance(v, int) and id(v) not in seen and \
+                tracemalloc.get_object_traceback(v) is not None:
+            seen[id(v)] = v
+            found.append(type(v).__name__)
+
+    def trace(frame, event, arg):
+        for v in frame.f_locals.values():
+            check(v)
+        if event == 'return':
+            check(arg)
+        return trace
+
+    gc.collect()            # Empties CPython's free lists, e.g. of tuples
+    tracemalloc.start()
+    sys.settrace(trace)
+    try:
+        for i in range(warmup, warmup + count):
+            step(i)
+            seen.clear()
+    finally:
+        sys.settrace(None)
+        tracemalloc.stop()
+    return found
+
+
+def _flush_only(allocs, dl):
+    # WriteBehindLog.flush() slices its buffer for the file write: one small
+    # memoryview per SD write, not per record.
+    return set(allocs) <= {'memoryview'} and len(allocs) <= dl.flushes
+
+
+# Timestamps within one minute: TimeStamp only allocates (for localtime())
+# when the minute changes.
+_T0 = 1700000000 - 1700000000 % 60
+
+
+def test_text_record_path_is_allocation_free():
+    dl = logbuf.WriteBehindLog(NullFile(), buf_size=1024, max_records=7)
+    rec = recfmt.TextRecord()
+    prof = profiling.PhaseTimer()
+
+    def step(i):
+        t0 = prof.start()
+        pos = dl.reserve(recfmt.MAX_LINE)
+        end = rec.render(dl.buf, pos, _T0 + i % 60, 2150 - i, 25939200 + 37 * i,
+                         46080 + i, True, 1200 + i % 50, None, i % 1000)
+        t0 = prof.lap(profiling.FORMAT, t0)
+        dl.commit(end)
+        prof.lap(profiling.WRITE, t0)
+
+    assert _flush_only(_allocations(step), dl)
+    assert dl.flushes > 0
+
+
+def test_binary_record_path_is_allocation_free():
+    dl = logbuf.WriteBehindLog(NullFile(), buf_size=512)
+    packer = binlog.RecordPacker()
+
+    def step(i):
+        pos = dl.reserve(packer.size)
+        dl.commit(packer.pack_into(dl.buf, pos, 1700000000 + i, 2150, 25939200, 46080, 1200, \
+            0, None, i % 1000))
+
+    assert _flush_only(_allocations(step), dl)
+    assert dl.flushes > 0
+
+
+def test_distance_stats_are_allocation_free():
+    rs = stats.IntStats()
+    rec = recfmt.TextRecord()
+    buf = bytearray(recfmt.MAX_LINE)
+
+    def step(i):
+        for k in range(10):
+            rs.add(1200 + (i * 7 + k * 13) % 50)
+        rec.render(buf, 0, _T0 + i % 60, 2150, 25939200, 46080, True, rs.mean_round(), rs)
+        rs.reset()
+
+    assert _allocations(step) == []
+
+
+def test_render_matches_text_log_layout():
+    rec = recfmt.TextRecord()
+    buf = bytearray(recfmt.MAX_LINE)
+    end = rec.render(buf, 0, 0, 2150, 101300 * 256, 45 * 1024, True, 1234)
+    assert bytes(buf[19:end]) == \
+        "| {0:4.1f} C {1:6.1f} hPa, {2:4.1f} %, {3}\n".format(
+            21.5, 1013.0, 45.0, " {0:5.0f} mm".format(1234)).encode()
@@ -0,0 +1,94 @@
+import io
+import time
+import binlog
+import recfmt
+import stats
+
+# (t, ms, temp, pres, hum, dist, ok, distance samples, sensor), values as
+# read_compensated_data(). The second record's values are all half way
+# between two tenths. The last two are from the sensors of a group.
+_RECORDS = (
+    (1700000000, 0, 2153, 25938432, 46131, 1234, True, (1230, 1234, 1238), 0),
+    (1700000060, 7, 2125, 25939200, 46336, None, True, (), 0),
+    (1700000090, 500, -412, 25600000, 2048, 3, True, (1, 5), 0),
+    (1700000120, 250, 0, 0, 0, 87, False, (80, 94), 0),
+    (1700003599, 999, 3999, 26214400, 102400, 40000, True, (40000,), 1),
+    (1700003599, 999, 3990, 26214144, 102300, 40000, True, (40000,), 2),
+)
+
+
+def _write_file(stats_on, journal):
+    packer = binlog.RecordPacker(stats=stats_on, journal=journal)
+    f = io.BytesIO()
+    f.write(binlog.header(1970, stats_on, journal))
+    for t, t_ms, temp, pres, hum, dist, ok, samples, sensor in _RECORDS:
+        s = stats.IntStats()
+        for x in samples:
+            s.add(x)
+        status = (0 if ok else binlog.STATUS_ATMOS_FAIL) | sensor << binlog.STATUS_SENSOR_SHIFT
+        f.write(packer.pack(t, temp, pres, hum, dist, status, s, t_ms))
+    f.seek(0)
+    return f
+
+
+def _text_log(stats_on):
+    # The same records as the text data log renders them
+    rec = recfmt.TextRecord()
+    buf = bytearray(recfmt.MAX_LINE)
+    lines = []
+    for t, t_ms, temp, pres, hum, dist, ok, samples, sensor in _RECORDS:
+        s = stats.IntStats()
+        for x in samples:
+            s.add(x)
+        end = rec.render(buf, 0, t, temp, pres, hum, ok, dist, s if stats_on else None, t_ms, sensor)
+        lines.append(bytes(buf[:end - 1]).decode())
+    return lines
+
+
+def test_round_trip_matches_text_log():
+    for stats_on in (False, True):
+        for journal in (False, True):
+            f = _write_file(stats_on, journal)
+            version, epoch_year = binlog.read_header(f)
+            assert binlog.is_journal(version) == journal
+            assert binlog.has_stats(version) == stats_on
+            assert epoch_year == 1970
+            f.seek(0)
+            decoded = [binlog.format_text(r) for r in binlog.read_records(f)]
+            text = _text_log(stats_on)
+            assert len(decoded) == len(_RECORDS)
+            for i in range(len(text)):
+                t = _RECORDS[i][0]
+                # The text log stamps in local time, the decoder in the
+                # RTC's time (offset 0 here), so only compare the rest.
+                assert decoded[i][:19] == time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(t))
+                assert decoded[i][19:] == text[i][19:]
+
+
+def test_csv_and_values():
+    f = _write_file(True, True)
+    recs = list(binlog.read_records(f))
+    assert recs[0] == (1700000000, 2153, 25938432, 46131, 1234, 0, (3, 1230, 1238, 40))
+    t, temp_C, pres_hPa, hum_RH, dist, status, d_stats = binlog.to_units(recs[0])
+    assert (t, temp_C, dist, status) == (1700000000, 21.53, 1234, 0)
+    assert d_stats == (3, 1230, 1238, 4.0)
+    assert recs[1][4] is None and recs[1][5] == binlog.STATUS_NO_DIST
+    assert recs[3][5] & binlog.STATUS_ATMOS_FAIL and binlog.to_units(recs[3])[1] != binlog.to_units(recs[3])[1]
+    line = binlog.format_csv(recs[0])
+    assert line == "2023-11-14 22:13:20.000,21.53,1013.22,45.050,1234,0,3,1230,1238,4.0,"
+    assert len(line.split(',')) == len(binlog.CSV_HEADER.split(','))
+
+    recs = list(binlog.read_records(_write_file(False, False)))
+    assert [r[0] for r in recs][:5] == [1700000000, 1700000060.007, 1700000090.5, 1700000120.25, \
+        1700003599.999]
+    assert binlog.format_csv(recs[4]).startswith("2023-11-14 23:13:19.999,39.99,")
+    assert binlog.format_csv(recs[5]).endswith(",40000,0,,,,,2")
+    assert binlog.format_text(recs[5]).endswith(" mm, sensor=2")
+
+
+def test_torn_journal_record_is_skipped():
+    f = _write_file(False, True)
+    data = bytearray(f.getvalue())
+    data[binlog.HEADER_SIZE + 5] ^= 0xFF
+    recs = list(binlog.read_records(io.BytesIO(bytes(data))))
+    assert [int(r[0]) for r in recs] == [t[0] for t in _RECORDS[1:]]
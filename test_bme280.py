@@ -0,0 +1,153 @@
+# Tests of the BME280 driver against a fake I2C bus. The driver is written
+# for MicroPython, so the few MicroPython-only modules it imports are stood in
+# for here when they are missing.
+
+import math
+import struct
+import sys
+import types
+
+for _name, _attrs in (('micropython', {'const': lambda x: x}), ('uctypes', {'INT8': 0}), \
+        ('smbus2', {'SMBus': None, 'i2c_msg': None})):
+    try:
+        __import__(_name)
+    except ImportError:
+        _m = types.ModuleType(_name)
+        _m.__dict__.update(_attrs)
+        sys.modules[_name] = _m
+
+import PiicoDev_BME280
+
+_CALIB = struct.pack("<HhhHhhhhhhhh", 28485, 26735, 50, 37614, -10529, 3024, 7049, \
+    -84, -7, 9900, -10230, 4285)
+_VALUES = (1404, 24457637, 58860)   # read_compensated_data() from the registers below
+
+
+class FakeI2C():
+    '''A BME280's registers. Records every access, and raises OSError(5) for
+       any of them while fail is True.'''
+    def __init__(self):
+        r = bytearray(256)
+        r[0xD0] = 0x60
+        r[0x88:0x88 + 24] = _CALIB
+        r[0xA1] = 75
+        r[0xE1:0xE8] = bytes([0x6D, 0x01, 0x00, 0x13, 0x22, 0x03, 0x1E])
+        r[0xF7:0xFF] = bytes([0x55, 0x6A, 0x00, 0x7A, 0x12, 0x00, 0x75, 0x30])
+        self.regs = r
+        self.writes = []        # (reg, value)
+        self.reads = []         # (reg, nbytes, method)
+        self.bufs = []          # The buffers passed in, for every access that takes one
+        self.fail = False
+
+    def _check(self):
+        if self.fail:
+            raise OSError(5)
+
+    def readfrom_mem(self, addr, reg, n, *, addrsize=8):
+        self._check()
+        self.reads.append((reg, n, 'readfrom_mem'))
+        return bytes(self.regs[reg:reg + n])
+
+    def readfrom_mem_into(self, addr, reg, buf, *, addrsize=8):
+        self._check()
+        self.reads.append((reg, len(buf), 'readfrom_mem_into'))
+        self.bufs.append(buf)
+        buf[:] = self.regs[reg:reg + len(buf)]
+
+    def writeto_mem(self, addr, reg, buf, *, addrsize=8):
+        self._check()
+        self.writes.append((reg, buf[0]))
+        self.bufs.append(buf)
+        self.regs[reg] = buf[0]
+
+
+def _sensor(**options):
+    i2c = FakeI2C()
+    errors = []
+    s = PiicoDev_BME280.PiicoDev_BME280(i2c=i2c, **options)
+    s.on_error = errors.append
+    i2c.writes.clear()
+    i2c.reads.clear()
+    i2c.bufs.clear()
+    return s, i2c, errors
+
+
+def _is_nan(values):
+    return len(values) == 3 and all(math.isnan(v) for v in values)
+
+
+def test_forced_read():
+    s, i2c, errors = _sensor()
+    assert s.read_compensated_data() == _VALUES
+    assert [reg for reg, v in i2c.writes] == [0xF2, 0xF4]
+    assert errors == []
+
+
+def test_bus_error_in_trigger_is_reported_not_raised():
+    s, i2c, errors = _sensor()
+    i2c.fail = True
+    s.trigger()
+    assert len(errors) == 1
+    i2c.fail = False
+    assert _is_nan(s.collect())
+    assert len(errors) == 1     # Reported once, by trigger()
+    # The next conversion works again.
+    s.trigger()
+    assert s.collect() == _VALUES
+
+
+def test_bus_error_in_collect_and_its_fallback_trigger():
+    s, i2c, errors = _sensor()
+    i2c.fail = True
+    assert _is_nan(s.collect())         # No trigger() first
+    assert len(errors) == 1
+    s.trigger()
+    assert _is_nan(s.collect())
+    assert _is_nan(s.read_compensated_data())
+    assert len(errors) == 3
+
+
+def test_normal_mode_config_and_reads(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(PiicoDev_BME280, 'sleep_ms', sleeps.append)
+    i2c = FakeI2C()
+    s = PiicoDev_BME280.PiicoDev_BME280(i2c=i2c, normal=True, standby=PiicoDev_BME280._STANDBY_500, \
+        iir=PiicoDev_BME280._IIR_FILTER_4, temp_oversamp=PiicoDev_BME280._OVERSAMPLING_x2)
+    # Reset, then config while still asleep, then ctrl_hum before ctrl_meas
+    # starts normal mode.
+    assert i2c.writes == [(0xE0, 0xB6), (0xF5, 4 << 5 | 2 << 2), (0xF2, 1), (0xF4, 2 << 5 | 1 << 2 | 3)]
+    # Waited for the first measurement: 1.25 + 2.3 * (4 + 2 + 2) + 2 * 0.575 = 20.8 ms
+    assert sleeps[-1] == 21
+    assert s.conversion_ms() == 0
+
+    i2c.writes.clear()
+    i2c.reads.clear()
+    del sleeps[:]
+    assert s.read_compensated_data() == _VALUES
+    s.trigger()
+    assert s.collect() == _VALUES
+    assert i2c.writes == [] and sleeps == []
+    assert i2c.reads == [(0xF7, 8, 'readfrom_mem_into')] * 2
+
+
+def test_forced_mode_does_not_wait_at_start(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(PiicoDev_BME280, 'sleep_ms', sleeps.append)
+    i2c = FakeI2C()
+    PiicoDev_BME280.PiicoDev_BME280(i2c=i2c, standby=PiicoDev_BME280._STANDBY_1000, \
+        iir=PiicoDev_BME280._IIR_FILTER_16)
+    assert sleeps == [3]        # Just the reset
+    assert (0xF5, 4 << 2) in i2c.writes     # No standby time in forced mode
+
+
+def test_reads_use_the_preallocated_buffers():
+    for options in ({}, {'normal': True}):
+        s, i2c, errors = _sensor(**options)
+        for i in range(3):
+            assert s.read_compensated_data() == _VALUES
+            s.trigger()
+            assert s.collect() == _VALUES
+        assert s.read_raw_data() is not None
+        assert {m for reg, n, m in i2c.reads} == {'readfrom_mem_into'}
+        assert all(b is s._data or b is s._wbuf for b in i2c.bufs)
+        assert sum(b is s._data for b in i2c.bufs) == len(i2c.reads) == 7
@@ -0,0 +1,89 @@
+import random
+import sys
+import pytest
+import bme280comp
+
+
+def _reference(tc, pc, hc, raw_t, raw_p, raw_h):
+    # PiicoDev_BME280.read_compensated_data() before the calibration terms
+    # were precomputed, with self._*_calib passed in.
+    var1 = ((raw_t>>3)-(tc[0]<<1))*(tc[1]>>11)
+    var2 = (raw_t >> 4)-tc[0]
+    var2 = var2*((raw_t>>4)-tc[0])
+    var2 = ((var2>>12)*tc[2])>>14
+    t_fine = var1+var2
+    temp = (t_fine*5+128)>>8
+
+    var1 = t_fine-128000
+    var2 = var1*var1*pc[5]
+    var2 = var2 + ((var1*pc[4])<<17)
+    var2 = var2 + (pc[3]<<35)
+    var1 = (((var1*var1*pc[2])>>8)
+            + ((var1*pc[1])<<12))
+    var1 = (((1<<47) + var1)*pc[0])>>33
+    if var1 == 0:
+        pres = 0
+    else:
+        p = ((((1048576-raw_p)<<31)-var2)*3125)//var1
+        var1 = (pc[8]*(p>>13)*(p>>13))>>25
+        var2 = (pc[7]*p)>>19
+        pres = ((p + var1 + var2)>>8) + (pc[6]<<4)
+
+    h = t_fine-76800
+    h1 = ((((raw_h<<14) - (hc[3]<<20)
+            - (hc[4]*h)) + 16384)>>15)
+    h2 = (((((((h*hc[5])>>10)
+            * (((h*hc[2])>>11) + 32768))>>10)
+                + 2097152)*hc[1] + 8192)>>14)
+    h = (h1 * h2)
+    h = h - (((((h>>15)*(h>>15))>>7)*hc[0])>>4)
+    h = 0 if h < 0 else h
+    h = 419430400 if h>419430400 else h
+    humi = h>>12
+    return (temp, pres, humi)
+
+
+# The datasheet's typical values, and a part read from a PiicoDev board.
+_CALIBS = (
+    ([27504, 26435, -1000], [36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000],
+        [75, 362, 0, 313, 0, 30]),
+    ([28485, 26735, 50], [37614, -10529, 3024, 7049, -84, -7, 9900, -10230, 4285],
+        [75, 365, 0, 314, 50, 30]),
+)
+
+
+def _samples(n, seed):
+    rnd = random.Random(seed)
+    return ([rnd.randint(380000, 620000) for i in range(n)],
+            [rnd.randint(200000, 500000) for i in range(n)],
+            [rnd.randint(20000, 40000) for i in range(n)])
+
+
+def test_compensate_is_bit_exact():
+    raw_t, raw_p, raw_h = _samples(3000, 1)
+    for tc, pc, hc in _CALIBS:
+        k = bme280comp.precompute(tc, pc, hc)
+        for i in range(len(raw_t)):
+            assert bme280comp.compensate(k, raw_t[i], raw_p[i], raw_h[i]) == \
+                _reference(tc, pc, hc, raw_t[i], raw_p[i], raw_h[i])
+
+
+def _batch_case():
+    raw_t, raw_p, raw_h = _samples(500, 2)
+    tc, pc, hc = _CALIBS[1]
+    expected = [_reference(tc, pc, hc, raw_t[i], raw_p[i], raw_h[i]) for i in range(len(raw_t))]
+    return bme280comp.precompute(tc, pc, hc), raw_t, raw_p, raw_h, expected
+
+
+def test_batch_without_numpy_is_bit_exact(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    k, raw_t, raw_p, raw_h, expected = _batch_case()
+    temp, pres, hum = bme280comp.compensate_batch(k, raw_t, raw_p, raw_h)
+    assert list(zip(temp, pres, hum)) == expected
+
+
+def test_batch_with_numpy_is_bit_exact():
+    np = pytest.importorskip('numpy')
+    k, raw_t, raw_p, raw_h, expected = _batch_case()
+    temp, pres, hum = bme280comp.compensate_batch(k, np.array(raw_t), raw_p, raw_h)
+    assert [(int(t), int(p), int(h)) for t, p, h in zip(temp, pres, hum)] == expected
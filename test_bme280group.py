@@ -0,0 +1,85 @@
+import math
+import bme280group
+from test_scheduler import FakeClock
+
+
+class FakeSensor():
+    '''Triggers and collects on the fake clock, sleeping if collected early.'''
+    def __init__(self, clock, conv_ms, value):
+        self._clock = clock
+        self._conv_ms = conv_ms
+        self._value = value
+        self._ready_at = None
+        self.triggers = 0
+        self.collects = 0
+        self.fail = False
+
+    def conversion_ms(self):
+        return self._conv_ms
+
+    def trigger(self):
+        self.triggers += 1
+        if self.fail:
+            raise OSError(5)
+        self._ready_at = self._clock.ticks_add(self._clock.ticks_ms(), self._conv_ms)
+        return self._ready_at
+
+    def collect(self):
+        self.collects += 1
+        if self.fail:
+            raise OSError(5)
+        wait = self._clock.ticks_diff(self._ready_at, self._clock.ticks_ms())
+        if wait > 0:
+            self._clock.sleep_ms(wait)
+        return self._value
+
+
+def test_group_waits_once_for_the_slowest():
+    clock = FakeClock(1000)
+    a = FakeSensor(clock, 10, (2100, 25000000, 40000))
+    b = FakeSensor(clock, 40, (2200, 25100000, 41000))
+    group = bme280group.BME280Group([a, b], clock=clock)
+    assert group.conversion_ms() == 40
+    assert group.read_compensated_data() == [a._value, b._value]
+    assert clock.sleeps == [40]
+    assert (a.triggers, b.triggers) == (1, 1)
+
+
+def test_split_phase_collect_does_not_sleep_when_done():
+    clock = FakeClock((1 << 30) - 5)    # Across the ticks wrap-around
+    a = FakeSensor(clock, 20, (1, 2, 3))
+    b = FakeSensor(clock, 9, (4, 5, 6))
+    group = bme280group.BME280Group([a, b], clock=clock)
+    ready = group.trigger()
+    assert ready == clock.ticks_add(clock.ticks_ms(), 20)
+    clock.t += 25
+    assert group.collect() == [(1, 2, 3), (4, 5, 6)]
+    assert clock.sleeps == []
+
+
+def test_a_failing_sensor_gives_nans_and_the_rest_are_read():
+    clock = FakeClock(1000)
+    a = FakeSensor(clock, 10, (1, 2, 3))
+    b = FakeSensor(clock, 30, (4, 5, 6))
+    group = bme280group.BME280Group([a, b], clock=clock)
+    errors = []
+    group.on_error = errors.append
+    b.fail = True
+    assert group.trigger() == clock.ticks_add(1000, 10)
+    values = group.collect()
+    assert values[0] == (1, 2, 3) and all(math.isnan(v) for v in values[1])
+    assert b.collects == 0 and len(errors) == 1     # Not collected after a failed trigger
+
+    # Failing in collect() only
+    b.fail = False
+    group.trigger()
+    b.fail = True
+    values = group.collect()
+    assert all(math.isnan(v) for v in values[1]) and len(errors) == 2
+
+    # Nothing to wait for when every sensor fails
+    a.fail = True
+    del clock.sleeps[:]
+    values = group.read_compensated_data()
+    assert all(math.isnan(v) for x in values for v in x)
+    assert clock.sleeps == [] and len(errors) == 4
@@ -0,0 +1,41 @@
+import io
+import binlog
+import burst
+
+
+def _feed(cap, dists, t0=0, step=20):
+    '''Add samples; returns the indexes at which bursts completed and the
+       last burst, decoded.'''
+    done = []
+    last = None
+    for i, d in enumerate(dists):
+        if cap.add(t0 + i * step, d, 1000 + i, 250):
+            done.append(i)
+            n = cap.render()
+            [last] = burst.read_bursts(io.BytesIO(bytes(cap.buf[:n])))
+    return done, last
+
+
+def test_step_trigger_captures_pre_and_post():
+    cap = burst.BurstCapture(pre=3, post=2, max_step=50)
+    dists = [100, 101, 102, 103, 104, 200, 201, None, 203, 204]
+    done, (t, trig, samples) = _feed(cap, dists)
+    assert done == [7]
+    assert trig == 3
+    assert samples == [(-60, 102), (-40, 103), (-20, 104), (0, 200), (20, 201), (40, None)]
+    # Re-armed: the next step fires again.
+    assert _feed(cap, [204, 100, 100, 100], t0=1000)[0] == [3]
+
+
+def test_threshold_crossing_and_short_pre():
+    cap = burst.BurstCapture(pre=10, post=1, threshold=500)
+    done, (t, trig, samples) = _feed(cap, [490, 495, 505, 506, 507])
+    assert done == [3]
+    assert trig == 2
+    assert [d for ms, d in samples] == [490, 495, 505, 506]
+    assert t == 1002.25 + binlog.epoch_offset(1970)
+
+
+def test_no_trigger_while_collecting_post():
+    cap = burst.BurstCapture(pre=1, post=3, max_step=10)
+    assert _feed(cap, [0, 100, 0, 100, 0, 0])[0] == [4]
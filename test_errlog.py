@@ -0,0 +1,100 @@
+import io
+import errorlog
+from test_scheduler import FakeClock
+
+
+class CountingFile(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+
+def _fmt(s):
+    return s.encode() + b'\n'
+
+
+def _lines(f):
+    return f.getvalue().decode().splitlines()
+
+
+def test_repeats_are_summarised():
+    clock = FakeClock()
+    f = CountingFile()
+    e = errorlog.ErrorLog(f, _fmt, clock=clock)
+    assert e.log("sensor failed")
+    for i in range(50):
+        e.log("sensor failed")
+    e.log("sensor back")
+    assert _lines(f) == ["sensor failed", " - (last message repeated 50 times)", "sensor back"]
+    assert e.suppressed == 50
+
+
+def test_long_run_of_repeats_is_summarised_by_poll():
+    clock = FakeClock()
+    f = CountingFile()
+    e = errorlog.ErrorLog(f, _fmt, summary_ms=60000, clock=clock)
+    e.log("sensor failed")
+    for i in range(30):
+        clock.t += 2000
+        e.log("sensor failed")
+    assert _lines(f) == ["sensor failed"]
+    clock.t += 2000
+    e.poll()
+    assert _lines(f) == ["sensor failed", " - (last message repeated 30 times)"]
+
+
+def test_rate_limit_holds_lines_back():
+    clock = FakeClock()
+    f = CountingFile()
+    e = errorlog.ErrorLog(f, _fmt, burst=2, min_interval_ms=1000, clock=clock)
+    assert e.log("a") and e.log("b")
+    assert not e.log("c")
+    assert not e.log("d")
+    assert f.flushes == 2
+    e.poll()
+    assert f.flushes == 2
+    clock.t += 1000
+    e.poll()
+    assert f.flushes == 3 and _lines(f) == ["a", "b", "c", "d"]
+
+
+def test_full_buffer_drops_and_reports():
+    clock = FakeClock()
+    f = CountingFile()
+    e = errorlog.ErrorLog(f, _fmt, buf_size=64, burst=1, min_interval_ms=1000, clock=clock)
+    e.log("first")
+    for i in range(20):
+        e.log("message {0:04d}".format(i))
+    assert e.dropped > 0
+    clock.t += 1000
+    e.log("last")
+    e.flush()
+    lines = _lines(f)
+    assert lines[-2:] == ["?? {0} error log line(s) dropped".format(e.dropped), "last"]
+    assert len(lines) == 1 + 20 - e.dropped + 2
+
+
+def test_next_due():
+    clock = FakeClock()
+    f = CountingFile()
+    e = errorlog.ErrorLog(f, _fmt, burst=1, min_interval_ms=2000, summary_ms=60000, clock=clock)
+    assert e.next_due() is None
+    e.log("a")
+    assert e.next_due() is None         # Written straight away
+    e.log("b")
+    assert e.next_due() == 2000         # Waiting for a token
+    clock.t += 2500
+    assert e.next_due() == -500
+    e.poll()
+    assert e.next_due() is None
+    e.log("b")
+    clock.t += 1000
+    assert e.next_due() == 59000        # The repeat summary
+    e.poll()
+    clock.t += 59000
+    e.poll()
+    assert e.next_due() is None
+    assert _lines(f) == ["a", "b", " - (last message repeated 1 times)"]
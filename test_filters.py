@@ -0,0 +1,53 @@
+import random
+import filters
+
+
+def _median(window):
+    s = sorted(window)
+    n = len(s)
+    if n & 1:
+        return s[n // 2]
+    return (s[n // 2 - 1] + s[n // 2]) // 2
+
+
+def test_median_filter_matches_sorted_window():
+    rng = random.Random(1)
+    for size in (1, 2, 3, 8, 15):
+        mf = filters.MedianFilter(size)
+        samples = []
+        for i in range(300):
+            x = rng.randint(0, 50) if i % 7 else rng.randint(-1000, 5000)
+            samples.append(x)
+            assert mf.update(x) == _median(samples[-size:])
+
+
+def test_outlier_filter_rejects_spikes_but_follows_steps():
+    of = filters.OutlierFilter(window=5, max_dev=50)
+    readings = [1000, 1002, 998, 1001, 3000, 999, 10, 1000]
+    out = [of.update(x) for x in readings]
+    assert out == [1000, 1002, 998, 1001, None, 999, None, 1000]
+    assert of.rejected == 2
+
+    # A genuine step is accepted once it is the majority of the window
+    out = [of.update(1500) for i in range(5)]
+    assert out[:2] == [None, None]
+    assert out[-1] == 1500
+
+
+def test_outlier_filter_relative_limit():
+    of = filters.OutlierFilter(window=3, max_dev=10, rel_dev=0.1, min_samples=3)
+    for x in (2000, 2010, 1990):
+        of.update(x)
+    assert of.update(2150) == 2150      # within 10% of the median
+    assert of.update(2600) is None
+
+
+def test_median_filter_worst_case_slides():
+    # Each new sample goes to the other end of the sorted order from the one
+    # it replaces, so every update slides the whole window.
+    mf = filters.MedianFilter(7)
+    samples = []
+    for i in range(50):
+        x = 1000 * (i % 2) + i
+        samples.append(x)
+        assert mf.update(x) == _median(samples[-7:])
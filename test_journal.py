@@ -0,0 +1,88 @@
+import binascii
+import binlog
+import journal
+import recfmt
+
+
+def _write_bin(path, n, stats=False):
+    packer = binlog.RecordPacker(stats=stats, journal=True)
+    with open(path, 'wb') as f:
+        f.write(binlog.header(2000, stats, True))
+        for i in range(n):
+            f.write(packer.pack(1000 + i, 2000, 101300 * 256, 45 * 1024, 500 + i))
+    return packer
+
+
+def test_binary_torn_record_is_marked(tmp_path):
+    path = str(tmp_path / 'data_2024-01-01.bin')
+    packer = _write_bin(path, 10)
+    with open(path, 'ab') as f:
+        f.write(packer.pack(2000, 1, 2, 3, 4)[:7])      # Power cut
+    assert journal.recover(path) == (9, 7)
+    # Records appended after recovery are still aligned; the torn one is skipped.
+    with open(path, 'ab') as f:
+        f.write(packer.pack(3000, 2000, 101300 * 256, 45 * 1024, 600))
+    with open(path, 'rb') as f:
+        recs = list(binlog.read_records(f))
+    assert [r[0] for r in recs] == list(range(1000, 1010)) + [3000]
+    assert journal.recover(path) == (11, 0)
+
+
+def test_binary_corrupt_records_are_skipped(tmp_path):
+    path = str(tmp_path / 'data_2024-01-01.bin')
+    _write_bin(path, 5, stats=True)
+    with open(path, 'r+b') as f:
+        f.seek(-3, 2)
+        f.write(b'\x00\x00\x00')
+    assert journal.recover(path) == (3, 0)
+    with open(path, 'rb') as f:
+        assert len(list(binlog.read_records(f))) == 4
+
+
+def test_text_torn_line_is_marked(tmp_path):
+    path = str(tmp_path / 'data_2024-01-01.txt')
+    rec = recfmt.TextRecord(journal=True)
+    buf = bytearray(recfmt.MAX_LINE)
+    with open(path, 'wb') as f:
+        for i in range(300):       # More than the recovery scan
+            end = rec.render(buf, 0, 1000 + i, 2000, 101300 * 256, 45 * 1024, True, i)
+            assert recfmt.check_line(bytes(buf[:end])) == i
+            f.write(buf[:end])
+        f.write(buf[:end - 5])
+    assert journal.recover(path) == (299, end - 5)
+    with open(path, 'rb') as f:
+        lines = f.read().split(b'\n')
+    assert lines[-1] == b'' and recfmt.check_line(lines[-2]) is None
+    assert journal.recover(path) == (299, 0)
+
+
+def test_check_line_rejects_damage():
+    rec = recfmt.TextRecord(journal=True)
+    rec.seq = 65535
+    buf = bytearray(recfmt.MAX_LINE)
+    end = rec.render(buf, 0, 0, 2150, 101300 * 256, 45 * 1024, True, 1234)
+    line = bytes(buf[:end])
+    assert line.endswith(b' #65535 ' + b'%08x\n' % binascii.crc32(line[:-10]))
+    assert rec.seq == 0
+    assert recfmt.check_line(line) == 65535
+    assert recfmt.check_line(line.replace(b'21.5', b'21.6')) is None
+    assert recfmt.check_line(b'no suffix here\n') is None
+
+
+def test_binary_torn_record_without_journal_is_not_padded(tmp_path):
+    path = str(tmp_path / 'data_2024-01-01.bin')
+    packer = binlog.RecordPacker()
+    with open(path, 'wb') as f:
+        f.write(binlog.header(2000))
+        for i in range(3):
+            f.write(packer.pack(1000 + i, 2000, 101300 * 256, 45 * 1024, 500 + i))
+        f.write(packer.pack(2000, 1, 2, 3, 4)[:7])      # Power cut
+    assert journal.recover(path) == (None, 7)
+    # Nothing to mark a padded record as bad with, so the file is left as it
+    # is and decodes to its whole records.
+    with open(path, 'rb') as f:
+        data = f.read()
+        f.seek(0)
+        recs = list(binlog.read_records(f))
+    assert len(data) == binlog.HEADER_SIZE + 3 * packer.size + 7
+    assert [r[0] for r in recs] == [1000, 1001, 1002]
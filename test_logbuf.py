@@ -0,0 +1,92 @@
+import logbuf
+from test_scheduler import FakeClock
+
+
+class FakeFile():
+    '''Records what is written and how many times it is flushed.'''
+    def __init__(self):
+        self.data = bytearray()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, b):
+        self.data += b
+        self.writes += 1
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_flushes_when_byte_limit_reached():
+    f = FakeFile()
+    log = logbuf.WriteBehindLog(f, buf_size=64, max_bytes=20, max_age_ms=0, clock=FakeClock())
+    log.write('0123456789')
+    assert f.writes == 0 and log.pending() == 10
+    log.write(b'abcdefghij')
+    assert f.data == b'0123456789abcdefghij' and f.flushes == 1
+    assert log.pending() == 0
+
+
+def test_flushes_before_a_record_that_would_not_fit():
+    f = FakeFile()
+    log = logbuf.WriteBehindLog(f, buf_size=16, max_age_ms=0, clock=FakeClock())
+    log.write('0123456789')
+    log.write('abcdefghij')
+    assert f.data == b'0123456789' and log.pending() == 10
+
+
+def test_flushes_on_record_count():
+    f = FakeFile()
+    log = logbuf.WriteBehindLog(f, buf_size=256, max_age_ms=0, max_records=3, clock=FakeClock())
+    for i in range(7):
+        log.write('line{}\n'.format(i))
+    assert f.writes == 2 and log.pending() == 6
+    assert (log.records, log.flushes) == (7, 2)
+
+
+def test_age_limit_is_applied_by_write_and_poll():
+    clock = FakeClock()
+    f = FakeFile()
+    log = logbuf.WriteBehindLog(f, buf_size=256, max_age_ms=1000, clock=clock)
+    log.write('a')
+    clock.t += 999
+    log.poll()
+    assert f.writes == 0
+    clock.t += 1
+    log.poll()
+    assert f.data == b'a'
+    log.poll()
+    assert f.writes == 1    # Nothing waiting, nothing written
+
+    # The age runs from the oldest record, not the newest
+    log.write('b')
+    clock.t += 600
+    log.write('c')
+    assert f.writes == 1
+    clock.t += 400
+    log.write('d')
+    assert f.data == b'abcd'
+
+
+def test_oversize_write_goes_straight_through_in_order():
+    f = FakeFile()
+    log = logbuf.WriteBehindLog(f, buf_size=8, max_age_ms=0, clock=FakeClock())
+    log.write('ab')
+    log.write('0123456789')
+    assert f.data == b'ab0123456789' and f.writes == 2
+    assert log.pending() == 0 and log.bytes_written == 12
+
+
+def test_no_auto_flush_waits_for_poll():
+    f = FakeFile()
+    log = logbuf.WriteBehindLog(f, buf_size=64, max_records=1, max_age_ms=0, clock=FakeClock())
+    log.auto_flush = False
+    log.write('x')
+    assert f.writes == 0 and log.due()
+    log.poll()
+    assert f.data == b'x' and not log.due()
+
+
+def test_capacity():
+    log = logbuf.WriteBehindLog(FakeFile(), buf_size=100, clock=FakeClock())
+    assert log.capacity == 100
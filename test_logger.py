@@ -0,0 +1,206 @@
+# Tests of DataLogger's task set-up, run on a fake clock. The logger is
+# written for MicroPython, so the MicroPython-only modules it (and the
+# drivers it imports) need are stood in for here when they are missing.
+
+import errno
+import io
+import os
+import sys
+import time
+import types
+
+for _name, _attrs in (('micropython', {'const': lambda x: x}), ('uctypes', {'INT8': 0}), \
+        ('smbus2', {'SMBus': None, 'i2c_msg': None}), \
+        ('uerrno', {'ENOENT': errno.ENOENT, 'EINVAL': errno.EINVAL}), \
+        ('rp2', {'asm_pio': lambda **kw: lambda f: f, 'PIO': types.SimpleNamespace(OUT_LOW=0)})):
+    try:
+        __import__(_name)
+    except ImportError:
+        _m = types.ModuleType(_name)
+        _m.__dict__.update(_attrs)
+        sys.modules[_name] = _m
+
+import pytest
+import binlog
+import bme280group
+import burst
+import logger
+import rotate
+import scheduler
+import ticks
+import timebase
+from test_bme280group import FakeSensor as FakeGroupSensor
+from test_scheduler import FakeClock
+
+_T0 = 1700000000
+_HOUR = 3600000
+
+
+class FakeSensor():
+    def read_compensated_data(self):
+        return (2150, 25939200, 46080)
+
+
+class FakeLed():
+    def on(self):
+        pass
+
+    def off(self):
+        pass
+
+
+class Stop(Exception):
+    pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(1000)
+    for name in ('ticks_ms', 'ticks_us', 'ticks_add', 'ticks_diff', 'sleep_ms', 'sleep_us'):
+        monkeypatch.setattr(ticks, name, getattr(clock, name))
+    return clock
+
+
+def _logger(clock, **options):
+    dl = logger.DataLogger(**options)
+    dl.atmos_sensor = FakeSensor()
+    dl.led = FakeLed()
+    # The RTC follows the fake clock, so the timebase finds its ticks.
+    dl.timebase = timebase.Timebase(wall=lambda: _T0 + clock.t // 1000)
+    dl.datalog.set_file(io.BytesIO())
+    dl.errlog = io.BytesIO()
+    dl.errors._log.set_file(dl.errlog)
+    return dl
+
+
+def _run(dl, clock, ms):
+    '''Run dl.run() for ms of fake time, or carry on running its tasks if it
+       has been started already. Returns the number of wakeups.'''
+    run = dl._run_tasks if dl.tasks.tasks else dl.run
+    end = clock.t + ms
+    tasks = dl.tasks
+    wakeups = [0]
+
+    def counted():
+        if clock.t + dl.tasks.next_due() >= end:
+            raise Stop()
+        wakeups[0] += 1
+        return scheduler.TaskTable.run_once(tasks)
+
+    dl.tasks.run_once = counted
+    with pytest.raises(Stop):
+        run()
+    return wakeups[0]
+
+
+def test_no_flush_task_without_write_behind(clock):
+    dl = _logger(clock)
+    _run(dl, clock, _HOUR)
+    assert dl.tasks.get('flush') is None
+    assert dl.tasks.get('atmos').runs == 180
+    assert dl.datalog.records == dl.datalog.flushes == 180
+
+
+def test_flush_task_runs_at_the_age_limit(clock):
+    dl = _logger(clock, write_behind=True, flush_age_ms=300000)
+    _run(dl, clock, _HOUR)
+    flush = dl.tasks.get('flush')
+    assert flush.period == 300000 and flush.runs == 11
+    assert dl.datalog.flushes == 11     # The age limit, checked by each record or the task
+
+    dl = _logger(clock, write_behind=True, flush_age_ms=0)
+    _run(dl, clock, _HOUR)
+    assert dl.tasks.get('flush') is None
+
+
+def test_idle_logger_only_wakes_for_its_tasks(clock):
+    dl = _logger(clock)
+    wakeups = _run(dl, clock, _HOUR)
+    assert dl.tasks.get('errlog').runs == 0
+    assert wakeups <= dl.tasks.get('atmos').runs + dl.tasks.get('timebase').runs
+
+
+def test_errlog_task_wakes_for_held_back_lines(clock):
+    dl = _logger(clock)
+    _run(dl, clock, 1000)
+    for i in range(8):
+        dl.sensor_error("failure {0}".format(i))
+    assert dl.errors.next_due() > 0     # Over the burst limit, so some are held back
+    _run(dl, clock, 60000)
+    lines = dl.errlog.getvalue().decode().splitlines()
+    assert [l[-9:] for l in lines if 'failure' in l] == ["failure {0}".format(i) for i in range(8)]
+    assert dl.errors.next_due() is None
+    runs = dl.tasks.get('errlog').runs
+    assert 0 < runs <= 4
+    _run(dl, clock, _HOUR)
+    assert dl.tasks.get('errlog').runs == runs
+
+
+def test_bursts_go_to_the_file_for_their_day(clock, tmp_path):
+    d = str(tmp_path)
+    dl = _logger(clock, burst_capture=burst.BurstCapture(pre=1, post=1, max_step=100))
+    dl.sd = True
+    dl.data_dir = d
+    dl.files = rotate.DataFiles(d, keep=1, companions=(('burst_', '.bin'),))
+    dl.files.next_file(int(time.mktime((2024, 3, 1, 12, 0, 0, 0, 0, -1))))
+    for day in (1, 1, 2):
+        t = int(time.mktime((2024, 3, day, 12, 0, 0, 0, 0, -1)))
+        for dist in (100, 300, 300):
+            dl.burst.add(clock.ticks_ms(), dist, t)
+        dl.write_burst()
+    assert sorted(os.listdir(d)) == ['burst_2024-03-01.bin', 'burst_2024-03-02.bin']
+    dl.burst_file.close()
+    with open(d + '/burst_2024-03-01.bin', 'rb') as f:
+        assert len(list(burst.read_bursts(f))) == 2
+
+
+def test_binary_file_with_a_partial_record_is_not_appended_to(clock, tmp_path):
+    dl = _logger(clock, data_format='binary')
+    path = str(tmp_path / 'data_2024-03-01.bin')
+    with open(path, 'wb') as f:
+        f.write(dl._header + bytes(dl._packer.size * 2))
+    assert dl._can_append(path, binlog.HEADER_SIZE + dl._packer.size * 2)
+    with open(path, 'ab') as f:
+        f.write(bytes(5))
+    assert not dl._can_append(path, binlog.HEADER_SIZE + dl._packer.size * 2 + 5)
+
+
+def _group_logger(clock, **options):
+    dl = _logger(clock, **options)
+    a = FakeGroupSensor(clock, 10, (2150, 25939200, 46080))
+    b = FakeGroupSensor(clock, 40, (1990, 25913600, 51200))
+    dl.atmos_sensor = bme280group.BME280Group([a, b], clock=clock)
+    dl.atmos_sensor.on_error = dl.sensor_error
+    out = io.BytesIO()
+    dl.datalog.set_file(out)
+    return dl, b, out
+
+
+def test_group_logs_a_record_per_sensor(clock):
+    dl, b, out = _group_logger(clock)
+    _run(dl, clock, 30000)
+    b.fail = True
+    _run(dl, clock, 30000)
+    lines = out.getvalue().decode().splitlines()
+    assert [l[l.index('|'):] for l in lines] == [
+        "| 21.5 C 1013.3 hPa, 45.0 %,  ***** mm, sensor=1",
+        "| 19.9 C 1012.3 hPa, 50.0 %,  ***** mm, sensor=2",
+        "| 21.5 C 1013.3 hPa, 45.0 %,  ***** mm, sensor=1",
+        "| 19.9 C 1012.3 hPa, 50.0 %,  ***** mm, sensor=2",
+        "| 21.5 C 1013.3 hPa, 45.0 %,  ***** mm, sensor=1",
+        "|  nan C    nan hPa,  nan %,  ***** mm, sensor=2",
+    ]
+    assert dl.tasks.get('trigger').runs == dl.tasks.get('atmos').runs == 3
+    assert "BME280 2 in group: 5" in dl.errlog.getvalue().decode()
+
+
+def test_group_binary_records_decode_with_their_sensor(clock):
+    dl, b, out = _group_logger(clock, data_format='binary', log_stats=True)
+    _run(dl, clock, 10000)
+    data = out.getvalue()
+    size = dl._packer.size
+    assert len(data) == 2 * size
+    recs = [binlog.unpack_record(binlog.VERSION_STATS, data[i:i + size]) for i in (0, size)]
+    assert [r[5] >> binlog.STATUS_SENSOR_SHIFT for r in recs] == [1, 2]
+    assert [r[1:4] for r in recs] == [(2150, 25939200, 46080), (1990, 25913600, 51200)]
+    assert binlog.format_text(recs[1]).endswith(", sensor=2")
@@ -0,0 +1,52 @@
+import profiling
+from test_scheduler import FakeClock
+
+
+def test_buckets_and_summary():
+    pt = profiling.PhaseTimer(phases=('a', 'b'), buckets=8)
+    for dt in (0, 1, 2, 3, 100, 1000):
+        pt.record(0, dt)
+    assert list(pt.hist[:8]) == [1, 1, 2, 0, 0, 0, 0, 2]   # 100 and 1000 in the catch-all
+    assert pt.count[0] == 6 and pt.max[0] == 1000
+    assert pt.percentile(0, 50) == 3
+    assert pt.percentile(0, 100) == 1000
+    assert pt.count[1] == 0
+    lines = list(pt.summary())
+    assert len(lines) == 1 and lines[0].startswith("a: n=6 mean=184us")
+
+    pt.reset()
+    assert sum(pt.hist) == 0 and sum(pt.count) == 0
+
+
+def test_laps_go_in_the_right_buckets():
+    clock = FakeClock()
+    pt = profiling.PhaseTimer(clock=clock)
+    expected = {}
+    for dt, b in ((0, 0), (1, 1), (2, 2), (3, 2), (4, 3), (7, 3), (1023, 10), (1024, 11), \
+            (1 << 22, 23), (1 << 25, 23)):
+        t0 = pt.start()
+        clock.t += dt
+        pt.lap(profiling.WRITE, t0)
+        expected[b] = expected.get(b, 0) + 1
+    base = profiling.WRITE * pt.buckets
+    assert {b: n for b, n in enumerate(pt.hist[base:base + pt.buckets]) if n} == expected
+    assert pt.max[profiling.WRITE] == 1 << 25
+    assert pt.count[profiling.ATMOS] == 0
+
+
+def test_alloc_mode(monkeypatch):
+    clock = FakeClock()
+    heap = [1000]
+    monkeypatch.setattr(profiling, 'mem_alloc', lambda: heap[0])
+    pt = profiling.PhaseTimer(phases=('read', 'format'), alloc=True, clock=clock)
+    for used in ((0, 48), (16, 48), (0, -700)):     # The last one sees a collection
+        t0 = pt.start()
+        heap[0] += used[0]
+        t0 = pt.lap(0, t0)
+        heap[0] += used[1]
+        pt.lap(1, t0)
+    assert list(pt.alloc_total) == [16, 96] and list(pt.alloc_max) == [16, 48]
+    assert list(pt.collections) == [0, 1]
+    lines = list(pt.summary())
+    assert lines[0].endswith(" alloc mean=5B max=16B gc=0")
+    assert lines[1].endswith(" alloc mean=48B max=48B gc=1")
@@ -0,0 +1,41 @@
+import time
+import recfmt
+
+
+def _format_time(t):
+    return "{0:4d}-{1:02d}-{2:02d} {3:02d}:{4:02d}:{5:02d}".format(*time.localtime(t))
+
+
+def test_timestamp_matches_format_time():
+    stamp = recfmt.TimeStamp()
+    # Across minute, hour, day and year boundaries, with repeats and gaps.
+    t0 = int(time.mktime((2023, 12, 31, 23, 58, 30, 0, 0, -1)))
+    for dt in list(range(0, 200)) + [199, 199, 500, 86400, 86461, 86461, 86400]:
+        assert stamp.update(t0 + dt).decode() == _format_time(t0 + dt)
+
+
+def test_put_timestamp():
+    stamp = recfmt.TimeStamp()
+    buf = bytearray(24)
+    t = int(time.mktime((2024, 2, 29, 7, 5, 9, 0, 0, -1)))
+    assert stamp.put(buf, 2, t) == 2 + recfmt.TimeStamp.SIZE
+    assert bytes(buf[2:21]) == b'2024-02-29 07:05:09'
+
+
+def test_put_fixed_matches_format():
+    buf = bytearray(24)
+    cases = (
+        (2150, 100, 1, 4, 0x30, "21.5"),
+        (-450, 100, 1, 4, 0x30, "-4.5"),
+        (512, 100, 1, 6, 0x30, "0005.1"),
+        (-5, 100, 1, 5, 0x30, "-00.1"),
+        (101325 * 256, 25600, 0, 4, 0x20, "1013"),
+        (101325 * 256, 25600, 2, 0, 0x20, "1013.25"),
+        (2027, 2, 1, 0, 0x20, "1013.5"),
+        (-4, 100, 1, 5, 0x20, "  0.0"),
+        (46080, 1024, 1, 0, 0x20, "45.0"),
+        (7, 3, 3, 8, 0x20, "   2.333"),
+    )
+    for num, den, places, width, fill, text in cases:
+        end = recfmt.put_fixed(buf, 1, num, den, places, width, fill)
+        assert bytes(buf[1:end]).decode() == text
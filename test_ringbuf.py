@@ -0,0 +1,90 @@
+import struct
+import threading
+import time
+import ringbuf
+
+
+def test_put_get_and_wrap():
+    rb = ringbuf.RingBuffer(4, 8)
+    out = bytearray(8)
+    for i in range(10):
+        assert rb.put(bytes([i]) * (i % 8 + 1))
+        assert rb.count() == 1
+        n = rb.get_into(out)
+        assert bytes(out[:n]) == bytes([i]) * (i % 8 + 1)
+    assert rb.count() == 0
+    assert rb.get_into(out) == 0
+    assert rb.peek() is None
+
+
+def test_full_buffer_drops_and_counts():
+    rb = ringbuf.RingBuffer(4, 4)
+    assert [rb.put(b'abcd') for i in range(5)] == [True, True, True, False, False]
+    assert rb.dropped == 2
+    assert rb.high_water == rb.capacity() == 3
+    rb.release()
+    assert rb.put(b'efgh')
+    assert rb.count() == 3
+
+
+def test_oversize_record_rejected():
+    rb = ringbuf.RingBuffer(4, 4)
+    try:
+        rb.put(b'12345')
+    except ValueError:
+        pass
+    else:
+        assert False, "expected ValueError"
+
+
+def _producer_consumer(lock):
+    rb = ringbuf.RingBuffer(16, 8, lock=lock)
+    total = 5000
+    received = []
+
+    def producer():
+        seq = 0
+        while seq < total:
+            if rb.put(struct.pack('<II', seq, seq ^ 0x5A5A5A5A)):
+                seq += 1
+            else:
+                time.sleep(0)
+
+    def consumer():
+        while len(received) < total:
+            rec = rb.peek()
+            if rec is None:
+                time.sleep(0)
+                continue
+            seq, check = struct.unpack('<II', rec)
+            assert check == seq ^ 0x5A5A5A5A
+            received.append(seq)
+            rb.release()
+
+    threads = [threading.Thread(target=producer), threading.Thread(target=consumer)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+    assert received == list(range(total))
+    assert rb.high_water <= rb.capacity()
+
+
+def test_threads_lock_free():
+    _producer_consumer(None)
+
+
+def test_threads_with_lock():
+    _producer_consumer(threading.Lock())
+
+
+def test_tags_stay_with_their_records():
+    rb = ringbuf.RingBuffer(3, 4)
+    out = bytearray(4)
+    for i in range(0, 8, 2):
+        rb.put(b'r%d' % i, 1700000000 + i)
+        rb.put(b'r%d' % (i + 1), 1700000000 + i + 1)
+        for j in (i, i + 1):
+            assert rb.peek_tag() == 1700000000 + j
+            rb.get_into(out)
+            assert bytes(out[:2]) == b'r%d' % j
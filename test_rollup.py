@@ -0,0 +1,31 @@
+import rollup
+import stats
+
+
+def _dist(*samples):
+    rs = stats.IntStats()
+    for x in samples:
+        rs.add(x)
+    return rs
+
+
+def test_hourly_lines_close_on_the_hour():
+    r = rollup.Rollup(rollup.HOUR)
+    t0 = 1700000000 - 1700000000 % 3600       # 2023-11-14 22:00:00 UTC
+    assert r.add(t0 + 10, 2100, 101300 * 256, 40 * 1024, _dist(1000, 1010)) is None
+    assert r.add(t0 + 1200, 2200, 101325 * 256, 50 * 1024, _dist()) is None
+    assert r.add(t0 + 3599, None, None, None, _dist(990)) is None
+    line = r.add(t0 + 3600, 2000, 101000 * 256, 45 * 1024, None)
+    assert line == "2023-11-14 22:00:00,2,21.00,21.50,22.00,2,1013.00,1013.13,1013.25," \
+        "2,40.0,45.0,50.0,3,990,1000.0,1010"
+    assert len(line.split(',')) == len(rollup.HEADER.split(','))
+    assert r.close() == "2023-11-14 23:00:00,1,20.00,20.00,20.00,1,1010.00,1010.00,1010.00," \
+        "1,45.0,45.0,45.0,0,,,"
+
+
+def test_gap_of_several_periods():
+    r = rollup.Rollup(rollup.DAY)
+    r.add(0, 1000, 0, 0)
+    line = r.add(3 * rollup.DAY + 5, 1000, 0, 0)
+    assert line.startswith("1970-01-01 00:00:00,1,")
+    assert r.start == 3 * rollup.DAY
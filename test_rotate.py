@@ -0,0 +1,125 @@
+import os
+import time
+import rotate
+
+
+class FakeFs():
+    '''os, with the free space set by the test.'''
+    def __init__(self, free):
+        self.free = free
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def remove(self, path):
+        st = os.stat(path)
+        os.remove(path)
+        self.free += st[6]
+
+    def statvfs(self, path):
+        return (512, 512, 1000, self.free // 512, self.free // 512)
+
+
+def _t(*ymdhms):
+    return int(time.mktime(ymdhms + (0, 0, -1)))
+
+
+def _touch(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def test_rotates_at_midnight(tmp_path):
+    d = str(tmp_path)
+    files = rotate.DataFiles(d)
+    path, size = files.next_file(_t(2024, 3, 1, 23, 59, 0))
+    assert path == d + '/data_2024-03-01.txt' and size == 0
+    assert not files.due(_t(2024, 3, 1, 23, 59, 59), 10 ** 9)
+    assert files.due(_t(2024, 3, 2, 0, 0, 0))
+    path, size = files.next_file(_t(2024, 3, 2, 0, 0, 5))
+    assert path == d + '/data_2024-03-02.txt'
+    assert files.rotations == 1
+
+
+def test_size_cap_moves_to_next_file(tmp_path):
+    d = str(tmp_path)
+    _touch(d + '/data_2024-03-01.txt', 100)
+    _touch(d + '/data_2024-03-01-1.txt', 40)
+    files = rotate.DataFiles(d, max_bytes=100)
+    t = _t(2024, 3, 1, 12, 0, 0)
+    # Today's first file is full, so the second is appended to.
+    assert files.next_file(t) == (d + '/data_2024-03-01-1.txt', 40)
+    assert not files.due(t, 59)
+    assert files.due(t, 60)
+    assert files.next_file(t) == (d + '/data_2024-03-01-2.txt', 0)
+
+
+def test_prune_keeps_newest(tmp_path):
+    d = str(tmp_path)
+    for name in ('data_2024-02-28.txt', 'data_2024-02-29-2.txt', 'data_2024-02-29-10.txt',
+                 'data_2024-02-29.txt', 'data_2024-03-01.bin', 'notes.txt'):
+        _touch(d + '/' + name, 10)
+    files = rotate.DataFiles(d, keep=3)
+    files.next_file(_t(2024, 3, 1, 0, 0, 0))
+    assert [os.path.basename(p) for p in files.files()] == \
+        ['data_2024-02-28.txt', 'data_2024-02-29.txt', 'data_2024-02-29-2.txt',
+         'data_2024-02-29-10.txt']
+    assert files.prune() == 2
+    # Two newest old files plus the current one, which doesn't exist yet.
+    assert sorted(os.listdir(d)) == ['data_2024-02-29-10.txt', 'data_2024-02-29-2.txt',
+                                     'data_2024-03-01.bin', 'notes.txt']
+
+
+def test_prune_for_free_space(tmp_path):
+    d = str(tmp_path)
+    for day in range(1, 6):
+        _touch(d + '/data_2024-03-0{0}.txt'.format(day), 1024)
+    fs = FakeFs(free=1024)
+    files = rotate.DataFiles(d, min_free=3000, fs=fs)
+    files.next_file(_t(2024, 3, 5, 8, 0, 0))
+    assert files.prune() == 2
+    assert fs.free >= 3000
+    assert sorted(os.listdir(d))[0] == 'data_2024-03-03.txt'
+    # Never deletes the current file.
+    fs.free = 0
+    assert files.prune() == 2
+    assert os.listdir(d) == ['data_2024-03-05.txt']
+
+
+def test_accept_skips_files_that_cannot_be_appended_to(tmp_path):
+    d = str(tmp_path)
+    _touch(d + '/data_2024-03-01.bin', 30)
+    _touch(d + '/data_2024-03-01-1.bin', 20)
+    files = rotate.DataFiles(d, '.bin')
+    seen = []
+
+    def accept(path, size):
+        seen.append(os.path.basename(path))
+        return size < 25
+
+    t = _t(2024, 3, 1, 12, 0, 0)
+    assert files.next_file(t, accept) == (d + '/data_2024-03-01-1.bin', 20)
+    assert seen == ['data_2024-03-01.bin', 'data_2024-03-01-1.bin']
+    assert files.next_file(t, lambda path, size: False) == (d + '/data_2024-03-01-2.bin', 0)
+
+
+def test_prune_deletes_companions_with_the_last_file_of_their_day(tmp_path):
+    d = str(tmp_path)
+    for name in ('data_2024-03-01.txt', 'data_2024-03-02.txt', 'data_2024-03-02-1.txt', \
+            'data_2024-03-03.txt', 'burst_2024-03-01.bin', 'burst_2024-03-02.bin', \
+            'burst_2024-03-03.bin'):
+        _touch(d + '/' + name, 10)
+    files = rotate.DataFiles(d, keep=2, companions=(('burst_', '.bin'),))
+    files.next_file(_t(2024, 3, 3, 0, 0, 0))
+    assert files.prune() == 2
+    # 2024-03-02 still has a data file, so its bursts are kept.
+    assert sorted(os.listdir(d)) == ['burst_2024-03-02.bin', 'burst_2024-03-03.bin', \
+        'data_2024-03-02-1.txt', 'data_2024-03-03.txt']
+    fs = FakeFs(free=0)
+    files = rotate.DataFiles(d, min_free=1, companions=(('burst_', '.bin'),), fs=fs)
+    files.next_file(_t(2024, 3, 3, 0, 0, 0))
+    assert files.prune() == 1
+    assert sorted(os.listdir(d)) == ['burst_2024-03-03.bin', 'data_2024-03-03.txt']
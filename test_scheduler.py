@@ -0,0 +1,149 @@
+import scheduler
+
+
+class FakeClock():
+    '''A ticks clock that only moves when slept on or told to.'''
+    def __init__(self, start=0):
+        self.t = start
+        self.sleeps = []
+
+    def ticks_ms(self):
+        return self.t & ((1 << 30) - 1)
+
+    ticks_us = ticks_ms
+
+    def ticks_add(self, ticks, delta):
+        return (ticks + delta) & ((1 << 30) - 1)
+
+    def ticks_diff(self, ticks1, ticks2):
+        half = 1 << 29
+        return ((ticks1 - ticks2 + half) & ((1 << 30) - 1)) - half
+
+    def sleep_ms(self, t):
+        self.sleeps.append(t)
+        self.t += t
+
+    sleep_us = sleep_ms
+
+
+def test_work_time_does_not_cause_drift():
+    clock = FakeClock()
+    timer = scheduler.Periodic(2000, clock=clock)
+    starts = []
+    for work in (0, 150, 700, 30, 1999, 10):
+        timer.wait()
+        starts.append(clock.t)
+        clock.t += work
+    assert starts == [0, 2000, 4000, 6000, 8000, 10000]
+    assert timer.overruns == 0
+    assert timer.missed == 0
+
+
+def test_phase_offset():
+    clock = FakeClock(start=500)
+    timer = scheduler.Periodic(100, phase=30, clock=clock)
+    timer.wait()
+    assert clock.t == 530
+    timer.wait()
+    assert clock.t == 630
+
+
+def test_overrun_and_missed_slots():
+    clock = FakeClock()
+    timer = scheduler.Periodic(1000, clock=clock)
+    timer.wait()
+    clock.t += 1200         # late, but still within the next slot
+    assert timer.wait() == 0
+    assert clock.t == 1200
+    assert timer.overruns == 1 and timer.missed == 0
+    timer.wait()            # back on the grid
+    assert clock.t == 2000
+
+    clock.t += 3500         # runs over three deadlines
+    assert timer.wait() == 2
+    assert timer.overruns == 2 and timer.missed == 2
+    assert timer.max_late == 2500
+    timer.wait()
+    assert clock.t == 6000
+
+
+def test_ticks_wrap_around():
+    clock = FakeClock(start=(1 << 30) - 300)
+    timer = scheduler.Periodic(200, clock=clock)
+    timer.wait()
+    timer.wait()
+    timer.wait()
+    assert clock.t == (1 << 30) + 100
+    assert timer.overruns == 0
+
+
+def test_us_resolution():
+    clock = FakeClock()
+    timer = scheduler.Periodic(250, us=True, clock=clock)
+    timer.wait()
+    clock.t += 100
+    timer.wait()
+    assert clock.sleeps == [0, 150]
+
+
+def test_task_table_sleeps_until_next_task():
+    clock = FakeClock()
+    table = scheduler.TaskTable(clock=clock)
+    runs = []
+    table.add('fast', 100, lambda: runs.append(('fast', clock.t)))
+    table.add('slow', 250, lambda: runs.append(('slow', clock.t)), phase=50)
+    for i in range(6):
+        table.run_once()
+    assert runs == [('fast', 0), ('slow', 50), ('fast', 100), ('fast', 200),
+                    ('fast', 300), ('slow', 300), ('fast', 400)]
+    # Only wakes when something is due
+    assert clock.sleeps == [50, 50, 100, 100, 100]
+
+
+def test_task_table_same_deadline_runs_in_order():
+    clock = FakeClock()
+    table = scheduler.TaskTable(clock=clock)
+    runs = []
+    table.add('dist', 2000, lambda: runs.append('dist'))
+    table.add('atmos', 20000, lambda: runs.append('atmos'))
+    table.run_once()
+    assert runs == ['dist', 'atmos']
+    for i in range(9):
+        table.run_once()
+    assert runs.count('atmos') == 1
+    table.run_once()
+    assert runs[-2:] == ['dist', 'atmos']
+    assert clock.t == 20000
+
+
+def test_task_table_missed_slots():
+    clock = FakeClock()
+    table = scheduler.TaskTable(clock=clock)
+
+    def slow():
+        clock.t += 350
+
+    table.add('slow', 1000, slow)
+    fast = table.add('fast', 100, lambda: None)
+    table.run_once()        # both due at 0, slow takes 350 ms
+    assert table.run_once() == 2   # 100 and 200 missed, runs late in the 300 slot
+    assert fast.missed == 2
+    assert fast.deadline == 400
+
+
+def test_set_period_from_callback():
+    clock = FakeClock()
+    table = scheduler.TaskTable(clock=clock)
+    starts = []
+
+    def cb():
+        starts.append(clock.t)
+        if len(starts) == 2:
+            task.set_period(500)
+        elif len(starts) == 4:
+            task.set_period(4000)
+
+    task = table.add('a', 1000, cb)
+    for i in range(6):
+        table.run_once()
+    assert starts == [0, 1000, 1500, 2000, 6000, 10000]
@@ -0,0 +1,48 @@
+import math
+import statistics
+import stats
+
+
+def test_int_stats_match_batch():
+    samples = [1203, 1198, 1210, 1187, 1250, 1201, 1199]
+    s = stats.IntStats()
+    for x in samples:
+        s.add(x)
+    assert s.count == len(samples)
+    assert s.min == 1187 and s.max == 1250
+    assert s.total() == sum(samples)
+    assert s.mean_round() == math.floor(statistics.mean(samples) + 0.5)
+    assert s.std_scaled(10) == round(statistics.stdev(samples) * 10)
+    s.reset()
+    assert s.count == 0 and s.min is None
+    s.add(42)
+    assert s.mean_round() == 42 and s.std_scaled(10) == 0
+
+
+def test_int_stats_merge():
+    a_samples = [25939200 + d for d in (0, 37, -512, 1024, 3, 3, -77)]
+    b_samples = [25900000, 25900100]
+    a = stats.IntStats()
+    b = stats.IntStats()
+    for x in a_samples:
+        a.add(x)
+    for x in b_samples:
+        b.add(x)
+    a.merge(b)
+    a.merge(stats.IntStats())
+    both = a_samples + b_samples
+    assert a.count == len(both) and (a.min, a.max) == (min(both), max(both))
+    assert a.total() == sum(both)
+    assert a.mean_round() == math.floor(statistics.mean(both) + 0.5)
+    assert a.std_scaled(10) == round(statistics.stdev(both) * 10)
+    empty = stats.IntStats()
+    empty.merge(b)
+    assert empty.count == 2 and empty.mean_round() == 25900050 and empty.min == 25900000
+    assert stats.isqrt(10 ** 30) == 10 ** 15 and stats.isqrt(99) == 9
+
+
+def test_int_stats_empty_and_single():
+    s = stats.IntStats()
+    assert s.mean_round() == 0 and s.std_scaled(10) == 0
+    s.add(-7)
+    assert s.mean_round() == -7 and s.std_scaled(10) == 0
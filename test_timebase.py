@@ -0,0 +1,73 @@
+import timebase
+from test_scheduler import FakeClock
+
+
+class FakeRtc():
+    '''Whole seconds of a clock that runs ppm fast of the ticks clock.'''
+    def __init__(self, clock, start, ppm=0):
+        self.clock = clock
+        self.start = start
+        self.ppm = ppm
+
+    def __call__(self):
+        us = self.clock.elapsed * (1000000 + self.ppm) // 1000000
+        return self.start + us // 1000000
+
+
+class UsClock(FakeClock):
+    '''FakeClock in us, keeping the unwrapped time.'''
+    def __init__(self, start=0):
+        super().__init__(start)
+        self.elapsed = 0
+
+    def advance(self, us):
+        self.t += us
+        self.elapsed += us
+
+
+def test_stamps_carry_on_past_the_ticks_wrap():
+    clock = UsClock(start=(1 << 30) - 1000)
+    tb = timebase.Timebase(clock=clock, wall=FakeRtc(clock, 1000))
+    for i in range(10):
+        clock.advance(300000000)
+        tb.mono_us()
+    assert tb.mono_us() == 3000000000
+
+
+def _run(tb, clock, seconds):
+    '''Run poll() as a task would for a number of seconds, with a little
+       lateness each time. Returns the steps it reported.'''
+    steps = []
+    end = clock.elapsed + seconds * 1000000
+    while clock.elapsed < end:
+        clock.advance(tb.period * 1000 + 137)
+        step = tb.poll()
+        if step:
+            steps.append(step)
+    return steps
+
+
+def test_fit_gives_subsecond_times_and_drift():
+    clock = UsClock()
+    rtc = FakeRtc(clock, 1000, ppm=50)
+    tb = timebase.Timebase(interval=300, points=32, min_span=3600, clock=clock, wall=rtc)
+    assert _run(tb, clock, 3 * 3600) == []
+    assert abs(tb.drift_ppb - 50000) < 5000
+    clock.advance(250000)
+    true_us = 1000 * 1000000 + clock.elapsed * 1000050 // 1000000
+    assert abs(tb.now_us() - true_us) < 30000
+    assert abs(tb.now_ms() - true_us // 1000) < 30
+
+
+def test_rtc_step_rebases_without_going_backwards():
+    clock = UsClock()
+    rtc = FakeRtc(clock, 5000)
+    tb = timebase.Timebase(interval=60, clock=clock, wall=rtc)
+    _run(tb, clock, 120)
+    before = tb.now_us()
+    rtc.start -= 300
+    assert _run(tb, clock, 61) == [-300] and tb.steps == 1
+    assert tb.now_us() == before
+    rtc.start += 600
+    assert _run(tb, clock, 61) == [600]
+    assert tb.now() == rtc()
@@ -0,0 +1,73 @@
+import io
+import time
+import binlog
+import recfmt
+import timeindex
+
+
+class KeepOpen(io.BytesIO):
+    def close(self):
+        pass
+
+
+def _write_text_log(n, t0, step):
+    '''A text data log of n records step seconds apart, with its index.'''
+    data = bytearray()
+    idx_f = KeepOpen()
+    idx = timeindex.IndexWriter(idx_f, True, 1970)
+    rec = recfmt.TextRecord()
+    buf = bytearray(recfmt.MAX_LINE)
+    for i in range(n):
+        t = t0 + i * step
+        idx.add(t, len(data))
+        end = rec.render(buf, 0, t, 2000 + i, 101300 * 256, 45 * 1024, True, i)
+        data += buf[:end]
+    idx.close()
+    return bytes(data), idx_f.getvalue()
+
+
+def test_index_has_one_entry_per_interval():
+    data, idx = _write_text_log(90, 1700000000, 20)     # 30 minutes
+    n = (len(idx) - timeindex.HEADER_SIZE) // timeindex.ENTRY_SIZE
+    assert n == 30 or n == 31
+
+
+def test_text_range_reads_only_the_range():
+    t0 = 1700000000
+    data, idx = _write_text_log(3 * 180, t0, 20)        # 3 hours
+    first = t0 + 3600
+    last = t0 + 5400
+    idx_f = io.BytesIO(idx)
+    timeindex.read_header(idx_f)
+    start, end = timeindex.span(idx_f, first, last, len(idx))
+    assert 0 < start and end < len(data)
+    # No more than an index interval either side of the range.
+    line_len = len(data) // 540
+    assert end - start <= ((last - first + 2 * 60) // 20 + 1) * line_len
+    stamp = recfmt.TimeStamp()
+    lo = bytes(stamp.update(first))
+    hi = bytes(stamp.update(last))
+    lines = list(timeindex.text_lines(io.BytesIO(data), start, end, lo, hi))
+    expected = [l + b'\n' for l in data.split(b'\n') if lo <= l[:19] <= hi]
+    assert lines == expected and len(lines) == 91
+
+
+def test_extract_binary(tmp_path):
+    day = time.gmtime(1700000000)
+    name = 'data_{0:4d}-{1:02d}-{2:02d}.bin'.format(*day)
+    path = str(tmp_path / name)
+    t0 = 1700000000 - (day[3] * 3600 + day[4] * 60 + day[5])   # Midnight
+    packer = binlog.RecordPacker()
+    with open(path, 'wb') as f, open(timeindex.index_path(path), 'wb') as idx_f:
+        f.write(binlog.header(1970))
+        idx = timeindex.IndexWriter(idx_f, True, 1970, interval=3600)
+        for i in range(24 * 6):
+            t = t0 + i * 600
+            idx.add(t, f.tell())
+            f.write(packer.pack(t, 2000 + i, 101300 * 256, 45 * 1024, 100 + i))
+        idx.flush()
+    out = io.StringIO()
+    assert timeindex.extract(path, '14:00', '15:00', out) == 7
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith('{0:4d}-{1:02d}-{2:02d} 14:00:00.000|'.format(*day))
+    assert lines[-1].startswith('{0:4d}-{1:02d}-{2:02d} 15:00:00.000|'.format(*day))
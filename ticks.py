@@ -0,0 +1,39 @@
+# Tick counter helpers.
+# On MicroPython these are just the native time.ticks_* functions. On CPython
+# they are emulated (with the same 2**30 wrap-around) so that the logger
+# modules can be run and tested on a host.
+
+import time
+
+try:
+    ticks_ms = time.ticks_ms
+    ticks_us = time.ticks_us
+    ticks_add = time.ticks_add
+    ticks_diff = time.ticks_diff
+    sleep_ms = time.sleep_ms
+    sleep_us = time.sleep_us
+
+except AttributeError:
+    _TICKS_PERIOD = 1 << 30
+    _TICKS_MAX = _TICKS_PERIOD - 1
+    _TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+    def ticks_ms():
+        return (time.monotonic_ns() // 1000000) & _TICKS_MAX
+
+    def ticks_us():
+        return (time.monotonic_ns() // 1000) & _TICKS_MAX
+
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & _TICKS_MAX
+
+    def ticks_diff(ticks1, ticks2):
+        return ((ticks1 - ticks2 + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+    def sleep_ms(t):
+        if t > 0:
+            time.sleep(t / 1000)
+
+    def sleep_us(t):
+        if t > 0:
+            time.sleep(t / 1000000)
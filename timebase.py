@@ -0,0 +1,162 @@
+# Monotonic sample timestamps mapped to wall-clock time.
+#
+# The RTC only has one second resolution, and it can be stepped (e.g. when it
+# is set from a PC), so stamping samples with time.time() loses the real time
+# of each sample and can put records out of order. A Timebase instead stamps
+# samples with a monotonic microsecond count, built up from ticks_us so that
+# it carries on past the ticks wrap-around, and turns that into wall-clock
+# time with a straight-line fit of offset and drift:
+#     wall_us = mono + offset_us + (mono - base) * drift_ppb / 10**9
+#
+# poll() is run as a task. Every interval seconds it times the next tick of
+# the RTC's seconds, by reading it every fine_ms until it changes, and
+# re-fits the line by least squares over the last `points` of those ticks.
+# It sets self.period to when it next wants to run. Drift is only fitted once
+# the ticks span min_span seconds; until then the last drift is kept. A tick
+# more than max_step seconds away from the line means the RTC has been set:
+# the fit is started again from that tick and the step is counted.
+#
+# A stamp must be taken (or poll() run) at least every 8 minutes or so, as
+# ticks_us wraps after 2**30 us. Stamps from now_us() never go backwards: if
+# the RTC is set back they stay put until it catches up.
+#
+# The logger stamps records with now_ms(), split into whole seconds and ms,
+# so that records and bursts keep the sub-second time of the sample.
+#
+# The monotonic and wall-clock us values (and ms since the epoch) are past
+# MicroPython's small int range of 2**30, so on the Pico they are long ints
+# and each stamp allocates a few of them.
+
+import time
+import ticks
+
+_US = 1000000
+
+
+class Timebase():
+    def __init__(self, interval=300, fine_ms=50, points=16, min_span=3600, max_step=2, \
+            clock=ticks, wall=time.time):
+        self.interval = interval
+        self.fine_ms = fine_ms
+        self.points = points
+        self.min_span = min_span
+        self.max_step = max_step
+        self._clock = clock
+        self._wall = wall
+        self._ticks = clock.ticks_us()
+        self._mono = 0          # us since start
+        self._obs_mono = []     # Monotonic us of each RTC tick...
+        self._obs_wall = []     # ... and its wall-clock us
+        self.base = 0           # Monotonic us that offset_us applies at
+        self.offset_us = 0
+        self.drift_ppb = 0
+        self.steps = 0
+        self._last_us = 0       # Last stamp returned by now_us()
+
+        # Start from a plain reading, taken as the middle of its second,
+        # until the first tick has been timed.
+        m = self.mono_us()
+        self._add(m, int(wall()) * _US + _US // 2)
+        self._coarse = True
+        self._t_obs = m         # When the last tick was timed
+        self._hunt = None       # RTC seconds at the last poll while looking for a tick
+        self._t_hunt = 0
+        self.period = fine_ms   # ms until poll() next wants to run
+
+    def mono_us(self):
+        '''The monotonic count in us.'''
+        now = self._clock.ticks_us()
+        self._mono += self._clock.ticks_diff(now, self._ticks)
+        self._ticks = now
+        return self._mono
+
+    def wall_us(self, mono):
+        '''Wall-clock time in us (since the epoch) of a monotonic stamp.'''
+        d = mono - self.base
+        return mono + self.offset_us + d * self.drift_ppb // 1000000000
+
+    def now_us(self):
+        '''Wall-clock time now, in us. Never less than the last one returned.'''
+        w = self.wall_us(self.mono_us())
+        if w < self._last_us:
+            w = self._last_us
+        self._last_us = w
+        return w
+
+    def now(self):
+        '''Wall-clock time now, in whole seconds.'''
+        return self.now_us() // _US
+
+    def now_ms(self):
+        '''Wall-clock time now, in ms since the epoch.'''
+        return self.now_us() // 1000
+
+    def poll(self):
+        '''Look for the next RTC tick if one is due to be timed. Returns the
+           size of the step in seconds if the RTC has been set, else 0.'''
+        m = self.mono_us()
+        if not self._coarse and self._hunt is None and m - self._t_obs < self.interval * _US:
+            self.period = (self.interval * _US - (m - self._t_obs)) // 1000 + 1
+            return 0
+        s = int(self._wall())
+        prev = self._hunt
+        if prev is None or s == prev or m - self._t_hunt > 2 * self.fine_ms * 1000:
+            # Not seen it change yet, or the last look was too long ago to
+            # say when it did.
+            self._hunt = s
+            self._t_hunt = m
+            self.period = self.fine_ms
+            return 0
+
+        # The RTC ticked between the last poll and this one.
+        t = (self._t_hunt + m) // 2
+        w = s * _US
+        step = 0
+        err = (w - self.wall_us(t) + _US // 2) // _US
+        if self._coarse:
+            self._coarse = False
+            self._obs_mono = []
+            self._obs_wall = []
+        elif err > self.max_step or -err > self.max_step:
+            step = err
+            self.steps += 1
+            self._obs_mono = []
+            self._obs_wall = []
+        self._add(t, w)
+        self._t_obs = m
+        self._hunt = None
+        self.period = self.interval * 1000
+        return step
+
+    def _add(self, m, w):
+        self._obs_mono.append(m)
+        self._obs_wall.append(w)
+        if len(self._obs_mono) > self.points:
+            self._obs_mono.pop(0)
+            self._obs_wall.pop(0)
+        self._fit()
+
+    def _fit(self):
+        # Least squares of y = wall - mono against x = mono - base, in ints
+        # as floats are only single precision on the Pico.
+        xs = self._obs_mono
+        ws = self._obs_wall
+        n = len(xs)
+        base = xs[0]
+        sx = sy = sxx = sxy = 0
+        for i in range(n):
+            x = xs[i] - base
+            y = ws[i] - xs[i]
+            sx += x
+            sy += y
+            sxx += x * x
+            sxy += x * y
+        den = n * sxx - sx * sx
+        if xs[-1] - base >= self.min_span * _US and den > 0:
+            self.drift_ppb = (n * sxy - sx * sy) * 1000000000 // den
+        self.base = base
+        self.offset_us = (sy - sx * self.drift_ppb // 1000000000) // n
+
+    def stats_str(self):
+        return "drift {0:.2f} ppm, {1} RTC step(s), {2} tick(s) in fit".format( \
+            self.drift_ppb / 1000, self.steps, len(self._obs_mono))
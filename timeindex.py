@@ -0,0 +1,248 @@
+# Sparse time index for the data files.
+#
+# Next to each data file (data_YYYY-MM-DD.txt or .bin) the logger writes
+# data_YYYY-MM-DD.idx, which holds the byte offset in the data file of the
+# first record written in each interval (a minute by default):
+#     header  magic 'PIDX', version, pad, epoch year, interval in s
+#     entries time (uint32, seconds since the epoch), offset (uint32)
+# Entries are only added for intervals that have records, in time order. The
+# time of an entry is when the record was written, which is never before the
+# record's own timestamp, so every record from time t on is at or after the
+# offset of the last entry at or before t.
+#
+# Reading a time range then takes a binary search of the index and reads of
+# just that part of the data file. The index is written behind like the data
+# log, so after a crash its last entries may be missing; a lookup then just
+# starts further back.
+#
+# IndexWriter runs on the Pico; span(), text_lines() and bin_records() work
+# on either. On the host:
+#     python timeindex.py data_2023-01-01.txt 14:00 15:00
+#     python timeindex.py --csv data_2023-01-01.bin "2023-01-01 14:00" 15:00
+
+import struct
+import logbuf
+
+MAGIC = b'PIDX'
+VERSION = 1
+HEADER_FMT = '<4sBxHH'
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+ENTRY_FMT = '<II'
+ENTRY_SIZE = struct.calcsize(ENTRY_FMT)
+
+_BUF_SIZE = 256     # bytes - 32 entries, so at most one SD write per ~30 minutes
+
+
+def index_path(data_path):
+    '''The index file for a data file.'''
+    return data_path[:data_path.rfind('.')] + '.idx'
+
+
+class IndexWriter():
+    def __init__(self, f, new_file, epoch_year, interval=60):
+        '''f is the index file opened for append; the header is written if
+           new_file. Entries are only written out when the buffer fills or
+           flush() is called.'''
+        self.interval = interval
+        self.next_t = 0
+        self._log = logbuf.WriteBehindLog(f, buf_size=_BUF_SIZE, max_age_ms=0)
+        if new_file:
+            self._log.write(struct.pack(HEADER_FMT, MAGIC, VERSION, epoch_year, interval))
+
+    def add(self, t, offset):
+        '''Note that the record being written at time t starts at offset.
+           Does nothing unless t is in a new interval.'''
+        if t < self.next_t:
+            return
+        self.next_t = (t // self.interval + 1) * self.interval
+        log = self._log
+        pos = log.reserve(ENTRY_SIZE)
+        struct.pack_into(ENTRY_FMT, log.buf, pos, t, offset)
+        log.commit(pos + ENTRY_SIZE)
+
+    def flush(self):
+        self._log.flush()
+
+    def close(self):
+        self._log.close()
+
+
+def read_header(f):
+    '''Returns (epoch_year, interval) and leaves f at the first entry.'''
+    data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise ValueError("File too short for an index header")
+    magic, version, epoch_year, interval = struct.unpack(HEADER_FMT, data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a data log index")
+    return epoch_year, interval
+
+
+def _entry(f, i):
+    f.seek(HEADER_SIZE + i * ENTRY_SIZE)
+    data = f.read(ENTRY_SIZE)
+    if len(data) < ENTRY_SIZE:
+        return None
+    return struct.unpack(ENTRY_FMT, data)
+
+
+def span(idx_f, t_start, t_end, idx_size):
+    '''Byte range (start, end) of the data file that holds every record from
+       t_start to t_end inclusive, found by binary search of the index.
+       end is None if the range runs to the end of the data file. idx_size is
+       the size of the index file. The range can include a few records either
+       side of the times asked for.'''
+    n = (idx_size - HEADER_SIZE) // ENTRY_SIZE
+    # Last entry at or before t_start.
+    lo = 0
+    hi = n
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if _entry(idx_f, mid)[0] <= t_start:
+            lo = mid + 1
+        else:
+            hi = mid
+    start = _entry(idx_f, lo - 1)[1] if lo > 0 else 0
+    # First entry after t_end: everything before its offset was written by then.
+    hi = n
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if _entry(idx_f, mid)[0] <= t_end:
+            lo = mid + 1
+        else:
+            hi = mid
+    end = _entry(idx_f, lo)[1] if lo < n else None
+    return start, end
+
+
+def _read_to(f, start, end):
+    f.seek(start)
+    if end is None:
+        return f
+    # Only as much of the file as the index says.
+    return _Limited(f, end - start)
+
+
+class _Limited():
+    def __init__(self, f, n):
+        self._f = f
+        self._left = n
+
+    def read(self, n):
+        if n > self._left:
+            n = self._left
+        data = self._f.read(n)
+        self._left -= len(data)
+        return data
+
+    def readline(self):
+        if self._left <= 0:
+            return b''
+        line = self._f.readline()
+        self._left -= len(line)
+        return line
+
+
+def text_lines(data_f, start, end, first, last):
+    '''Yields the lines (bytes) of a text data file between byte offsets
+       start and end whose timestamps are from first to last inclusive, both
+       as b'YYYY-MM-DD HH:MM:SS'. data_f must be opened in binary mode.'''
+    f = _read_to(data_f, start, end)
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        stamp = line[:19]
+        if stamp > last:
+            break
+        if stamp >= first:
+            yield line
+
+
+def bin_records(data_f, start, end, t_start, t_end):
+    '''Yields the raw records (bytes) of a binary data file between byte
+       offsets start and end with timestamps from t_start to t_end, skipping
+       journal records that fail their CRC.'''
+    import binlog
+    data_f.seek(0)
+    version = binlog.read_header(data_f)[0]
+    rec_size = binlog.record_size(version)
+    if start < binlog.HEADER_SIZE:
+        start = binlog.HEADER_SIZE
+    f = _read_to(data_f, start, end)
+    while True:
+        data = f.read(rec_size)
+        if len(data) < rec_size:
+            break
+        t = struct.unpack_from('<I', data)[0]
+        if t > t_end:
+            break
+        if t >= t_start and binlog.check_record(version, data):
+            yield data
+
+
+# ---- Host side ----
+
+def _parse_time(s, date):
+    ''''YYYY-MM-DD HH:MM[:SS]' or 'HH:MM[:SS]' on date -> time tuple.'''
+    parts = s.split()
+    if len(parts) == 2:
+        date = tuple(int(x) for x in parts[0].split('-'))
+    hms = [int(x) for x in parts[-1].split(':')] + [0]
+    return date + (hms[0], hms[1], hms[2])
+
+
+def extract(data_path, first, last, out_f, csv=False):
+    '''Write the records of data_path from first to last (strings as taken by
+       the command line tool) to out_f. Returns the number written.'''
+    import calendar
+    import os
+    import time
+    import binlog
+
+    name = os.path.basename(data_path)
+    date = tuple(int(x) for x in name[5:15].split('-'))
+    t_first = _parse_time(first, date)
+    t_last = _parse_time(last, date)
+
+    idx = index_path(data_path)
+    with open(idx, 'rb') as idx_f:
+        epoch_year, interval = read_header(idx_f)
+        offset = binlog.epoch_offset(epoch_year)
+        t0 = calendar.timegm(t_first) - offset
+        t1 = calendar.timegm(t_last) - offset
+        start, end = span(idx_f, t0, t1, os.path.getsize(idx))
+
+    n = 0
+    with open(data_path, 'rb') as data_f:
+        if data_path.endswith('.bin'):
+            version = binlog.read_header(data_f)[0]
+            if csv:
+                out_f.write(binlog.CSV_HEADER + '\n')
+            for data in bin_records(data_f, start, end, t0, t1):
+                rec = binlog.unpack_record(version, data)
+                out_f.write((binlog.format_csv if csv else binlog.format_text)(rec, offset) + '\n')
+                n += 1
+        else:
+            lo = time.strftime("%Y-%m-%d %H:%M:%S", t_first + (0, 0, 0)).encode()
+            hi = time.strftime("%Y-%m-%d %H:%M:%S", t_last + (0, 0, 0)).encode()
+            for line in text_lines(data_f, start, end, lo, hi):
+                out_f.write(line.decode())
+                n += 1
+    return n
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Print the records of a data log in a time range, using its index")
+    parser.add_argument('file', help="data log file (.txt or .bin) with its .idx alongside")
+    parser.add_argument('first', help="start time, 'HH:MM[:SS]' on the file's day or 'YYYY-MM-DD HH:MM[:SS]'")
+    parser.add_argument('last', help="end time, inclusive")
+    parser.add_argument('--csv', action='store_true', help="write CSV (binary logs only)")
+    args = parser.parse_args(argv)
+    extract(args.file, args.first, args.last, sys.stdout, args.csv)
+
+
+if __name__ == '__main__':
+    main()